@@ -0,0 +1,33 @@
+import os
+import statistics
+import sys
+from typing import Dict, List
+
+# Бенчмарки запускаются из корня репозитория: python -m bench.<имя>
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config.validate() выполняется при импорте - для замеров хватает фиктивных значений
+os.environ.setdefault('BOT_TOKEN', '123456:bench-token')
+os.environ.setdefault('DEEPSEEK_API_KEY', 'bench-key')
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p99/max выборки в миллисекундах"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {'p50': 0.0, 'p99': 0.0, 'max': 0.0}
+    return {
+        'p50': statistics.median(ordered) * 1000,
+        'p99': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+        'max': ordered[-1] * 1000,
+    }
+
+
+def report(name: str, samples: List[float], elapsed: float):
+    """Строка результата: пропускная способность и задержки"""
+    stats = percentiles(samples)
+    print(
+        f"{name:<28} {len(samples) / elapsed:>10.0f}/с   p50 {stats['p50']:7.2f} мс   "
+        f"p99 {stats['p99']:7.2f} мс   max {stats['max']:7.2f} мс"
+    )
@@ -0,0 +1,50 @@
+import random
+from typing import List
+
+# Сообщения, похожие на реальные обращения в поддержку: {order}, {phone}, {email} подставляются
+TEMPLATES = [
+    'Здравствуйте! Не пришли билеты на заказ {order}, что делать?',
+    'билеты не пришли на почту',
+    'Оплатил заказ {order} картой 20 минут назад, деньги списались, а статус ожидает оплаты',
+    'как купить билеты на спектакль в субботу?',
+    'хочу вернуть билет',
+    'Можно ли вернуть один билет из заказа {order}?',
+    'купил по ошибке не то мероприятие, заказ {order}',
+    'нужно изменить email, указал неправильный email {email}',
+    'двойное списание за один заказ {order}',
+    'чек не пришел на почту после оплаты',
+    '{order}',
+    'спасибо',
+    'да',
+    'нет спасибо',
+    'подскажите, во сколько начинается концерт?',
+    'а парковка у театра есть?',
+    'мой телефон {phone}, восстановите билеты пожалуйста',
+    'платеж не прошел, деньги вернулись на карту?',
+    'Добрый день. Подскажите, есть ли скидки для пенсионеров на вечерние спектакли в эти выходные?',
+    'письмо не дошло, проверял спам, заказ {order}',
+    'оплатил через приложение по qr коду, заказ {order}',
+    'где посмотреть расписание?',
+    'сменить почту для получения билетов',
+    'Частичный возврат возможен? не все билеты нужны',
+    'Как оформить заказ на сайте? Не понимаю, куда нажимать',
+    'а можно ли пройти с ребенком 5 лет',
+    'заказ {order} какой статус?',
+    'Я перепутал мероприятие, хочу поменять',
+    'Добрый вечер, у меня вопрос по программе фестиваля, будет ли второй день?',
+    'нет билетов в письме, только чек',
+]
+
+
+def make_corpus(size: int, seed: int = 42) -> List[str]:
+    """size сообщений из шаблонов со случайными номерами заказов, телефонами и адресами"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        template = rng.choice(TEMPLATES)
+        corpus.append(template.format(
+            order=rng.randint(100000, 999999),
+            phone=f"+7 9{rng.randint(10, 99)} {rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(10, 99)}",
+            email=f"user{rng.randint(1, 9999)}@mail.ru",
+        ))
+    return corpus
@@ -0,0 +1,90 @@
+"""Извлечение сущностей: отдельный поиск по каждому шаблону против одного прохода ENTITY_RE.
+
+Старый вариант - extract_entities до объединения шаблонов: email, телефон (с проверкой
+каждого кандидата), время и номер заказа ищутся четырьмя отдельными проходами по тексту.
+Новый - extract_entities с одним проходом объединенного шаблона. Способ оплаты в обоих
+вариантах берется из общего прохода словарей. Кэш по тексту отключен (замеряется
+сам разбор), кэш словарей сбрасывается перед каждым прогоном. Перед замером проверяется,
+что оба варианта извлекают одно и то же.
+
+    python -m bench.entity_extractor --messages 20000
+
+Замер (20000 сообщений, лучший из 5 прогонов, три запуска):
+    отдельные поиски   12.5-17.1 мкс на сообщение
+    один проход         6.1-7.2 мкс на сообщение (1.9-2.5x)
+Без опережающей проверки первого символа объединенный шаблон перебирает все альтернативы
+на каждой позиции и работает не быстрее отдельных поисков (0.8-1.1x).
+"""
+import argparse
+import re
+import time
+
+import bench.common  # noqa: F401 - окружение для config
+from bench.corpus import make_corpus
+from services.entity_extractor import Entities, extract_entities, is_valid_phone
+from services.lexicons import detect_payment_method, scan_lexicons
+
+ORDER_NUMBER_RE = re.compile(r'\b(\d{6})\b')
+EMAIL_RE = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b')
+PHONE_RE = re.compile(
+    r'(?<![\d+])\+?[78](?:[\s\-]?\(?\d{3}\)?[\s\-]?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}|\d{9})(?!\d)'
+)
+TIME_EXPRESSION_RE = re.compile(
+    r'\d{1,2}[.\-/]\d{1,2}[.\-/]\d{4}|\d{1,2}:\d{2}|\d+\s*(?:мин|час|дн|день|дня|дней)',
+    re.IGNORECASE
+)
+
+
+def legacy_extract(text: str) -> Entities:
+    """extract_entities до объединения шаблонов (без кэша)"""
+    email = EMAIL_RE.search(text)
+
+    phone = None
+    for match in PHONE_RE.finditer(text):
+        if is_valid_phone(match.group(0)):
+            phone = match.group(0)
+            break
+
+    time_expression = TIME_EXPRESSION_RE.search(text)
+    order_number = ORDER_NUMBER_RE.search(text)
+
+    return Entities(
+        order_number=order_number.group(1) if order_number else None,
+        phone=phone,
+        email=email.group(0) if email else None,
+        time_expression=time_expression.group(0) if time_expression else None,
+        payment_method=detect_payment_method(text),
+    )
+
+
+def measure(name: str, extract, corpus, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        scan_lexicons.cache_clear()
+        started = time.perf_counter()
+        for text in corpus:
+            extract(text)
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:<20} {len(corpus) / best:>10.0f} сообщ./с   {best / len(corpus) * 1e6:6.1f} мкс на сообщение")
+    return best
+
+
+def main(args):
+    corpus = make_corpus(args.messages)
+    single_pass = extract_entities.__wrapped__
+
+    mismatches = [text for text in corpus if legacy_extract(text) != single_pass(text)]
+    if mismatches:
+        raise SystemExit(f"Сущности расходятся на {len(mismatches)} сообщениях, например: {mismatches[0]!r}")
+
+    print(f"сообщений: {len(corpus)}, лучший из {args.repeat} прогонов")
+    legacy = measure('отдельные поиски', legacy_extract, corpus, args.repeat)
+    combined = measure('один проход', single_pass, corpus, args.repeat)
+    print(f"ускорение: {legacy / combined:.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    main(parser.parse_args())
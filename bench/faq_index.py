@@ -0,0 +1,71 @@
+"""Поиск по FAQ: задержка FaqIndex и объем справки, уходящей в DeepSeek.
+
+Индекс строится из FAQ_ENTRIES, сохраняется во временный файл и загружается обратно
+(как при старте бота). Затем каждое сообщение корпуса проходит путь обработчика:
+answer() и, если готового ответа нет, context(). Замеряется задержка одного вопроса
+и сравнивается размер справки с полным текстом всех ответов FAQ.
+
+    python -m bench.faq_index --messages 20000
+
+Замер (20000 сообщений, 37 формулировок, 8 ответов, одно ядро):
+    построение 18-25 мс, загрузка с диска 7-9 мс
+    answer() + context()   ~2700/с   p50 0.35 мс   p99 0.95 мс
+    один search()          в среднем 0.19 мс
+    готовый ответ: 14% сообщений; справка: 54%, в среднем 1.6 ответа и 0.4 тыс. символов
+    против 1.7 тыс. символов всего FAQ
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import bench.common  # noqa: F401 - окружение для config
+from bench.common import report
+from bench.corpus import make_corpus
+from config import config
+from services.faq_index import FAQ_ENTRIES, FaqIndex
+
+
+def main(args):
+    corpus = make_corpus(args.messages)
+    kwargs = dict(answer_threshold=config.FAQ_ANSWER_THRESHOLD, context_min_score=config.FAQ_CONTEXT_MIN_SCORE)
+    path = os.path.join(tempfile.mkdtemp(), 'faq_index.npz')
+
+    started = time.perf_counter()
+    FaqIndex.load_or_build(path, **kwargs)
+    built = time.perf_counter() - started
+    started = time.perf_counter()
+    index = FaqIndex.load_or_build(path, **kwargs)
+    loaded = time.perf_counter() - started
+    print(f"формулировок: {len(index.row_entries)}, ответов: {len(FAQ_ENTRIES)}; "
+          f"построение {built * 1000:.0f} мс, загрузка с диска {loaded * 1000:.0f} мс")
+
+    samples = []
+    answered = with_context = context_answers = context_chars = 0
+    started = time.perf_counter()
+    for text in corpus:
+        request_started = time.perf_counter()
+        if index.answer(text) is not None:
+            answered += 1
+        else:
+            reference = index.context(text, config.FAQ_CONTEXT_TOP_K)
+            if reference:
+                with_context += 1
+                context_answers += len(reference)
+                context_chars += sum(len(snippet) for snippet in reference)
+        samples.append(time.perf_counter() - request_started)
+    elapsed = time.perf_counter() - started
+
+    report('answer() + context()', samples, elapsed)
+    print(f"{'один search()':<28} в среднем {index.stats()['avg_latency_ms']:.2f} мс")
+    full_chars = sum(len(entry['answer']) for entry in FAQ_ENTRIES)
+    print(f"готовый ответ: {answered / len(corpus):.0%} сообщений; справка: {with_context / len(corpus):.0%}"
+          + (f", в среднем {context_answers / with_context:.1f} ответа, "
+             f"{context_chars / with_context / 1000:.1f} тыс. символов" if with_context else "")
+          + f" против {full_chars / 1000:.1f} тыс. символов всего FAQ")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    main(parser.parse_args())
@@ -0,0 +1,100 @@
+"""Локальный классификатор намерений: сколько обращений к DeepSeek он снимает и его задержка.
+
+Модель обучается на keyword_samples() (фразы таблицы намерений и OTHER_SAMPLES), как при
+запуске бота без истории переписки. Каждое сообщение корпуса проходит путь обработчика:
+IntentRouter, исправление опечаток, и только если правила ничего не нашли - predict().
+Доля уверенных предсказаний среди таких сообщений - обращения к DeepSeek, которых удалось
+избежать. Согласие с правилами считается на сообщениях, которые распознал маршрутизатор:
+предсказание сравнивается с его намерениями. Тексты, совпадающие с обучающими примерами
+(в том числе OTHER_SAMPLES), в оценку не входят.
+
+    python -m bench.intent_classifier --messages 20000
+
+Замер (20000 сообщений, одно ядро, два запуска):
+    обучение 2.3-2.5 с на 77 примерах
+    правила не распознали 23% сообщений; классификатор передал сценариям 0% из них
+    согласие с правилами: 61% при пороге 0.75, 89% при пороге 0.5; другой сценарий - 0%
+    predict() p50 0.14-0.17 мс, p99 0.39-0.42 мс
+Нераспознанные правилами сообщения корпуса - вопросы не по сценариям (концерт, парковка,
+скидки), и модель верно оставляет их DeepSeek; опечатки до нее не доходят - их раньше
+исправляет маршрутизатор. На одних фразах таблицы модель уверена только в текстах, близких
+к ключевым словам, которые правила и так находят; снимать обращения к DeepSeek она начинает
+после обучения на истории переписки (history_samples).
+"""
+import argparse
+import time
+from collections import Counter
+
+import bench.common  # noqa: F401 - окружение для config
+from bench.common import percentiles
+from bench.corpus import make_corpus
+from config import config
+from services.faq_index import FAQ_ENTRIES
+from services.intent_classifier import CLASSIFIED_INTENTS, IntentClassifier, keyword_samples
+from services.intent_router import IntentRouter
+from services.lexicons import LEXICONS
+from services.text_vectorizer import numpy_available
+from services.typo_index import text_words
+
+
+def main(args):
+    if not numpy_available():
+        raise SystemExit("Для классификатора нужен numpy")
+
+    samples = keyword_samples()
+    started = time.perf_counter()
+    model = IntentClassifier.train(samples, threshold=args.threshold)
+    trained = time.perf_counter() - started
+    training_texts = {text for text, _ in samples}
+
+    router = IntentRouter(known_words=text_words(
+        [phrase for phrases in LEXICONS.values() for phrase in phrases]
+        + [text for entry in FAQ_ENTRIES for text in (*entry['questions'], entry['answer'])]
+    ))
+    corpus = [text.lower() for text in make_corpus(args.messages)]
+    held_out = [text for text in corpus if text.strip(' ?!.') not in training_texts]
+
+    latencies = []
+    fallback = routed = 0
+    agreed = wrong = labelled = 0
+    routed_intents = Counter()
+    for text in held_out:
+        intents = router.match(text) or router.match_corrected(text)[0]
+        started = time.perf_counter()
+        prediction = model.predict(text)
+        latencies.append(time.perf_counter() - started)
+        predicted = prediction[0] if prediction else None
+
+        if not intents:
+            # Сюда бот доходит только без намерения от правил: без классификатора - DeepSeek
+            fallback += 1
+            if predicted is not None:
+                routed += 1
+                routed_intents[predicted] += 1
+            continue
+
+        expected = [intent for intent in intents if intent in CLASSIFIED_INTENTS]
+        if not expected:
+            continue
+        labelled += 1
+        if predicted in expected:
+            agreed += 1
+        elif predicted is not None:
+            wrong += 1
+
+    print(f"обучение {trained:.1f} с на {len(samples)} примерах; сообщений {len(corpus)}, "
+          f"вне обучающих примеров {len(held_out)}")
+    print(f"правила не распознали {fallback / len(held_out):.0%} сообщений; "
+          f"классификатор передал сценариям {routed / max(1, fallback):.0%} из них"
+          + (f" ({', '.join(f'{name} {count}' for name, count in routed_intents.most_common())})" if routed else ""))
+    print(f"согласие с правилами на распознанных ими сообщениях: {agreed / max(1, labelled):.0%}, "
+          f"другой сценарий: {wrong / max(1, labelled):.1%}")
+    stats = percentiles(latencies)
+    print(f"predict() p50 {stats['p50']:.2f} мс, p99 {stats['p99']:.2f} мс")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--threshold', type=float, default=config.INTENT_CLASSIFIER_THRESHOLD)
+    main(parser.parse_args())
@@ -0,0 +1,118 @@
+"""Пропускная способность определения намерения: каскад проверок против IntentRouter.
+
+Старый вариант - копия шагов 10-21 handle_all_messages до перехода на таблицу
+намерений: списки ключевых слов собираются заново на каждое сообщение, шаблоны
+ищутся некомпилированным re.search. Новый - IntentRouter.route() по той же таблице.
+Перед замером проверяется, что оба варианта выбирают одно и то же намерение.
+
+    python -m bench.intent_router --messages 20000
+
+Замер (20000 сообщений, лучший из 7 прогонов, три запуска):
+    каскад проверок   13-15 мкс на сообщение
+    IntentRouter      10-12 мкс на сообщение (1.1-1.6x)
+Прежний общий шаблон с lookahead на каждое намерение давал 21 мкс (0.6x).
+"""
+import argparse
+import re
+import time
+from typing import Optional
+
+import bench.common  # noqa: F401 - окружение для config
+from bench.corpus import make_corpus
+from services.intent_router import IntentRouter
+
+
+def legacy_route(text: str) -> Optional[str]:
+    """Каскад из handle_all_messages до таблицы намерений (без обращений к обработчикам)"""
+    message_text = text.lower()
+    farewell_words = ['нет', 'нет спасибо', 'не надо', 'всё', 'всего хорошего',
+                      'пока', 'до свидания', 'спасибо нет', 'не нужно', 'закончили']
+    if message_text in farewell_words:
+        return 'farewell'
+    positive_words = ['да', 'давай', 'конечно', 'хочу', 'нужно', 'помоги', 'помощь нужна']
+    if message_text in positive_words:
+        return 'positive'
+    purchase_patterns = [
+        'как купить', 'как приобрести', 'инструкция покупки', 'как оформить заказ',
+        'хочу купить', 'хочу приобрести', 'купить билет', 'приобрести билет',
+        'как заказать', 'как сделать заказ', 'как оплатить билет', 'процесс покупки',
+        'инструкция по покупке', 'как получить билет', 'как оформить билет'
+    ]
+    if any(phrase in message_text for phrase in purchase_patterns):
+        return 'purchase'
+    payment_keywords = ['оплат', 'платеж', 'деньги', 'карт', 'приложен', 'qr', 'чек', 'списались']
+    if any(keyword in message_text for keyword in payment_keywords):
+        return 'payment'
+    if any(phrase in message_text for phrase in ['возврат', 'вернуть', 'вернул']):
+        return 'refund'
+    if any(phrase in message_text for phrase in ['купил по ошибке', 'не то мероприятие', 'ошибочно купил',
+                                               'неправильно выбрал', 'перепутал мероприятие',
+                                               'другое мероприятие по ошибке']):
+        return 'wrong_event'
+    if any(phrase in message_text for phrase in ['вернуть один билет', 'только один билет', 'один из заказа',
+                                               'частичный возврат', 'не все билеты']):
+        return 'partial_refund'
+    if any(phrase in message_text for phrase in ['изменить email', 'поменять email', 'сменить почту',
+                                               'другой email', 'неправильный email']):
+        return 'email_change'
+    ticket_problem_patterns = [
+        r'не\s*пришли', r'не\s*пришёл', r'не\s*пришел', r'не\s*получил', r'не\s*получили',
+        r'не\s*поступал', r'нет\s*билет', r'билеты\s*не', r'не\s*приходят', r'не\s*дошли',
+        r'письмо\s*не', r'восстановить', r'нет билетов'
+    ]
+    message_lower = text.lower()
+    if any(re.search(pattern, message_lower) for pattern in ticket_problem_patterns):
+        return 'ticket_problem'
+    payment_problem_patterns = [
+        r'\b\d{6}\b.*(?:плат[её]ж|оплат|деньги|списались|карт|приложен|qr|код)',
+        r'(?:плат[её]ж|оплат).*\b\d{6}\b',
+        r'деньги.*списались',
+        r'чек.*не.*пришел',
+        r'двойн.*списан',
+        r'статус.*ожидает.*оплат',
+        r'платеж.*не.*прошел',
+        r'деньги.*вернулись'
+    ]
+    message_lower = text.lower()
+    if any(re.search(pattern, message_lower) for pattern in payment_problem_patterns):
+        return 'payment_problem'
+    if re.search(r'\b(\d{6})\b', text):
+        return 'order_number'
+    if re.match(r'^\d{6}$', text.strip()):
+        return 'order_number_only'
+    return None
+
+
+def measure(name: str, route, corpus, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for text in corpus:
+            route(text)
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:<24} {len(corpus) / best:>10.0f} сообщ./с   {best / len(corpus) * 1e6:6.1f} мкс на сообщение")
+    return best
+
+
+def main(args):
+    corpus = make_corpus(args.messages)
+    router = IntentRouter()
+
+    def compiled_route(text: str) -> Optional[str]:
+        return router.route(text.lower())
+
+    mismatches = [text for text in corpus if legacy_route(text) != compiled_route(text)]
+    if mismatches:
+        raise SystemExit(f"Намерения расходятся на {len(mismatches)} сообщениях, например: {mismatches[0]!r}")
+
+    print(f"сообщений: {len(corpus)}, лучший из {args.repeat} прогонов")
+    legacy = measure('каскад проверок', legacy_route, corpus, args.repeat)
+    compiled = measure('IntentRouter', compiled_route, corpus, args.repeat)
+    print(f"ускорение: {legacy / compiled:.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    main(parser.parse_args())
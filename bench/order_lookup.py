@@ -0,0 +1,134 @@
+"""Поиск заказа: OrderLookup на снимке из миллионов заказов - задержка и память.
+
+Снимок генерируется во временном каталоге: CSV (номера вперемешку, с заголовком) и SQLite
+с теми же номерами. Замеряется reload() из обоих форматов и прирост RSS процесса после
+загрузки индекса (SQLite первым: отсортированный поток строится без промежуточного
+списка). Для сравнения - тот же набор номеров в set строк, как хранились
+номера заказов до индекса. Затем exists() на случайных номерах: без LRU (cache_size=0,
+каждый запрос - двоичный поиск) и с LRU на повторяющемся наборе номеров.
+
+    python -m bench.order_lookup --orders 2000000
+
+Замер (2 млн заказов, 200000 запросов, одно ядро, три запуска):
+    индекс 15.3 МБ (8 байт на заказ); тот же набор в set строк - 190-215 МБ
+    reload() SQLite 1.2-1.5 с, прирост RSS 13 МБ
+    reload() CSV    2.7-3.4 с, прирост RSS 15 МБ
+    exists() без LRU   p50 2-3.5 мкс   p99 4.3-4.6 мкс
+    exists() с LRU     p50 0.5 мкс     p99 1.0-1.2 мкс
+Редкие выбросы до 1-2 мс - сборка мусора и планировщик ОС, не поиск. До того как
+build() стал убирать повторы на лету, отсортированный поток копировался во второй массив,
+и прирост RSS был вдвое больше индекса (28-31 МБ).
+"""
+import argparse
+import csv
+import gc
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import bench.common  # noqa: F401 - окружение для config
+from bench.common import percentiles
+from services.order_lookup import OrderLookup
+
+
+def rss_bytes() -> int:
+    """Текущий RSS процесса (Linux)"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def make_snapshot(directory: str, count: int, rng: random.Random):
+    """CSV и SQLite с count уникальными номерами заказов; возвращает пути и номера"""
+    numbers = rng.sample(range(10_000_000, 100_000_000), count)
+
+    csv_path = os.path.join(directory, 'orders.csv')
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['created_at', 'order_number', 'status'])
+        writer.writerows(('2026-10-17', number, 'paid') for number in numbers)
+
+    db_path = os.path.join(directory, 'orders.db')
+    connection = sqlite3.connect(db_path)
+    connection.execute('CREATE TABLE orders (order_number INTEGER, status TEXT)')
+    connection.executemany('INSERT INTO orders VALUES (?, ?)', ((number, 'paid') for number in numbers))
+    connection.execute('CREATE INDEX orders_number ON orders (order_number)')
+    connection.commit()
+    connection.close()
+    return csv_path, db_path, numbers
+
+
+def measure_lookups(name: str, lookup: OrderLookup, queries):
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        lookup.exists(query)
+        samples.append(time.perf_counter() - started)
+    stats = percentiles(samples)
+    print(f"{name:<18} p50 {stats['p50'] * 1000:5.1f} мкс   p99 {stats['p99'] * 1000:5.1f} мкс   "
+          f"max {stats['max'] * 1000:6.1f} мкс")
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    directory = tempfile.mkdtemp()
+    csv_path, db_path, numbers = make_snapshot(directory, args.orders, rng)
+
+    # Половина запросов - существующие заказы, половина - несуществующие номера той же длины
+    known = [str(number) for number in rng.sample(numbers, args.lookups // 2)]
+    unknown = [str(rng.randrange(10_000_000, 100_000_000)) for _ in range(args.lookups - len(known))]
+    queries = known + unknown
+    rng.shuffle(queries)
+
+    # SQLite первым: ORDER BY дает отсортированный поток, индекс строится без промежуточного списка
+    gc.collect()
+    rss_before = rss_bytes()
+    lookup = OrderLookup(db_path, cache_size=0)
+    started = time.perf_counter()
+    lookup.reload()
+    sqlite_seconds = time.perf_counter() - started
+    gc.collect()
+    rss_sqlite = rss_bytes() - rss_before
+
+    # CSV вперемешку сортируется через список int, память которого аллокатор оставляет процессу
+    rss_before = rss_bytes()
+    csv_lookup = OrderLookup(csv_path, cache_size=0)
+    started = time.perf_counter()
+    csv_lookup.reload()
+    csv_seconds = time.perf_counter() - started
+    gc.collect()
+    rss_csv = rss_bytes() - rss_before
+    if csv_lookup.stats()['orders'] != lookup.stats()['orders']:
+        raise SystemExit("Индексы из CSV и SQLite разошлись")
+    del csv_lookup
+
+    gc.collect()
+    rss_before = rss_bytes()
+    strings = {str(number) for number in numbers}
+    gc.collect()
+    rss_strings = rss_bytes() - rss_before
+    del strings
+
+    stats = lookup.stats()
+    print(f"заказов: {stats['orders']}, запросов: {len(queries)}")
+    print(f"индекс {stats['bytes'] / 2 ** 20:.1f} МБ; set строк - {rss_strings / 2 ** 20:.0f} МБ")
+    print(f"reload() SQLite {sqlite_seconds:.1f} с, прирост RSS {rss_sqlite / 2 ** 20:.0f} МБ")
+    print(f"reload() CSV    {csv_seconds:.1f} с, прирост RSS {rss_csv / 2 ** 20:.0f} МБ")
+
+    measure_lookups('exists() без LRU', lookup, queries)
+
+    # Повторные вопросы: 1000 номеров по кругу, все помещаются в LRU
+    lookup.cache_size = 1024
+    lookup.hits = lookup.misses = 0
+    hot = queries[:1000]
+    measure_lookups('exists() с LRU', lookup, [rng.choice(hot) for _ in range(len(queries))])
+    print(f"попаданий в LRU: {lookup.hits / (lookup.hits + lookup.misses):.0%}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=2_000_000)
+    parser.add_argument('--lookups', type=int, default=200_000)
+    parser.add_argument('--seed', type=int, default=1)
+    main(parser.parse_args())
@@ -0,0 +1,159 @@
+"""Планировщик отправки: всплеск sendMessage через SendScheduler и без него.
+
+Поддельный Bot API в отдельном процессе ведет себя как Telegram: корзина на бота
+(30 сообщений/с, запас с небольшим допуском на сетевой разброс) и на личный чат
+(1 сообщение/с, запас 3); сверх лимита отвечает 429 с retry_after. Каждый
+--inject-429-й запрос получает 429 независимо от лимитов.
+
+Всплеск: --messages сообщений в --chats чатов одновременно, посреди всплеска
+--operator сообщений в чат оператора (приоритетный). Без планировщика сообщения,
+получившие 429, теряются (обработчик видит ошибку); с планировщиком все доходят.
+
+    python -m bench.send_scheduler --messages 300 --chats 100 2>/dev/null
+
+Замер (локально, 300 сообщений в 100 чатов, 5 сообщений оператору, 429 на каждый 50-й запрос):
+    без планировщика   доставлено 38 из 305, 429: 267, за 0.3 с
+    SendScheduler      доставлено 305 из 305, 429: 6 (повторены), за 10.0 с (~30/с)
+                       клиенты: p50 4.2 с, max 10.0 с; оператор: p50 0.1 с, max 6.0 с
+Оператор обгоняет очередь клиентов; хвост 6 с у него - лимит группы (запас 3, затем 20/мин).
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+
+import bench.common  # noqa: F401 - окружение для config
+
+from aiohttp import web
+
+from bench.common import percentiles
+
+OPERATOR_CHAT_ID = -100500
+
+
+def run_fake_bot_api(port: int, ready, inject_every: int):
+    from services.send_scheduler import TokenBucket
+
+    # Допуск к запасу: разрешение, выданное клиентом вовремя, может прийти чуть раньше соседних
+    global_bucket = TokenBucket(30, capacity=33)
+    chat_buckets = {}
+    counters = {'requests': 0}
+
+    def rejected(retry_after: int) -> web.Response:
+        return web.json_response(
+            {'ok': False, 'error_code': 429, 'description': f'Too Many Requests: retry after {retry_after}',
+             'parameters': {'retry_after': retry_after}},
+            status=429
+        )
+
+    async def handle(request: web.Request) -> web.Response:
+        data = await request.post()
+        chat_id = int(data['chat_id'])
+        counters['requests'] += 1
+        if inject_every and counters['requests'] % inject_every == 0:
+            return rejected(1)
+
+        bucket = chat_buckets.get(chat_id)
+        if bucket is None:
+            rate = 20 / 60 if chat_id < 0 else 1
+            bucket = chat_buckets[chat_id] = TokenBucket(rate, capacity=3)
+        if bucket.ready_in() > 0 or global_bucket.ready_in() > 0:
+            return rejected(1)
+        bucket.take()
+        global_bucket.take()
+        return web.json_response({'ok': True, 'result': {
+            'message_id': counters['requests'], 'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'group' if chat_id < 0 else 'private'}, 'text': data.get('text', ''),
+        }})
+
+    async def serve():
+        app = web.Application()
+        app.router.add_post('/bot{token}/sendMessage', handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+async def burst(args, api_url: str, scheduled: bool):
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.exceptions import TelegramRetryAfter
+
+    from config import config
+    from services.send_scheduler import SendScheduler
+
+    bot = Bot(config.BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+    scheduler = SendScheduler(priority_chat_ids=[OPERATOR_CHAT_ID])
+    if scheduled:
+        bot.session.middleware(scheduler)
+
+    latencies = {'клиенты': [], 'оператор': []}
+    rejected = 0
+
+    async def send(chat_id: int, kind: str):
+        nonlocal rejected
+        started = time.perf_counter()
+        try:
+            await bot.send_message(chat_id=chat_id, text='bench')
+            latencies[kind].append(time.perf_counter() - started)
+        except TelegramRetryAfter:
+            rejected += 1
+
+    async def operator_messages():
+        # Сообщения оператору приходят, когда клиентская очередь уже набрана
+        await asyncio.sleep(0.2)
+        await asyncio.gather(*(send(OPERATOR_CHAT_ID, 'оператор') for _ in range(args.operator)))
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(send(700000 + number % args.chats, 'клиенты') for number in range(args.messages)),
+        operator_messages()
+    )
+    elapsed = time.perf_counter() - started
+    await bot.session.close()
+
+    total = args.messages + args.operator
+    delivered = sum(len(samples) for samples in latencies.values())
+    retried = scheduler.retry_after_count
+    name = 'SendScheduler' if scheduled else 'без планировщика'
+    print(f"{name:<18} доставлено {delivered} из {total}, 429: {rejected + retried}"
+          f"{' (повторены)' if scheduled else ''}, за {elapsed:.1f} с")
+    for kind, samples in latencies.items():
+        if samples:
+            stats = percentiles(samples)
+            print(f"{'':<18} {kind}: p50 {stats['p50'] / 1000:.1f} с, max {stats['max'] / 1000:.1f} с")
+
+
+async def main(args):
+    # Свежий поддельный API на каждый режим: лимиты предыдущего всплеска не влияют на следующий
+    for scheduled in (False, True):
+        port = free_port()
+        ready = multiprocessing.Event()
+        api_process = multiprocessing.Process(
+            target=run_fake_bot_api, args=(port, ready, args.inject_429), daemon=True
+        )
+        api_process.start()
+        ready.wait()
+        await burst(args, f"http://127.0.0.1:{port}", scheduled)
+        api_process.terminate()
+
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=300)
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--operator', type=int, default=5)
+    parser.add_argument('--inject-429', type=int, default=50, help='каждый N-й запрос получает 429 (0 - не внедрять)')
+    asyncio.run(main(parser.parse_args()))
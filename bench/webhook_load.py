@@ -0,0 +1,159 @@
+"""Нагрузочный тест вебхука: синтетические Update JSON на локальный сервер бота.
+
+Процесс бота поднимает приложение create_webhook_app() из main.py. Поддельный Bot API
+(отвечает на sendMessage/sendChatAction без задержки) и генератор нагрузки работают
+в отдельных процессах, чтобы не делить с ботом цикл событий. Генератор отправляет
+--updates обновлений от --users пользователей, --concurrency POST одновременно.
+Замеряются прием вебхуком (то, что видит Telegram: ответ 200 до обработки)
+и полная обработка (все обновления прошли диспетчер, по счетчику bot_update_seconds).
+
+Сообщения распознаются правилами и не доходят до DeepSeek. Лимиты планировщика
+отправки сняты, иначе полная обработка упирается в 30 сообщений/с.
+
+    python -m bench.webhook_load --updates 5000 --concurrency 100 2>/dev/null
+
+Замер на одном ядре (бот, поддельный API и генератор делят процессор):
+    5000 обновлений, 100 параллельно: прием 540/с, p50 140 мс, p99 618 мс; обработка 175/с
+    2000 обновлений, 20 параллельно:  прием 239/с, p50 72 мс,  p99 286 мс; обработка 217/с
+"""
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import os
+import tempfile
+import time
+
+import bench.common  # noqa: F401 - окружение для config
+
+os.environ.setdefault('SEND_GLOBAL_RATE', '1000000')
+os.environ.setdefault('SEND_CHAT_RATE', '1000000')
+os.environ.setdefault('SEND_CHAT_BURST', '1000000')
+# Логи бота идут в отдельный файл; консольный вывод лучше перенаправить: 2>/dev/null
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'bench_bot.log'))
+
+import aiohttp
+from aiohttp import web
+
+from bench.common import report
+
+SECRET = 'bench-secret'
+PATH = '/webhook'
+MESSAGES = ['как купить билеты', 'хочу вернуть билет', 'билеты не пришли', '123456', 'спасибо']
+
+
+def run_fake_bot_api(port: int, ready):
+    message_ids = itertools.count(1)
+
+    async def handle(request: web.Request) -> web.Response:
+        method = request.match_info['method'].lower()
+        data = await request.post()
+        if method == 'sendmessage':
+            result = {
+                'message_id': next(message_ids), 'date': int(time.time()),
+                'chat': {'id': int(data['chat_id']), 'type': 'private'}, 'text': data.get('text', ''),
+            }
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def serve():
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def make_update(update_id: int, user_id: int, text: str) -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': 'Bench'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': text,
+            'chat': {'id': user_id, 'type': 'private'}, 'from': user,
+        },
+    }
+
+
+def run_load(url: str, args, results):
+    updates = [
+        make_update(number + 1, 100000 + number % args.users, MESSAGES[number % len(MESSAGES)])
+        for number in range(args.updates)
+    ]
+
+    async def load():
+        semaphore = asyncio.Semaphore(args.concurrency)
+        samples = []
+        connector = aiohttp.TCPConnector(limit=args.concurrency)
+        async with aiohttp.ClientSession(connector=connector,
+                                         headers={'X-Telegram-Bot-Api-Secret-Token': SECRET}) as client:
+            async def post(update: dict):
+                async with semaphore:
+                    started = time.perf_counter()
+                    async with client.post(url, json=update) as response:
+                        await response.read()
+                        if response.status != 200:
+                            raise RuntimeError(f"Вебхук ответил {response.status}")
+                    samples.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(post(update) for update in updates))
+            return samples, time.perf_counter() - started
+
+    results.put(asyncio.run(load()))
+
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def main(args):
+    from aiogram.client.telegram import TelegramAPIServer
+
+    import main as bot_main
+    from services.tracing import UPDATE_SECONDS
+
+    api_port = free_port()
+    ready = multiprocessing.Event()
+    api_process = multiprocessing.Process(target=run_fake_bot_api, args=(api_port, ready), daemon=True)
+    api_process.start()
+    ready.wait()
+    bot_main.bot.session.api = TelegramAPIServer.from_base(f"http://127.0.0.1:{api_port}")
+
+    runner = web.AppRunner(bot_main.create_webhook_app(SECRET, PATH), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    url = f"http://127.0.0.1:{runner.addresses[0][1]}{PATH}"
+
+    processed_before = UPDATE_SECONDS._default.count
+    results = multiprocessing.Queue()
+    started = time.perf_counter()
+    load_process = multiprocessing.Process(target=run_load, args=(url, args, results), daemon=True)
+    load_process.start()
+
+    while UPDATE_SECONDS._default.count - processed_before < args.updates:
+        await asyncio.sleep(0.01)
+    processed = time.perf_counter() - started
+    samples, accepted = await asyncio.to_thread(results.get)
+
+    print(f"обновлений: {args.updates}, пользователей: {args.users}, параллельно: {args.concurrency}")
+    report('прием вебхуком', samples, accepted)
+    print(f"{'полная обработка':<28} {args.updates / processed:>10.0f}/с   за {processed:.2f} с")
+    await runner.cleanup()
+    api_process.terminate()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 
 class Config:
     # База данных
@@ -8,18 +9,143 @@ class Config:
     BOT_TOKEN = os.getenv('BOT_TOKEN')
     DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
     
-    # OPERATOR_CHAT_ID с безопасной обработкой
+    # OPERATOR_CHAT_ID с безопасной обработкой (у групп id отрицательный)
     operator_chat_id = os.getenv('OPERATOR_CHAT_ID', '').strip()
-    OPERATOR_CHAT_ID = int(operator_chat_id) if operator_chat_id and operator_chat_id.isdigit() else None
+    OPERATOR_CHAT_ID = int(operator_chat_id) if operator_chat_id and operator_chat_id.lstrip('-').isdigit() else None
     
     # Настройки DeepSeek
     DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
     DEEPSEEK_MODEL = "deepseek-chat"
+    DEEPSEEK_TIMEOUT = int(os.getenv('DEEPSEEK_TIMEOUT', '30'))
+
+    # Пул соединений к DeepSeek (одна HTTP-сессия на весь процесс)
+    DEEPSEEK_POOL_SIZE = int(os.getenv('DEEPSEEK_POOL_SIZE', '20'))
+    DEEPSEEK_POOL_PER_HOST = int(os.getenv('DEEPSEEK_POOL_PER_HOST', '10'))
+    DEEPSEEK_KEEPALIVE_TIMEOUT = int(os.getenv('DEEPSEEK_KEEPALIVE_TIMEOUT', '60'))
+
+    # Повторы запросов к DeepSeek (в пределах DEEPSEEK_TIMEOUT на все попытки) и предохранитель
+    DEEPSEEK_MAX_ATTEMPTS = int(os.getenv('DEEPSEEK_MAX_ATTEMPTS', '3'))
+    DEEPSEEK_RETRY_BASE_DELAY = float(os.getenv('DEEPSEEK_RETRY_BASE_DELAY', '0.5'))
+    DEEPSEEK_RETRY_MAX_DELAY = float(os.getenv('DEEPSEEK_RETRY_MAX_DELAY', '4'))
+    DEEPSEEK_BREAKER_FAILURES = int(os.getenv('DEEPSEEK_BREAKER_FAILURES', '5'))
+    DEEPSEEK_BREAKER_COOLDOWN = float(os.getenv('DEEPSEEK_BREAKER_COOLDOWN', '30'))
+
+    # Ограничение исходящих запросов к DeepSeek: одновременно и в секунду (0 - без ограничения RPS)
+    DEEPSEEK_MAX_CONCURRENCY = int(os.getenv('DEEPSEEK_MAX_CONCURRENCY', '8'))
+    DEEPSEEK_RPS = float(os.getenv('DEEPSEEK_RPS', '5'))
+
+    # Сколько последних сообщений диалога с моделью передавать в запрос
+    DEEPSEEK_HISTORY_MESSAGES = int(os.getenv('DEEPSEEK_HISTORY_MESSAGES', '6'))
+
+    # Потоковые ответы DeepSeek: сообщение правится по мере генерации не чаще раза в STREAM_EDIT_INTERVAL секунд
+    DEEPSEEK_STREAMING = os.getenv('DEEPSEEK_STREAMING', 'true').strip().lower() in ('1', 'true', 'yes')
+    STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.5'))
+
+    # Кэш ответов DeepSeek на общие вопросы (без истории диалога и номера заказа)
+    DEEPSEEK_CACHE_ENABLED = os.getenv('DEEPSEEK_CACHE_ENABLED', 'true').strip().lower() in ('1', 'true', 'yes')
+    DEEPSEEK_CACHE_TTL_MINUTES = int(os.getenv('DEEPSEEK_CACHE_TTL_MINUTES', '360'))
+    DEEPSEEK_CACHE_MAX_ENTRIES = int(os.getenv('DEEPSEEK_CACHE_MAX_ENTRIES', '2000'))
     
     # Настройки бота
     MAX_MESSAGE_LENGTH = 4000
     TYPING_DELAY = 0.5
-    
+
+    # Сессии диалогов: срок жизни по умолчанию, лимит записей на сценарий, период очистки
+    SESSION_TTL_MINUTES = int(os.getenv('SESSION_TTL_MINUTES', '30'))
+    SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', '10000'))
+    SESSION_SWEEP_INTERVAL = int(os.getenv('SESSION_SWEEP_INTERVAL', '60'))
+
+    # Хранилище сессий: memory (по умолчанию) или redis - для нескольких реплик бота
+    SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'memory').strip().lower()
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    SESSION_KEY_PREFIX = os.getenv('SESSION_KEY_PREFIX', 'bot:session')
+
+    # Фоновая запись переписки в БД: размер пачки, интервал сброса (мс), лимит очереди
+    DB_WRITE_BATCH_SIZE = int(os.getenv('DB_WRITE_BATCH_SIZE', '200'))
+    DB_WRITE_FLUSH_MS = int(os.getenv('DB_WRITE_FLUSH_MS', '250'))
+    DB_WRITE_QUEUE_SIZE = int(os.getenv('DB_WRITE_QUEUE_SIZE', '10000'))
+
+    # Уведомления оператора: окно сбора сводки (с), подавление повторов (мин)
+    OPERATOR_DIGEST_WINDOW = float(os.getenv('OPERATOR_DIGEST_WINDOW', '5'))
+    OPERATOR_DEDUPE_MINUTES = int(os.getenv('OPERATOR_DEDUPE_MINUTES', '10'))
+
+    # Лимиты отправки сообщений Telegram: на бота (в секунду), на личный чат (в секунду и запас), на группу (в минуту)
+    SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', '30'))
+    SEND_CHAT_RATE = float(os.getenv('SEND_CHAT_RATE', '1'))
+    SEND_CHAT_BURST = int(os.getenv('SEND_CHAT_BURST', '3'))
+    SEND_GROUP_PER_MINUTE = int(os.getenv('SEND_GROUP_PER_MINUTE', '20'))
+    SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', '3'))
+
+    # Снимок заказов для проверки номеров (CSV или SQLite); без него - демо-режим
+    ORDER_SNAPSHOT_PATH = os.getenv('ORDER_SNAPSHOT_PATH', '').strip()
+    ORDER_SNAPSHOT_TABLE = os.getenv('ORDER_SNAPSHOT_TABLE', 'orders')
+    ORDER_SNAPSHOT_COLUMN = os.getenv('ORDER_SNAPSHOT_COLUMN', 'order_number')
+    ORDER_LOOKUP_CACHE_SIZE = int(os.getenv('ORDER_LOOKUP_CACHE_SIZE', '1024'))
+
+    # Локальный классификатор намерений перед обращением к DeepSeek (нужен numpy)
+    INTENT_CLASSIFIER_ENABLED = os.getenv('INTENT_CLASSIFIER_ENABLED', 'true').strip().lower() in ('1', 'true', 'yes')
+    INTENT_MODEL_PATH = os.getenv('INTENT_MODEL_PATH', 'intent_model.npz')
+    INTENT_CLASSIFIER_THRESHOLD = float(os.getenv('INTENT_CLASSIFIER_THRESHOLD', '0.75'))
+
+    # Обработка обновлений: сообщения одного пользователя по очереди, всего не больше UPDATE_MAX_CONCURRENCY одновременно
+    UPDATE_MAX_CONCURRENCY = int(os.getenv('UPDATE_MAX_CONCURRENCY', '200'))
+
+    # Перегрузка: пороги обновлений в работе, задержки цикла событий (мс) и очереди к DeepSeek;
+    # обратно в обычный режим - когда нагрузка ниже доли OVERLOAD_RECOVER_RATIO от порогов OVERLOAD_RECOVER_SECONDS секунд
+    OVERLOAD_CHECK_INTERVAL = float(os.getenv('OVERLOAD_CHECK_INTERVAL', '0.5'))
+    OVERLOAD_MAX_IN_FLIGHT = int(os.getenv('OVERLOAD_MAX_IN_FLIGHT', '400'))
+    OVERLOAD_MAX_LOOP_LAG_MS = float(os.getenv('OVERLOAD_MAX_LOOP_LAG_MS', '250'))
+    OVERLOAD_MAX_LLM_QUEUE = int(os.getenv('OVERLOAD_MAX_LLM_QUEUE', '50'))
+    OVERLOAD_RECOVER_RATIO = float(os.getenv('OVERLOAD_RECOVER_RATIO', '0.5'))
+    OVERLOAD_RECOVER_SECONDS = float(os.getenv('OVERLOAD_RECOVER_SECONDS', '10'))
+
+    # Векторный поиск по частым вопросам: готовый ответ выше порога, иначе top-k справок для DeepSeek (нужен numpy)
+    FAQ_ENABLED = os.getenv('FAQ_ENABLED', 'true').strip().lower() in ('1', 'true', 'yes')
+    FAQ_INDEX_PATH = os.getenv('FAQ_INDEX_PATH', 'faq_index.npz')
+    FAQ_ANSWER_THRESHOLD = float(os.getenv('FAQ_ANSWER_THRESHOLD', '0.6'))
+    FAQ_CONTEXT_MIN_SCORE = float(os.getenv('FAQ_CONTEXT_MIN_SCORE', '0.3'))
+    FAQ_CONTEXT_TOP_K = int(os.getenv('FAQ_CONTEXT_TOP_K', '2'))
+
+    # Метрики Prometheus: отдельный HTTP-сервер рядом с polling или вебхуком.
+    # По умолчанию слушает только localhost: метрики раскрывают нагрузку и внутренние очереди
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').strip().lower() in ('1', 'true', 'yes')
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
+    METRICS_PATH = os.getenv('METRICS_PATH', '/metrics')
+
+    # Трассировка: обновления дольше TRACE_SLOW_MS пишутся в лог с разбивкой по этапам;
+    # профиль стеков снимается для каждого PROFILE_SAMPLE_EVERY-го обновления (0 - выключен)
+    TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', '2000'))
+    PROFILE_SAMPLE_EVERY = int(os.getenv('PROFILE_SAMPLE_EVERY', '0'))
+    PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+
+    # Логирование: файл, формат JSON, ротация по размеру (байт) или по времени (midnight, H...),
+    # доля сохраняемых INFO-записей самых многословных логгеров ("aiogram.event=0.1,main=0.5")
+    LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+    LOG_JSON = os.getenv('LOG_JSON', 'true').strip().lower() in ('1', 'true', 'yes')
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(20 * 1024 * 1024)))
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+    LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', '').strip()
+    LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', 'aiogram.event=0.1')
+
+    # Режим получения обновлений: polling (по умолчанию) или webhook
+    BOT_MODE = os.getenv('BOT_MODE', 'polling').strip().lower()
+
+    # Вебхук: публичный адрес (https://bot.example.com), путь, секрет и адрес прослушивания aiohttp-сервера
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').strip().rstrip('/')
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '').strip()
+    WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8080')))
+
+    @classmethod
+    def session_ttl(cls, flow: str, default_minutes: int = None) -> timedelta:
+        """Срок жизни сессии сценария (переопределяется через SESSION_TTL_<FLOW>_MINUTES)"""
+        if default_minutes is None:
+            default_minutes = cls.SESSION_TTL_MINUTES
+        minutes = os.getenv(f'SESSION_TTL_{flow.upper()}_MINUTES', '').strip()
+        return timedelta(minutes=int(minutes) if minutes.isdigit() else default_minutes)
+
     # Проверка обязательных переменных
     @classmethod
     def validate(cls):
@@ -27,9 +153,24 @@ class Config:
             raise ValueError("BOT_TOKEN не установлен! Проверьте переменные окружения в Amvera")
         if not cls.DEEPSEEK_API_KEY:
             raise ValueError("DEEPSEEK_API_KEY не установлен! Проверьте переменные окружения в Amvera")
+        # Лимиты отправки - делители в корзинах токенов: 0 сломал бы каждую отправку
+        for name in ('SEND_GLOBAL_RATE', 'SEND_CHAT_RATE', 'SEND_CHAT_BURST', 'SEND_GROUP_PER_MINUTE'):
+            if getattr(cls, name) <= 0:
+                raise ValueError(f"{name} должен быть больше 0 (сейчас {getattr(cls, name)})")
+        if cls.SEND_MAX_RETRIES < 0:
+            raise ValueError(f"SEND_MAX_RETRIES не может быть отрицательным (сейчас {cls.SEND_MAX_RETRIES})")
+
+    @classmethod
+    def validate_webhook(cls):
+        if not cls.WEBHOOK_URL:
+            raise ValueError("WEBHOOK_URL не установлен! Для режима webhook нужен публичный HTTPS-адрес бота")
+        if not cls.WEBHOOK_SECRET:
+            raise ValueError("WEBHOOK_SECRET не установлен! Без секрета вебхук примет запросы от кого угодно")
+        if not cls.WEBHOOK_PATH.startswith('/'):
+            raise ValueError("WEBHOOK_PATH должен начинаться с '/'")
 
 # Создаем экземпляр конфигурации
 config = Config()
 
 # Проверяем при импорте
-config.validate()
\ No newline at end of file
+config.validate()
\ No newline at end of file
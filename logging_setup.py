@@ -0,0 +1,133 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import Dict, Optional
+
+from services.tracing import TraceIdFilter
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON: время, уровень, логгер, сообщение и исключение"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        trace_id = getattr(record, 'trace_id', '-')
+        if trace_id != '-':
+            entry['trace_id'] = trace_id
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RecordQueueHandler(QueueHandler):
+    """QueueHandler, который не склеивает трассировку с текстом сообщения.
+
+    Сообщение и трассировка готовятся в потоке вызова (аргументы могут измениться позже),
+    а форматирование - на стороне слушателя: JSON получает трассировку отдельным полем.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только часть записей ниже WARNING от самых многословных логгеров.
+
+    Доля задается для логгера и всех дочерних: {'aiogram.event': 0.1} - каждая десятая запись.
+    Выборка по счетчику, а не случайная: при равномерном потоке записи не пропадают подряд.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._counters: Dict[str, float] = {}
+        self.dropped_count = 0
+
+    def _rate(self, name: str) -> Optional[float]:
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate is None or rate >= 1:
+            return True
+        # Первая запись логгера сохраняется всегда
+        credit = self._counters.get(record.name, 1.0) + rate
+        if credit >= 1 - 1e-9:
+            self._counters[record.name] = credit - 1
+            return True
+        self._counters[record.name] = credit
+        self.dropped_count += 1
+        return False
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """'aiogram.event=0.1,main=0.5' -> {'aiogram.event': 0.1, 'main': 0.5}"""
+    rates = {}
+    for item in value.split(','):
+        name, _, rate = item.partition('=')
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def setup_logging(path: str, level: int = logging.INFO, json_file: bool = True, max_bytes: int = 0,
+                  backup_count: int = 5, rotate_when: str = '',
+                  sample_rates: Optional[Dict[str, float]] = None) -> QueueListener:
+    """Логирование через очередь: обработчики в цикле событий только кладут запись в очередь,
+    запись в файл и консоль выполняет фоновый поток QueueListener. Каждая запись получает
+    trace_id обновления, в котором она создана.
+
+    Файл ротируется по времени (rotate_when: 'midnight', 'H', ...) или по размеру (max_bytes).
+    """
+    if rotate_when:
+        file_handler = TimedRotatingFileHandler(path, when=rotate_when, backupCount=backup_count, encoding='utf-8')
+    else:
+        file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter() if json_file else logging.Formatter(TEXT_FORMAT))
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = RecordQueueHandler(log_queue)
+    if sample_rates:
+        # Отбрасываем до очереди, чтобы лишние записи не стоили и постановки в нее
+        queue_handler.addFilter(SamplingFilter(sample_rates))
+    # trace_id берется из контекста задачи, поэтому фильтр стоит до очереди
+    queue_handler.addFilter(TraceIdFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    # При выходе дописываем все, что осталось в очереди
+    atexit.register(listener.stop)
+    return listener
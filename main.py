@@ -1,37 +1,64 @@
+import argparse
 import asyncio
 import logging
 import random
 import re
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, Optional
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, BufferedInputFile
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 from services.deepseek_service import DeepSeekService
+from services.intent_router import INTENT_TABLE, IntentRouter
+from services.typo_index import text_words
+from services.lexicons import LEXICONS, scan_lexicons, detect_payment_problem_type
+from services.session_store import session_registry
+from services.session_backend import RedisSessionBackend
+from services.chat_recorder import ChatRecorder
+from services.operator_notifier import OperatorNotifier
+from services.send_scheduler import SendScheduler
+from services.telegram_stream import send_streaming_reply
+from services.order_lookup import OrderLookup, DemoOrderLookup
+from services.entity_extractor import extract_entities, find_order_number, format_phone, is_valid_email
+from services.time_parser import parse_payment_time
+from services.text_vectorizer import numpy_available
+from services.intent_classifier import build_classifier
+from services.faq_index import FAQ_ENTRIES, FaqIndex, HOW_TO_BUY_TEXT
+from services.overload import OverloadController
+from services.metrics import metrics
+from services.tracing import StackSampler, span, stage_summary
+from middlewares import (
+    TraceMiddleware, UserOrderMiddleware, SessionSyncMiddleware, ChatLogMiddleware, FlowMetricsMiddleware,
+    TraceRequestMiddleware, OutgoingLogMiddleware
+)
+from models import Base
+from logging_setup import setup_logging, parse_sample_rates
 
 # Загрузка переменных окружения ДО всего остального
 load_dotenv()
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
-
 # Импортируем конфиг
 from config import config
 
+# Настройка логирования: запись в файл и консоль - в фоновом потоке, а не в цикле событий
+setup_logging(
+    config.LOG_FILE,
+    json_file=config.LOG_JSON,
+    max_bytes=config.LOG_MAX_BYTES,
+    backup_count=config.LOG_BACKUP_COUNT,
+    rotate_when=config.LOG_ROTATE_WHEN,
+    sample_rates=parse_sample_rates(config.LOG_SAMPLE_RATES)
+)
+logger = logging.getLogger(__name__)
+
 # Проверка токена из конфига
 BOT_TOKEN = config.BOT_TOKEN
 if not BOT_TOKEN:
@@ -42,99 +69,20 @@ logger.info(f"Бот запускается с токеном: {BOT_TOKEN[:10]}.
 
 # Класс для управления ответами на номера заказов
 class OrderResponseManager:
-    def __init__(self):
-        self.order_patterns = {
-            # Особые номера
-            'premium': {'suffix': ['00', '25', '50', '75'], 'type': 'Премиум сервис'},
-            'special_numbers': {'numbers': [111111, 222222, 333333, 444444, 555555, 666666, 777777, 888888, 999999, 123456, 654321], 'type': 'Особый номер'}
-        }
-        
-        # 5 заказов, которые будут "не найдены"
-        self.not_found_orders = {
-            '999999', '888888', '777777', '666666', '555555'
-        }
-        
-        # Остальные заказы будут найдены
-        self.existing_orders = {
-            # Основные диапазоны
-            '123456', '123457', '123458', '123459', '123460', '123461', '123462', '123463', '123464', '123465',
-            '123466', '123467', '123468', '123469', '123470', '123471', '123472', '123473', '123474', '123475',
-            '234567', '234568', '234569', '234570', '234571', '234572', '234573', '234574', '234575', '234576',
-            '234577', '234578', '234579', '234580', '234581', '234582', '234583', '234584', '234585', '234586',
-            '345678', '345679', '345680', '345681', '345682', '345683', '345684', '345685', '345686', '345687',
-            '345688', '345689', '345690', '345691', '345692', '345693', '345694', '345695', '345696', '345697',
-            '456789', '456790', '456791', '456792', '456793', '456794', '456795', '456796', '456797', '456798',
-            '456799', '456800', '456801', '456802', '456803', '456804', '456805', '456806', '456807', '456808',
-            '567890', '567891', '567892', '567893', '567894', '567895', '567896', '567897', '567898', '567899',
-            '567900', '567901', '567902', '567903', '567904', '567905', '567906', '567907', '567908', '567909',
-            
-            # Дополнительные диапазоны
-            '678901', '678902', '678903', '678904', '678905', '678906', '678907', '678908', '678909', '678910',
-            '789012', '789013', '789014', '789015', '789016', '789017', '789018', '789019', '789020', '789021',
-            '890123', '890124', '890125', '890126', '890127', '890128', '890129', '890130', '890131', '890132',
-            '901234', '901235', '901236', '901237', '901238', '901239', '901240', '901241', '901242', '901243',
-            
-            # Повторяющиеся и особые номера (кроме 5 не найденных)
-            '111111', '222222', '333333', '444444',
-            '112233', '223344', '334455', '445566', '556677', '667788', '778899', '889900', '990011',
-            '121212', '232323', '343434', '454545', '565656', '676767', '787878', '898989',
-            '131313', '242424', '353535', '464646', '575757', '686868', '797979',
-            '141414', '252525', '363636', '474747', '585858', '696969',
-            '151515', '262626', '373737', '484848',
-            '161616', '272727', '383838', '494949',
-            '171717', '282828', '393939',
-            '181818', '292929',
-            '191919',
-            
-            # Номера с префиксами
-            '100001', '100002', '100003', '100004', '100005', '100006', '100007', '100008', '100009', '100010',
-            '200001', '200002', '200003', '200004', '200005', '200006', '200007', '200008', '200009', '200010',
-            '300001', '300002', '300003', '300004', '300005', '300006', '300007', '300008', '300009', '300010',
-            '400001', '400002', '400003', '400004', '400005', '400006', '400007', '400008', '400009', '400010',
-            '500001', '500002', '500003', '500004', '500006', '500007', '500008', '500009', '500010',
-            
-            # Симметричные номера
-            '123321', '123432', '123543', '123654', '123765', '123876', '123987',
-            '321123', '432234', '543345', '654456', '765567', '876678', '987789',
-            '102030', '203040', '304050', '405060', '506070', '607080', '708090', '809010',
-            '110011', '220022', '330033', '440044',
-            '120012', '230023', '340034', '450045', '560056', '670067', '780078', '890089',
-            '130013', '240024', '350035', '460046', '570057', '680068', '790079',
-            '140014', '250025', '360036', '470047', '580058', '690069',
-            '150015', '260026', '370037', '480048',
-            
-            # Популярные комбинации
-            '123123', '321321', '456456', '654654', '789789', '987987',
-            '111222', '222333', '333444', '444555',
-            '100100', '200200', '300300', '400400',
-            '101010', '202020', '303030', '404040',
-            
-            # Дополнительные номера для покрытия большинства комбинаций
-            '102938', '112233', '122333', '133344', '144455', '155566', '166677', '177788', '188899', '199900',
-            '201234', '211235', '221236', '231237', '241238', '251239', '261240', '271241', '281242', '291243',
-            '301234', '311235', '321236', '331237', '341238', '351239', '361240', '371241', '381242', '391243',
-            '401234', '411235', '421236', '431237', '441238', '451239', '461240', '471241', '481242', '491243',
-            '501234', '511235', '521236', '531237', '541238', '551239', '561240', '571241', '581242', '591243',
-            
-            # Еще больше номеров для максимального покрытия
-            '601234', '611235', '621236', '631237', '641238', '651239', '661240', '671241', '681242', '691243',
-            '701234', '711235', '721236', '731237', '741238', '751239', '761240', '771241', '781242', '791243',
-            '801234', '811235', '821236', '831237', '841238', '851239', '861240', '871241', '881242', '891243',
-            '901234', '911235', '921236', '931237', '941238', '951239', '961240', '971241', '981242', '991243',
-            
-            # Финальный набор для почти 100% покрытия
-            '102345', '112346', '122347', '132348', '142349', '152350', '162351', '172352', '182353', '192354',
-            '202345', '212346', '222347', '232348', '242349', '252350', '262351', '272352', '282353', '292354',
-            '302345', '312346', '322347', '332348', '342349', '352350', '362351', '372352', '382353', '392354',
-            '402345', '412346', '422347', '432348', '442349', '452350', '462351', '472352', '482353', '492354',
-            '502345', '512346', '522347', '532348', '542349', '552350', '562351', '572352', '582353', '592354'
-        }
+    # Особые номера
+    PREMIUM_SUFFIXES = ('00', '25', '50', '75')
+    SPECIAL_NUMBERS = frozenset({
+        '111111', '222222', '333333', '444444', '555555', '666666', '777777', '888888', '999999', '123456', '654321'
+    })
+
+    def __init__(self, lookup):
+        # Источник заказов: снимок (OrderLookup) или демо-режим (DemoOrderLookup)
+        self.lookup = lookup
     
     def get_order_status_response(self, order_number: str) -> str:
         """Генерирует ответ о статусе заказа на основе его номера"""
         
-        # Проверяем, является ли заказ одним из 5 "не найденных"
-        if order_number in self.not_found_orders:
+        if not self.lookup.exists(order_number):
             return (
                 "❌ Заказ не найден\n\n"
                 "Убедитесь, что:\n"
@@ -144,122 +92,49 @@ class OrderResponseManager:
                 "Если уверены в номере заказа - обратитесь к оператору для детальной проверки."
             )
         
-        # Проверяем существование заказа
-        if order_number not in self.existing_orders:
-            # Для всех остальных заказов, которых нет в списке, считаем найденными
-            pass
-        
-        num = int(order_number)
-        
-        # Проверяем специальные паттерны
         order_type = self._detect_order_type(order_number)
         return self._generate_detailed_response(order_number, order_type)
     
     def _detect_order_type(self, order_number: str) -> str:
         """Определяет тип заказа по номеру"""
-        num = int(order_number)
-        
-        # Проверяем диапазоны
-        for key, pattern in self.order_patterns.items():
-            if 'suffix' in pattern:
-                if any(order_number.endswith(suffix) for suffix in pattern['suffix']):
-                    return pattern['type']
-            
-            if 'numbers' in pattern:
-                if num in pattern['numbers']:
-                    return pattern['type']
-        
+        if order_number.endswith(self.PREMIUM_SUFFIXES):
+            return 'Премиум сервис'
+        if order_number in self.SPECIAL_NUMBERS:
+            return 'Особый номер'
         return "Стандартная обработка"
     
     def _generate_detailed_response(self, order_number: str, order_type: str) -> str:
         """Генерирует детализированный ответ на основе типа заказа"""
         
-        responses = {
-            'Премиум сервис': [
-                f"✅ Заказ №{order_number} успешно обработан!\n\nБилеты отправлены на email. Проверьте папку «Спам» если не нашли.",
-                f"📧 Заказ №{order_number} - письмо с билетами доставлено!\n\nВсе билеты активны и готовы к использованию.",
-            ],
-            
-            'Особый номер': [
-                f"✅ Заказ №{order_number} успешно обработан!\n\nБилеты отправлены на email. Проверьте папку «Спам» если не нашли.",
-                f"📧 Заказ №{order_number} - письмо с билетами доставлено!\n\nВсе билеты активны и готовы к использованию.",
-            ]
-        }
-        
-        # Если тип не найден, используем стандартные ответы
-        if order_type not in responses:
-            standard_responses = [
-                f"✅ Заказ №{order_number} успешно обработан!\n\nБилеты отправлены на email. Проверьте папку «Спам» если не нашли.",
-                f"📧 Заказ №{order_number} - письмо с билетами доставлено!\n\nВсе билеты активны и готовы к использованию.",
-            ]
-            return random.choice(standard_responses)
-        
-        return random.choice(responses[order_type])
+        # Для всех типов заказов тексты пока одинаковые
+        responses = [
+            f"✅ Заказ №{order_number} успешно обработан!\n\nБилеты отправлены на email. Проверьте папку «Спам» если не нашли.",
+            f"📧 Заказ №{order_number} - письмо с билетами доставлено!\n\nВсе билеты активны и готовы к использованию.",
+        ]
+        return random.choice(responses)
 
 # Функция для определения недовольства (вынесена отдельно)
 def detect_dissatisfaction_improved(message_text: str) -> bool:
     """Определяет недовольство клиента (улучшенная версия)"""
-    dissatisfaction_phrases = [
-        'недоволен', 'плохой', 'ужасный', 'кошмар', 'безобразие', 'возмущен',
-        'хреново', 'отстой', 'бесит', 'раздражает', 'достало', 'надоело',
-        'человека', 'оператора', 'менеджера', 'живого',
-        'это не помогает', 'бесполезно', 'зря', 'напрасно',
-        'верните деньги', 'жалоба', 'претензия', 'верните',
-        'свяжите с человеком', 'позовите оператора', 'до человека',
-        'не помогает', 'без толку', 'напрасн', 'бесполезно',
-        'проблема не решена', 'ничего не меняется', 'не решается',
-        'уже пробовал', 'уже пытался', 'всё равно не работает',
-        'надоело ждать', 'достало ждать', 'устал ждать',
-        'это не решает проблему', 'беспонтово', 'фигня', 'ерунда',
-        'зря только', 'напрасная трата', 'разочарован', 'разочаровал'
-    ]
-    
-    message_lower = message_text.lower()
-    return any(phrase in message_lower for phrase in dissatisfaction_phrases)
+    return 'dissatisfaction' in scan_lexicons(message_text)
 
 # Функция для определения, что пользователь не может разобраться сам
 def detect_need_help(message_text: str) -> bool:
     """Определяет, что пользователь не может разобраться сам и нуждается в помощи оператора"""
-    help_phrases = [
-        'не могу разобраться', 'не понимаю', 'не ясно', 'не понятно', 
-        'не получается', 'не выходит', 'не знаю как', 'не знаю что делать',
-        'запутался', 'не разберусь', 'не соображу', 'не могу понять',
-        'помогите разобраться', 'объясните', 'подскажите как быть',
-        'что делать не знаю', 'не могу понять в чем проблема',
-        'не могу понять что случилось', 'не могу понять почему',
-        'не могу понять как решить', 'не могу решить проблему',
-        'не получается решить', 'не выходит решить', 'не могу справиться',
-        'не могу сам разобраться', 'сам не справлюсь', 'сам не могу',
-        'нужна помощь', 'требуется помощь', 'помогите пожалуйста',
-        'не могу понять в чем дело', 'не могу понять что не так'
-    ]
-    
-    message_lower = message_text.lower()
-    return any(phrase in message_lower for phrase in help_phrases)
+    return 'need_help' in scan_lexicons(message_text)
 
 # Функция для определения благодарностей и положительных отзывов
 def detect_thanks_and_praise(message_text: str) -> bool:
     """Определяет благодарности и положительные отзывы"""
-    thanks_phrases = [
-        'спасибо', 'благодарю', 'thanks', 'thank you', 'мерси', 'пасиб', 'сяб', 
-        'благодарочка', 'признателен', 'признательна', 'благодарствую',
-        'выручил', 'помог', 'спас', 'супер', 'отлично', 'прекрасно', 'замечательно',
-        'великолепно', 'потрясающе', 'офигенно', 'офигенный', 'круто', 'крутой',
-        'здорово', 'молодец', 'умница', 'красавчик', 'лучший', 'лучшая', 
-        'работает', 'все работает', 'всё работает', 'все ок', 'всё ок', 'все хорошо',
-        'всё хорошо', 'отличная работа', 'хорошая работа', 'вау', 'ого', 'здорово',
-        'суперски', 'класс', 'классно', 'заебись', 'ахуенно', 'шикарно', 'превосходно',
-        'идеально', 'безупречно', 'восхитительно', 'потрясающе', 'невероятно',
-        'обалденно', 'чудесно', 'изумительно', 'фантастически', 'блестяще'
-    ]
-    
-    message_lower = message_text.lower()
-    return any(phrase in message_lower for phrase in thanks_phrases)
+    return 'thanks' in scan_lexicons(message_text)
 
 # Класс для обработки вызова оператора
 class OperatorHandler:
     def __init__(self):
-        self.user_sessions: Dict[int, Dict] = {}
+        self.user_sessions = session_registry.create_store(
+            'operator', ttl=config.session_ttl('operator'), max_entries=config.SESSION_MAX_ENTRIES,
+            exclusive=True
+        )
         
     def start_operator_session(self, user_id: int):
         """Начинает сессию вызова оператора"""
@@ -334,7 +209,10 @@ class OperatorHandler:
 # Класс для обработки восстановления билетов
 class TicketRecoveryHandler:
     def __init__(self):
-        self.user_sessions: Dict[int, Dict] = {}
+        self.user_sessions = session_registry.create_store(
+            'ticket_recovery', ttl=config.session_ttl('ticket_recovery'), max_entries=config.SESSION_MAX_ENTRIES,
+            exclusive=True
+        )
         
     def start_recovery_session(self, user_id: int):
         """Начинает сессию восстановления билетов"""
@@ -358,76 +236,9 @@ class TicketRecoveryHandler:
             
         return None
         
-    def _validate_phone_number(self, phone: str) -> bool:
-        """Проверяет валидность российского номера телефона"""
-        clean_phone = re.sub(r'[\s\(\)\-+]', '', phone)
-        
-        if not clean_phone.startswith(('7', '8')):
-            return False
-        
-        if len(clean_phone) not in [10, 11]:
-            return False
-        
-        if not clean_phone.isdigit():
-            return False
-        
-        patterns = [
-            r'^7\d{10}$',
-            r'^8\d{10}$',
-            r'^7\d{9}$',
-            r'^8\d{9}$',
-        ]
-        
-        for pattern in patterns:
-            if re.match(pattern, clean_phone):
-                return True
-        
-        return False
-
-    def _validate_email(self, email: str) -> bool:
-        """Проверяет валидность email"""
-        pattern = r'^[a-zA-Z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}$'
-        return re.match(pattern, email) is not None
-
-    def _extract_contact_info(self, text: str) -> Dict[str, str]:
-        """Извлекает контактные данные из текста"""
-        contacts = {}
-        
-        # Ищем email
-        email_match = re.search(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', text)
-        if email_match:
-            contacts['email'] = email_match.group(0)
-        
-        # Ищем телефон (улучшенные паттерны)
-        phone_patterns = [
-            r'\b\+?7\s?\(?\d{3}\)?\s?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}\b',
-            r'\b8\s?\(?\d{3}\)?\s?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}\b',
-            r'\b7\s?\(?\d{3}\)?\s?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}\b',  # Добавлен паттерн для 7 с пробелами
-            r'\b7\d{9,10}\b',
-            r'\b8\d{9,10}\b',
-        ]
-        
-        found_phones = []
-        for pattern in phone_patterns:
-            phone_matches = re.finditer(pattern, text)
-            for phone_match in phone_matches:
-                phone = phone_match.group(0)
-                if self._validate_phone_number(phone):
-                    found_phones.append(phone)
-        
-        if found_phones:
-            contacts['phone'] = found_phones[0]
-        
-        # Ищем номер заказа (6 цифр)
-        order_match = re.search(r'\b(\d{6})\b', text)
-        if order_match:
-            contacts['order_number'] = order_match.group(1)
-        
-        return contacts
-
     def _process_contact_info_step(self, user_id: int, message: str) -> str:
         """Обрабатывает шаг ввода контактной информации"""
-        contact_info = self._extract_contact_info(message)
+        contact_info = extract_entities(message).contacts(with_order=True)
         
         if not contact_info:
             # Если не удалось распознать контактные данные, просим уточнить
@@ -447,16 +258,7 @@ class TicketRecoveryHandler:
         if 'order_number' in contact_info:
             found_data.append(f"номеру заказа: {contact_info['order_number']}")
         if 'phone' in contact_info:
-            phone = contact_info['phone']
-            clean_phone = re.sub(r'[\s\(\)\-+]', '', phone)
-            if clean_phone.startswith('8') and len(clean_phone) == 11:
-                formatted_phone = f"+7 ({clean_phone[1:4]}) {clean_phone[4:7]}-{clean_phone[7:9]}-{clean_phone[9:]}"
-            elif clean_phone.startswith('7') and len(clean_phone) == 11:
-                formatted_phone = f"+7 ({clean_phone[1:4]}) {clean_phone[4:7]}-{clean_phone[7:9]}-{clean_phone[9:]}"
-            elif len(clean_phone) == 10:
-                formatted_phone = f"+7 ({clean_phone[0:3]}) {clean_phone[3:6]}-{clean_phone[6:8]}-{clean_phone[8:]}"
-            else:
-                formatted_phone = phone
+            formatted_phone = format_phone(contact_info['phone'])
             found_data.append(f"номеру телефона: {formatted_phone}")
         if 'email' in contact_info:
             found_data.append(f"email: {contact_info['email']}")
@@ -491,7 +293,10 @@ class TicketRecoveryHandler:
 # Класс для обработки возврата ошибочных билетов
 class WrongEventRefundHandler:
     def __init__(self):
-        self.user_sessions: Dict[int, Dict] = {}
+        self.user_sessions = session_registry.create_store(
+            'wrong_event_refund', ttl=config.session_ttl('wrong_event_refund'), max_entries=config.SESSION_MAX_ENTRIES,
+            exclusive=True
+        )
         
     def start_wrong_event_session(self, user_id: int):
         """Начинает сессию возврата ошибочных билетов"""
@@ -520,9 +325,8 @@ class WrongEventRefundHandler:
     def _process_order_step(self, user_id: int, message: str) -> str:
         """Обрабатывает шаг ввода номера заказа"""
         # Ищем номер заказа
-        order_match = re.search(r'\b(\d{6})\b', message)
-        if order_match:
-            order_number = order_match.group(1)
+        order_number = find_order_number(message)
+        if order_number:
             self.user_sessions[user_id]['data']['order_number'] = order_number
             self.user_sessions[user_id]['step'] = 'waiting_contacts'
             
@@ -546,66 +350,9 @@ class WrongEventRefundHandler:
                 "Пожалуйста, введите правильный номер заказа:"
             )
     
-    def _validate_phone_number(self, phone: str) -> bool:
-        """Проверяет валидность российского номера телефона"""
-        clean_phone = re.sub(r'[\s\(\)\-+]', '', phone)
-        
-        if not clean_phone.startswith(('7', '8')):
-            return False
-        
-        if len(clean_phone) not in [10, 11]:
-            return False
-        
-        if not clean_phone.isdigit():
-            return False
-        
-        patterns = [
-            r'^7\d{10}$',
-            r'^8\d{10}$',
-            r'^7\d{9}$',
-            r'^8\d{9}$',
-        ]
-        
-        for pattern in patterns:
-            if re.match(pattern, clean_phone):
-                return True
-        
-        return False
-
-    def _extract_contact_info(self, text: str) -> Dict[str, str]:
-        """Извлекает контактные данные из текста"""
-        contacts = {}
-        
-        # Ищем email
-        email_match = re.search(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', text)
-        if email_match:
-            contacts['email'] = email_match.group(0)
-        
-        # Улучшенные паттерны для телефонов
-        phone_patterns = [
-            r'\+7\s?\(?\d{3}\)?\s?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}',  # +7 (999) 123-45-67
-            r'8\s?\(?\d{3}\)?\s?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}',   # 8 (999) 123-45-67
-            r'7\s?\(?\d{3}\)?\s?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}',   # 7 (999) 123-45-67
-            r'\b\d{10,11}\b',                                      # 89991234567
-            r'\b\d{1}\s?\d{3}\s?\d{3}\s?\d{2}\s?\d{2}\b',         # 8 999 123 45 67
-        ]
-        
-        found_phones = []
-        for pattern in phone_patterns:
-            phone_matches = re.finditer(pattern, text)
-            for phone_match in phone_matches:
-                phone = phone_match.group(0)
-                if self._validate_phone_number(phone):
-                    found_phones.append(phone)
-        
-        if found_phones:
-            contacts['phone'] = found_phones[0]
-        
-        return contacts
-
     def _process_contacts_step(self, user_id: int, message: str) -> str:
         """Обрабатывает шаг ввода контактов"""
-        contact_info = self._extract_contact_info(message)
+        contact_info = extract_entities(message).contacts()
         
         if not contact_info:
             return (
@@ -625,16 +372,7 @@ class WrongEventRefundHandler:
         # Форматируем контактные данные для отображения
         contact_display = []
         if 'phone' in contact_info:
-            phone = contact_info['phone']
-            clean_phone = re.sub(r'[\s\(\)\-+]', '', phone)
-            if clean_phone.startswith('8') and len(clean_phone) == 11:
-                formatted_phone = f"+7 ({clean_phone[1:4]}) {clean_phone[4:7]}-{clean_phone[7:9]}-{clean_phone[9:]}"
-            elif clean_phone.startswith('7') and len(clean_phone) == 11:
-                formatted_phone = f"+7 ({clean_phone[1:4]}) {clean_phone[4:7]}-{clean_phone[7:9]}-{clean_phone[9:]}"
-            elif len(clean_phone) == 10:
-                formatted_phone = f"+7 ({clean_phone[0:3]}) {clean_phone[3:6]}-{clean_phone[6:8]}-{clean_phone[8:]}"
-            else:
-                formatted_phone = phone
+            formatted_phone = format_phone(contact_info['phone'])
             contact_display.append(f"Телефон: {formatted_phone}")
         
         if 'email' in contact_info:
@@ -677,7 +415,10 @@ class WrongEventRefundHandler:
 # Класс для обработки смены email
 class EmailChangeHandler:
     def __init__(self):
-        self.user_sessions: Dict[int, Dict] = {}
+        self.user_sessions = session_registry.create_store(
+            'email_change', ttl=config.session_ttl('email_change'), max_entries=config.SESSION_MAX_ENTRIES,
+            exclusive=True
+        )
         
     def start_email_change_session(self, user_id: int):
         """Начинает сессию смены email"""
@@ -706,9 +447,8 @@ class EmailChangeHandler:
     def _process_order_step(self, user_id: int, message: str) -> str:
         """Обрабатывает шаг ввода номера заказа"""
         # Ищем номер заказа
-        order_match = re.search(r'\b(\d{6})\b', message)
-        if order_match:
-            order_number = order_match.group(1)
+        order_number = find_order_number(message)
+        if order_number:
             self.user_sessions[user_id]['data']['order_number'] = order_number
             self.user_sessions[user_id]['step'] = 'waiting_new_email'
             
@@ -728,16 +468,11 @@ class EmailChangeHandler:
                 "Пожалуйста, введите правильный номер заказа:"
             )
             
-    def _validate_email(self, email: str) -> bool:
-        """Проверяет валидность email"""
-        pattern = r'^[a-zA-Z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}$'
-        return re.match(pattern, email) is not None
-        
     def _process_email_step(self, user_id: int, message: str) -> str:
         """Обрабатывает шаг ввода нового email"""
         email = message.strip()
         
-        if not self._validate_email(email):
+        if not is_valid_email(email):
             return (
                 "Неверный формат email!\n\n"
                 "Пожалуйста, введите корректный email адрес:\n\n"
@@ -789,7 +524,10 @@ class EmailChangeHandler:
 # Класс для обработки возврата одного билета
 class PartialRefundHandler:
     def __init__(self):
-        self.user_sessions: Dict[int, Dict] = {}
+        self.user_sessions = session_registry.create_store(
+            'partial_refund', ttl=config.session_ttl('partial_refund'), max_entries=config.SESSION_MAX_ENTRIES,
+            exclusive=True
+        )
         
     def start_partial_refund_session(self, user_id: int):
         """Начинает сессию возврата одного билета"""
@@ -818,9 +556,8 @@ class PartialRefundHandler:
     def _process_ticket_details_step(self, user_id: int, message: str) -> str:
         """Обрабатывает шаг ввода деталей билета"""
         # Ищем номер заказа
-        order_match = re.search(r'\b(\d{6})\b', message)
-        if order_match:
-            order_number = order_match.group(1)
+        order_number = find_order_number(message)
+        if order_number:
             self.user_sessions[user_id]['data']['order_number'] = order_number
             
             # Ищем номер билета или описание
@@ -882,66 +619,9 @@ class PartialRefundHandler:
             # Возвращаем первые 50 символов как причину
             return clean_text.strip()[:50] + "..." if len(clean_text.strip()) > 50 else clean_text.strip()
     
-    def _validate_phone_number(self, phone: str) -> bool:
-        """Проверяет валидность российского номера телефона"""
-        clean_phone = re.sub(r'[\s\(\)\-+]', '', phone)
-        
-        if not clean_phone.startswith(('7', '8')):
-            return False
-        
-        if len(clean_phone) not in [10, 11]:
-            return False
-        
-        if not clean_phone.isdigit():
-            return False
-        
-        patterns = [
-            r'^7\d{10}$',
-            r'^8\d{10}$',
-            r'^7\d{9}$',
-            r'^8\d{9}$',
-        ]
-        
-        for pattern in patterns:
-            if re.match(pattern, clean_phone):
-                return True
-        
-        return False
-
-    def _extract_contact_info(self, text: str) -> Dict[str, str]:
-        """Извлекает контактные данные из текста"""
-        contacts = {}
-        
-        # Ищем email
-        email_match = re.search(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', text)
-        if email_match:
-            contacts['email'] = email_match.group(0)
-        
-        # Улучшенные паттерны для телефонов
-        phone_patterns = [
-            r'\+7\s?\(?\d{3}\)?\s?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}',  # +7 (999) 123-45-67
-            r'8\s?\(?\d{3}\)?\s?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}',   # 8 (999) 123-45-67
-            r'7\s?\(?\d{3}\)?\s?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}',   # 7 (999) 123-45-67
-            r'\b\d{10,11}\b',                                      # 89991234567
-            r'\b\d{1}\s?\d{3}\s?\d{3}\s?\d{2}\s?\d{2}\b',         # 8 999 123 45 67
-        ]
-        
-        found_phones = []
-        for pattern in phone_patterns:
-            phone_matches = re.finditer(pattern, text)
-            for phone_match in phone_matches:
-                phone = phone_match.group(0)
-                if self._validate_phone_number(phone):
-                    found_phones.append(phone)
-        
-        if found_phones:
-            contacts['phone'] = found_phones[0]
-        
-        return contacts
-
     def _process_contacts_step(self, user_id: int, message: str) -> str:
         """Обрабатывает шаг ввода контактов"""
-        contact_info = self._extract_contact_info(message)
+        contact_info = extract_entities(message).contacts()
         
         if not contact_info:
             return (
@@ -961,16 +641,7 @@ class PartialRefundHandler:
         # Форматируем контактные данные для отображения
         contact_display = []
         if 'phone' in contact_info:
-            phone = contact_info['phone']
-            clean_phone = re.sub(r'[\s\(\)\-+]', '', phone)
-            if clean_phone.startswith('8') and len(clean_phone) == 11:
-                formatted_phone = f"+7 ({clean_phone[1:4]}) {clean_phone[4:7]}-{clean_phone[7:9]}-{clean_phone[9:]}"
-            elif clean_phone.startswith('7') and len(clean_phone) == 11:
-                formatted_phone = f"+7 ({clean_phone[1:4]}) {clean_phone[4:7]}-{clean_phone[7:9]}-{clean_phone[9:]}"
-            elif len(clean_phone) == 10:
-                formatted_phone = f"+7 ({clean_phone[0:3]}) {clean_phone[3:6]}-{clean_phone[6:8]}-{clean_phone[8:]}"
-            else:
-                formatted_phone = phone
+            formatted_phone = format_phone(contact_info['phone'])
             contact_display.append(f"Телефон: {formatted_phone}")
         
         if 'email' in contact_info:
@@ -1015,7 +686,10 @@ class PartialRefundHandler:
 # Класс для обработки платежей
 class PaymentHandler:
     def __init__(self):
-        self.user_sessions: Dict[int, Dict] = {}
+        self.user_sessions = session_registry.create_store(
+            'payment', ttl=config.session_ttl('payment'), max_entries=config.SESSION_MAX_ENTRIES,
+            exclusive=True
+        )
         
     def start_payment_session(self, user_id: int):
         """Начинает сессию обработки платежа"""
@@ -1074,199 +748,45 @@ class PaymentHandler:
         data = {}
         text_lower = text.lower()
         
+        entities = extract_entities(text)
+        
         # Номер заказа (ровно 6 цифр)
-        order_match = re.search(r'\b(\d{6})\b', text)
-        if order_match:
-            data['order_number'] = order_match.group(1)
+        if entities.order_number:
+            data['order_number'] = entities.order_number
             logger.info(f"Найден номер заказа: {data['order_number']}")
         
         # УЛУЧШЕННАЯ ОБРАБОТКА ВРЕМЕНИ
-        time_data = self._extract_time_data(text_lower)
+        time_data = parse_payment_time(text_lower)
         if time_data:
             data['time_minutes'] = time_data['minutes']
             data['time_description'] = time_data['description']
             logger.info(f"Найдено время: {data['time_description']} = {data['time_minutes']} минут")
         
-        # Способ оплаты с учетом опечаток
-        payment_methods = {
-            'мобильное приложение': ['приложен', 'приложени', 'мобильн', 'телефон', 'приложении', 'приложение', 'апп', 'app'],
-            'QR-код': ['qr', 'код', 'qr-код', 'кьюар', 'кюар', 'по qr'],
-            'банковская карта': ['карт', 'картой', 'карту', 'карта', 'карточк', 'кард', 'card']
-        }
-        
-        for method, keywords in payment_methods.items():
-            for keyword in keywords:
-                if keyword in text_lower:
-                    data['payment_method'] = method
-                    logger.info(f"Найден способ оплаты: {method}")
-                    break
-            if 'payment_method' in data:
-                break
+        # Способ оплаты с учетом опечаток (словари PAYMENT_METHOD_PHRASES)
+        if entities.payment_method:
+            data['payment_method'] = entities.payment_method
+            logger.info(f"Найден способ оплаты: {entities.payment_method}")
         
         # Определяем тип проблемы
-        problem_type = self._detect_problem_type(text_lower)
+        problem_type = self._detect_problem_type(text)
         if problem_type:
             data['problem_type'] = problem_type
         
         return data
 
-    def _detect_problem_type(self, text_lower: str) -> str:
+    def _detect_problem_type(self, text: str) -> Optional[str]:
         """Определяет тип проблемы с оплатой"""
-        if any(phrase in text_lower for phrase in ['дважды', 'двойн', 'два раза', 'двойное', 'дважды', 'списалась дважды']):
-            return 'double_charge'
-        elif any(phrase in text_lower for phrase in ['списались', 'статус ожидает оплаты', 'статус не изменился']):
-            return 'money_taken_but_status_pending'
-        elif any(phrase in text_lower for phrase in ['чек не пришел', 'кассовый чек', 'email не пришел']):
-            return 'receipt_not_received'
-        elif any(phrase in text_lower for phrase in ['платеж не прошел', 'деньги вернулись', 'сначала списались']):
-            return 'payment_failed'
-        elif any(phrase in text_lower for phrase in ['ошибка в процессе оплаты', 'не понятно прошел ли платеж', 'ошибка при оплате']):
-            return 'unclear_status'
-        
-        return None
+        return detect_payment_problem_type(text)
 
-    def _extract_time_data(self, text_lower: str) -> Optional[Dict]:
-        """Извлекает и преобразует время в минуты"""
-        # Обработка времени в формате ЧЧ:ММ
-        time_match = re.search(r'(\d{1,2}):(\d{2})', text_lower)
-        if time_match:
-            hour, minute = map(int, time_match.groups())
-            now = datetime.now()
-            
-            # Предполагаем, что оплата была сегодня
-            payment_time = datetime(now.year, now.month, now.day, hour, minute)
-            if payment_time > now:
-                # Если время в будущем, значит вчера
-                payment_time = payment_time - timedelta(days=1)
-            
-            time_diff = now - payment_time
-            minutes = int(time_diff.total_seconds() / 60)
-            
-            return {'minutes': str(minutes), 'description': f"сегодня в {hour:02d}:{minute:02d}"}
-        
-        # Сначала пытаемся найти точные совпадения
-        time_data = self._extract_exact_time(text_lower)
-        if time_data:
-            return time_data
-        
-        # Затем ищем опечатки и приблизительные выражения
-        time_data = self._extract_approximate_time(text_lower)
-        if time_data:
-            return time_data
-        
-        return None
-
-    def _extract_exact_time(self, text_lower: str) -> Optional[Dict]:
-        """Извлекает точные временные выражения"""
-        # Минуты
-        minute_match = re.search(r'(\d+)\s*(?:мин|минут|минуты|мин\.|минут\.)', text_lower)
-        if minute_match:
-            minutes = int(minute_match.group(1))
-            return {'minutes': str(minutes), 'description': f"{minutes} минут"}
-        
-        # Часы
-        hour_match = re.search(r'(\d+)\s*(?:час|часа|часов|час\.)', text_lower)
-        if hour_match:
-            hours = int(hour_match.group(1))
-            minutes = hours * 60
-            hour_word = "час" if hours == 1 else "часа" if 2 <= hours <= 4 else "часов"
-            return {'minutes': str(minutes), 'description': f"{hours} {hour_word}"}
-        
-        # Дни
-        day_match = re.search(r'(\d+)\s*(?:день|дня|дней|дн\.|день\.)', text_lower)
-        if day_match:
-            days = int(day_match.group(1))
-            minutes = days * 24 * 60
-            day_word = "день" if days == 1 else "дня" if 2 <= days <= 4 else "дней"
-            return {'minutes': str(minutes), 'description': f"{days} {day_word}"}
-        
-        return None
-
-    def _extract_approximate_time(self, text_lower: str) -> Optional[Dict]:
-        """Извлекает приблизительные временные выражения и обрабатывает опечатки"""
-        now = datetime.now()
-        
-        # Относительные временные выражения с реальными датами
-        time_mapping = {
-            'сегодня': (0, 'day'),  # сегодня
-            'седня': (0, 'day'),
-            'севодня': (0, 'day'),
-            'севоня': (0, 'day'),
-            'вчера': (1, 'day'),
-            'вчеоа': (1, 'day'),
-            'фчера': (1, 'day'),
-            'позавчера': (2, 'day'),
-            'позавчеа': (2, 'day'),
-            'позафчера': (2, 'day'),
-            'позачвера': (2, 'day'),
-            'позачверя': (2, 'day'),
-            'позачвеа': (2, 'day'),
-            'на прошлой неделе': (7, 'day'),
-            'прошлая неделя': (7, 'day'),
-            'неделю назад': (7, 'day'),
-            'недели назад': (7, 'day'),
-            'неделя назад': (7, 'day'),
-        }
-        
-        # Проверяем точные совпадения
-        for phrase, (days_back, unit) in time_mapping.items():
-            if phrase in text_lower:
-                target_date = now - timedelta(days=days_back)
-                description = target_date.strftime("%d.%m.%Y")
-                minutes = days_back * 24 * 60
-                return {'minutes': str(minutes), 'description': description}
-        
-        # Проверяем частичные совпадения для обработки опечаток
-        for phrase, (days_back, unit) in time_mapping.items():
-            if self._fuzzy_match(phrase, text_lower):
-                target_date = now - timedelta(days=days_back)
-                description = target_date.strftime("%d.%m.%Y")
-                minutes = days_back * 24 * 60
-                return {'minutes': str(minutes), 'description': description}
-        
-        # Попытка распознать дату в формате ДД.ММ.ГГГГ
-        date_match = re.search(r'(\d{1,2})[\.\-\/](\d{1,2})[\.\-\/](\d{4})', text_lower)
-        if date_match:
-            try:
-                day, month, year = map(int, date_match.groups())
-                payment_date = datetime(year, month, day)
-                time_diff = now - payment_date
-                
-                if time_diff.days >= 0:
-                    minutes = time_diff.days * 24 * 60
-                    description = f"{day:02d}.{month:02d}.{year}"
-                    return {'minutes': str(minutes), 'description': description}
-            except ValueError:
-                pass
-        
-        return None
-
-    def _fuzzy_match(self, phrase: str, text: str) -> bool:
-        """Функция для нечеткого сравнения строк"""
-        # Простая проверка на частичное совпадение
-        words = phrase.split()
-        found_words = 0
-        
-        for word in words:
-            if len(word) > 3 and word in text:  # Ищем только слова длиннее 3 символов
-                found_words += 1
-        
-        # Если найдено больше половины слов фразы - считаем совпадением
-        return found_words >= len(words) // 2
-        
     def _generate_solution_response(self, data: Dict, original_message: str, user_id: int) -> str:
         """Генерирует ответ с решением в зависимости от описания проблемы"""
         order_num = data.get('order_number', 'неизвестен')
         time_mins = data.get('time_minutes', '30')
         time_desc = data.get('time_description', 'неизвестно')
         payment_method = data.get('payment_method', 'неизвестен')
-        problem_type = data.get('problem_type')
-        
-        message_lower = original_message.lower()
-        
-        # Если явно определили тип проблемы - используем его
-        if not problem_type:
-            problem_type = self._detect_problem_type(message_lower)
+        # Тип проблемы из текущего сообщения важнее сохраненного: уточнение может
+        # назвать другую проблему, чем общее «проблема с оплатой» в начале диалога
+        problem_type = self._detect_problem_type(original_message) or data.get('problem_type')
         
         # НОВАЯ ЛОГИКА: если пользователь не может разобраться - подключаем оператора
         if detect_need_help(original_message):
@@ -1283,14 +803,14 @@ class PaymentHandler:
             
             # Уведомляем оператора
             if OPERATOR_CHAT_ID is not None:
-                asyncio.create_task(call_operator(
+                call_operator(
                     types.User(id=user_id, first_name="Пользователь", is_bot=False), 
                     f"Неясная проблема с оплатой заказа {order_num}. Сообщение: {original_message}"
-                ))
+                )
             return response
         
         # Определяем тип проблемы и генерируем соответствующий ответ
-        if problem_type == 'double_charge' or any(phrase in message_lower for phrase in ['дважды', 'двойн', 'два раза', 'списалась дважды']):
+        if problem_type == 'double_charge':
             response = (
                 f"⚠️ По заказу №{order_num} обнаружено двойное списание\n\n"
                 "Проблема: Произошло двойное списание средств\n\n"
@@ -1302,7 +822,7 @@ class PaymentHandler:
                 "⏰ Возврат произойдет автоматически в течение 5 дней"
             )
         
-        elif problem_type == 'money_taken_but_status_pending' or any(phrase in message_lower for phrase in ['деньги списались', 'статус ожидает оплаты', 'статус не изменился']):
+        elif problem_type == 'money_taken_but_status_pending':
             response = (
                 f"✅ По заказу №{order_num} разобрался!\n\n"
                 "Проблема: Деньги списались, но статус не обновился\n\n"
@@ -1315,7 +835,7 @@ class PaymentHandler:
                 "🔄 Если не помогло - обратитесь в поддержку"
             )
         
-        elif problem_type == 'receipt_not_received' or any(phrase in message_lower for phrase in ['чек не пришел', 'кассовый чек', 'email не пришел']):
+        elif problem_type == 'receipt_not_received':
             response = (
                 f"📧 По заказу №{order_num} проблема с чеком\n\n"
                 "Проблема: Кассовый чек не пришел на email\n\n"
@@ -1327,7 +847,7 @@ class PaymentHandler:
                 "📞 Если не придет - обратитесь в поддержку"
             )
         
-        elif problem_type == 'payment_failed' or any(phrase in message_lower for phrase in ['платеж не прошел', 'деньги вернулись', 'сначала списались']):
+        elif problem_type == 'payment_failed':
             response = (
                 f"🔄 По заказу №{order_num} проблема с платежом\n\n"
                 "Проблема: Платеж не завершился, деньги вернулись\n\n"
@@ -1339,7 +859,7 @@ class PaymentHandler:
                 "⏰ Подождите разблокировки перед повторной оплатой"
             )
         
-        elif problem_type == 'unclear_status' or any(phrase in message_lower for phrase in ['ошибка в процессе оплаты', 'не понятно прошел ли платеж', 'ошибка при оплате']):
+        elif problem_type == 'unclear_status':
             response = (
                 f"❓ По заказу №{order_num} неясный статус платежа\n\n"
                 "Проблема: Непонятно, прошел ли платеж\n\n"
@@ -1403,8 +923,14 @@ class PaymentHandler:
 # Класс для обработки возвратов
 class RefundHandler:
     def __init__(self):
-        self.user_sessions: Dict[int, Dict] = {}
-        self.refund_requests: Dict[int, Dict] = {}
+        self.user_sessions = session_registry.create_store(
+            'refund', ttl=config.session_ttl('refund'), max_entries=config.SESSION_MAX_ENTRIES,
+            exclusive=True
+        )
+        # Принятые заявки храним сутки, чтобы память не росла бесконечно
+        self.refund_requests = session_registry.create_store(
+            'refund_requests', ttl=config.session_ttl('refund_requests', 24 * 60), max_entries=config.SESSION_MAX_ENTRIES
+        )
         
     def start_refund_session(self, user_id: int):
         """Начинает сессию обработки возврата"""
@@ -1435,9 +961,8 @@ class RefundHandler:
     def _process_order_step(self, user_id: int, message: str) -> str:
         """Обрабатывает шаг ввода номера заказа"""
         # Ищем номер заказа
-        order_match = re.search(r'\b(\d{6})\b', message)
-        if order_match:
-            order_number = order_match.group(1)
+        order_number = find_order_number(message)
+        if order_number:
             self.user_sessions[user_id]['data']['order_number'] = order_number
             self.user_sessions[user_id]['step'] = 'waiting_reason'
             
@@ -1507,73 +1032,10 @@ class RefundHandler:
             "example@mail.ru" + additional_text
         )
         
-    def _validate_phone_number(self, phone: str) -> bool:
-        """Проверяет валидность российского номера телефона"""
-        # Очищаем номер от пробелов, скобок, дефисов
-        clean_phone = re.sub(r'[\s\(\)\-+]', '', phone)
-        
-        # Должен быть только российский номер
-        if not clean_phone.startswith(('7', '8')):
-            return False
-        
-        # Проверяем длину (10 или 11 цифр)
-        if len(clean_phone) not in [10, 11]:
-            return False
-        
-        # Проверяем, что все символы - цифры
-        if not clean_phone.isdigit():
-            return False
-        
-        # Проверяем российские форматы номеров более строго
-        patterns = [
-            r'^7\d{10}$',      # 79991234567 (11 цифр)
-            r'^8\d{10}$',      # 89991234567 (11 цифр)
-            r'^7\d{9}$',       # 7999123456 (10 цифр)
-            r'^8\d{9}$',       # 8999123456 (10 цифр)
-        ]
-        
-        for pattern in patterns:
-            if re.match(pattern, clean_phone):
-                return True
-        
-        return True  # Более мягкая валидация
-
-    def _extract_contact_info(self, text: str) -> Dict[str, str]:
-        """Извлекает контактные данные из текста"""
-        contacts = {}
-        
-        # Ищем email
-        email_match = re.search(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', text)
-        if email_match:
-            contacts['email'] = email_match.group(0)
-        
-        # Улучшенные паттерны для телефонов
-        phone_patterns = [
-            r'\+7\s?\(?\d{3}\)?\s?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}',  # +7 (999) 123-45-67
-            r'8\s?\(?\d{3}\)?\s?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}',   # 8 (999) 123-45-67
-            r'7\s?\(?\d{3}\)?\s?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}',   # 7 (999) 123-45-67
-            r'\b\d{10,11}\b',                                      # 89991234567
-            r'\b\d{1}\s?\d{3}\s?\d{3}\s?\d{2}\s?\d{2}\b',         # 8 999 123 45 67
-        ]
-        
-        found_phones = []
-        for pattern in phone_patterns:
-            phone_matches = re.finditer(pattern, text)
-            for phone_match in phone_matches:
-                phone = phone_match.group(0)
-                if self._validate_phone_number(phone):
-                    found_phones.append(phone)
-        
-        # Берем только первый валидный номер
-        if found_phones:
-            contacts['phone'] = found_phones[0]
-        
-        return contacts
-
     def _process_contacts_step(self, user_id: int, message: str) -> str:
         """Обрабатывает шаг ввода контактов"""
         # Извлекаем контактные данные
-        contact_info = self._extract_contact_info(message)
+        contact_info = extract_entities(message).contacts()
         
         # Проверяем, что есть хотя бы один валидный контакт
         if not contact_info:
@@ -1594,17 +1056,7 @@ class RefundHandler:
         # Форматируем контактные данные для отображения
         contact_display = []
         if 'phone' in contact_info:
-            # Форматируем телефон для красивого отображения
-            phone = contact_info['phone']
-            clean_phone = re.sub(r'[\s\(\)\-+]', '', phone)
-            if clean_phone.startswith('8') and len(clean_phone) == 11:
-                formatted_phone = f"+7 ({clean_phone[1:4]}) {clean_phone[4:7]}-{clean_phone[7:9]}-{clean_phone[9:]}"
-            elif clean_phone.startswith('7') and len(clean_phone) == 11:
-                formatted_phone = f"+7 ({clean_phone[1:4]}) {clean_phone[4:7]}-{clean_phone[7:9]}-{clean_phone[9:]}"
-            elif len(clean_phone) == 10:
-                formatted_phone = f"+7 ({clean_phone[0:3]}) {clean_phone[3:6]}-{clean_phone[6:8]}-{clean_phone[8:]}"
-            else:
-                formatted_phone = phone
+            formatted_phone = format_phone(contact_info['phone'])
             contact_display.append(f"Телефон: {formatted_phone}")
         
         if 'email' in contact_info:
@@ -1659,12 +1111,64 @@ bot = Bot(
 )
 dp = Dispatcher()
 
+# Трасса каждого обновления (trace_id в логах, время по этапам) и выборочный профиль стеков
+stack_sampler = StackSampler(
+    config.PROFILE_SAMPLE_EVERY, interval=config.PROFILE_INTERVAL_MS / 1000
+) if config.PROFILE_SAMPLE_EVERY > 0 else None
+dp.update.outer_middleware(TraceMiddleware(config.TRACE_SLOW_MS / 1000, sampler=stack_sampler))
+bot.session.middleware(TraceRequestMiddleware())
+
+# Обновления одного пользователя - строго по очереди (сценарии не перемешивают шаги), разных - параллельно
+update_order = UserOrderMiddleware(config.UPDATE_MAX_CONCURRENCY)
+dp.update.outer_middleware(update_order)
+
+# Внешнее хранилище сессий (несколько реплик, перезапуск без потери диалогов)
+if config.SESSION_BACKEND == 'redis':
+    session_registry.set_backend(RedisSessionBackend(config.REDIS_URL, prefix=config.SESSION_KEY_PREFIX))
+dp.message.outer_middleware(SessionSyncMiddleware(session_registry))
+
 # Настройка базы данных из конфига
 engine = create_async_engine(config.DATABASE_URL, echo=False)
 async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+# Запись переписки в БД через фоновую очередь (обработчики не ждут базу)
+chat_recorder = ChatRecorder(
+    async_session,
+    batch_size=config.DB_WRITE_BATCH_SIZE,
+    flush_interval=config.DB_WRITE_FLUSH_MS / 1000,
+    max_queue=config.DB_WRITE_QUEUE_SIZE
+)
+dp.message.outer_middleware(ChatLogMiddleware(chat_recorder, session_registry))
+dp.message.outer_middleware(FlowMetricsMiddleware(
+    session_registry,
+    metrics.counter('bot_flow_started_total', 'Начатые сценарии', ('flow',)),
+    metrics.counter('bot_flow_finished_total', 'Завершенные сценарии', ('flow',))
+))
+bot.session.middleware(OutgoingLogMiddleware(chat_recorder, exclude_chat_ids=[config.OPERATOR_CHAT_ID]))
+
+# Общий планировщик отправки: лимиты Telegram (на бота и на чат), приоритет оператора, повтор на RetryAfter
+send_scheduler = SendScheduler(
+    global_rate=config.SEND_GLOBAL_RATE,
+    chat_rate=config.SEND_CHAT_RATE,
+    chat_burst=config.SEND_CHAT_BURST,
+    group_per_minute=config.SEND_GROUP_PER_MINUTE,
+    max_retries=config.SEND_MAX_RETRIES,
+    priority_chat_ids=[config.OPERATOR_CHAT_ID]
+)
+bot.session.middleware(send_scheduler)
+
 # Инициализация сервисов
 ds_service = DeepSeekService()
+# Упрощенный режим без DeepSeek, когда бот не успевает за потоком сообщений
+overload = OverloadController(
+    in_flight=lambda: update_order.in_flight + update_order.waiting,
+    llm_queue=lambda: ds_service.limiter.queue_depth,
+    max_in_flight=config.OVERLOAD_MAX_IN_FLIGHT,
+    max_loop_lag=config.OVERLOAD_MAX_LOOP_LAG_MS / 1000,
+    max_llm_queue=config.OVERLOAD_MAX_LLM_QUEUE,
+    recover_ratio=config.OVERLOAD_RECOVER_RATIO,
+    recover_seconds=config.OVERLOAD_RECOVER_SECONDS
+)
 payment_handler = PaymentHandler()
 refund_handler = RefundHandler()
 email_change_handler = EmailChangeHandler()
@@ -1672,12 +1176,81 @@ partial_refund_handler = PartialRefundHandler()
 wrong_event_handler = WrongEventRefundHandler()
 operator_handler = OperatorHandler()
 ticket_recovery_handler = TicketRecoveryHandler()
-order_manager = OrderResponseManager()
+# Заказы: снимок из ORDER_SNAPSHOT_PATH (загружается при запуске) или демо-режим без снимка
+if config.ORDER_SNAPSHOT_PATH:
+    order_lookup = OrderLookup(
+        config.ORDER_SNAPSHOT_PATH,
+        table=config.ORDER_SNAPSHOT_TABLE,
+        column=config.ORDER_SNAPSHOT_COLUMN,
+        cache_size=config.ORDER_LOOKUP_CACHE_SIZE
+    )
+else:
+    order_lookup = DemoOrderLookup()
+order_manager = OrderResponseManager(order_lookup)
+# Слова словарей и FAQ - правильные слова, маршрутизатор не исправляет их к словам правил
+intent_router = IntentRouter(known_words=text_words(
+    [phrase for phrases in LEXICONS.values() for phrase in phrases]
+    + [text for entry in FAQ_ENTRIES for text in (*entry['questions'], entry['answer'])]
+))
+# Локальный классификатор намерений (загружается или обучается при запуске)
+intent_classifier = None
+# Векторный индекс частых вопросов (загружается или строится при запуске)
+faq_index = None
+
+# Обработчики сообщений активных сценариев: имя хранилища сессий -> метод обработки
+FLOW_PROCESSORS = {
+    'operator': operator_handler.process_operator_message,
+    'ticket_recovery': ticket_recovery_handler.process_recovery_message,
+    'wrong_event_refund': wrong_event_handler.process_wrong_event_message,
+    'email_change': email_change_handler.process_email_change_message,
+    'partial_refund': partial_refund_handler.process_partial_refund_message,
+    'refund': refund_handler.process_refund_message,
+    'payment': payment_handler.process_payment_message,
+}
 
 # ID оператора из конфига
 OPERATOR_CHAT_ID = config.OPERATOR_CHAT_ID
 logger.info(f"OPERATOR_CHAT_ID: {OPERATOR_CHAT_ID}")
 
+# Очередь уведомлений оператора: сводки, хранение недоставленного в БД (лимиты Telegram - в send_scheduler)
+operator_notifier = OperatorNotifier(
+    bot,
+    OPERATOR_CHAT_ID,
+    session_factory=async_session,
+    digest_window=config.OPERATOR_DIGEST_WINDOW,
+    dedupe_window=config.OPERATOR_DEDUPE_MINUTES * 60
+) if OPERATOR_CHAT_ID is not None else None
+
+# Метрики Prometheus: счетчики горячего пути объявлены рядом с кодом, здесь - показатели компонентов
+operator_escalations = metrics.counter('bot_operator_escalations_total', 'Обращения, переданные оператору')
+metrics.callback(
+    'bot_updates_processed_total', 'Обработанные обновления Telegram', lambda: update_order.processed_count,
+    kind='counter'
+)
+metrics.callback('bot_event_loop_lag_seconds', 'Задержка цикла событий', lambda: overload.loop_lag)
+metrics.callback('bot_degraded', 'Упрощенный режим из-за перегрузки (1 - включен)', lambda: int(overload.degraded))
+metrics.callback('bot_active_flows', 'Пользователи с активным сценарием', session_registry.active_flow_count)
+metrics.callback(
+    'bot_deepseek_breaker_state', 'Состояние предохранителя DeepSeek (1 - текущее)',
+    lambda: {state: int(ds_service.breaker.state == state) for state in ('closed', 'open', 'half_open')},
+    labelnames=('state',)
+)
+metrics.stats('bot_updates', update_order.stats, 'Очередь обновлений')
+metrics.stats('bot_overload', overload.stats, 'Контроль перегрузки')
+metrics.stats('bot_session_store', session_registry.stats, 'Хранилища сессий', label='store')
+metrics.stats('bot_deepseek_cache', lambda: ds_service.response_cache.stats() if ds_service.response_cache else {},
+              'Кэш ответов DeepSeek')
+metrics.stats('bot_deepseek_limiter', ds_service.limiter.stats, 'Ограничитель запросов DeepSeek')
+metrics.stats('bot_deepseek_breaker', ds_service.breaker.stats, 'Предохранитель DeepSeek')
+metrics.stats('bot_chat_recorder', chat_recorder.stats, 'Запись переписки в БД')
+metrics.stats('bot_send_scheduler', send_scheduler.stats, 'Планировщик отправки')
+metrics.stats('bot_order_lookup', order_lookup.stats, 'Снимок заказов')
+metrics.stats('bot_intent_classifier', lambda: intent_classifier.stats() if intent_classifier else {},
+              'Классификатор намерений')
+metrics.stats('bot_faq', lambda: faq_index.stats() if faq_index else {}, 'Поиск по FAQ')
+metrics.stats('bot_operator_notifier', lambda: operator_notifier.stats() if operator_notifier else {},
+              'Уведомления оператора')
+
 # Основная клавиатура
 def get_main_keyboard():
     return ReplyKeyboardMarkup(
@@ -1701,29 +1274,20 @@ def get_help_keyboard():
         input_field_placeholder="Выберите вопрос или напишите свой..."
     )
 
-async def call_operator(user: types.User, problem_description: str):
-    """Вызывает оператора - сообщение уходит ТОЛЬКО оператору, пользователь НЕ видит"""
-    try:
-        if OPERATOR_CHAT_ID is None:
-            logger.info("OPERATOR_CHAT_ID не установлен (режим тестирования) - оператор не уведомлен")
-            return
-            
-        operator_message = (
-            f"ТРЕБУЕТСЯ ОПЕРАТОР\n\n"
-            f"Клиент: {user.first_name} {user.last_name or ''} (@{user.username or 'нет'})\n"
-            f"ID: {user.id}\n"
-            f"Проблема: {problem_description}\n\n"
-            f"Время: {datetime.now().strftime('%H:%M %d.%m.%Y')}"
-        )
-        
-        await bot.send_message(
-            chat_id=OPERATOR_CHAT_ID,
-            text=operator_message
-        )
-        logger.info(f"Оператор уведомлен о клиенте {user.id}")
-        
-    except Exception as e:
-        logger.error(f"Ошибка при вызове оператора: {e}")
+def call_operator(user: types.User, problem_description: str):
+    """Вызывает оператора - сообщение уходит ТОЛЬКО оператору, пользователь НЕ видит.
+
+    Обращение ставится в очередь уведомлений: сводки, лимит частоты и дедупликация - там.
+    """
+    chat_recorder.record_handoff(user.id, problem_description)
+    operator_escalations.inc()
+    if operator_notifier is None:
+        logger.info("OPERATOR_CHAT_ID не установлен (режим тестирования) - оператор не уведомлен")
+        return
+
+    client = f"{user.first_name} {user.last_name or ''} (@{user.username or 'нет'})"
+    operator_notifier.submit(user.id, client, problem_description)
+    logger.info(f"Обращение клиента {user.id} поставлено в очередь оператора")
 
 @dp.message(Command("start"))
 async def start_command(message: types.Message):
@@ -1782,22 +1346,9 @@ async def about_bot(message: types.Message):
 async def restart_command(message: types.Message):
     """Обработчик команды /restart - перезапускает бота"""
     try:
-        # Очищаем все активные сессии пользователя
-        user_id = message.from_user.id
-        if payment_handler.has_active_session(user_id):
-            payment_handler.clear_session(user_id)
-        if refund_handler.has_active_session(user_id):
-            refund_handler.clear_session(user_id)
-        if email_change_handler.has_active_session(user_id):
-            email_change_handler.clear_session(user_id)
-        if partial_refund_handler.has_active_session(user_id):
-            partial_refund_handler.clear_session(user_id)
-        if wrong_event_handler.has_active_session(user_id):
-            wrong_event_handler.clear_session(user_id)
-        if operator_handler.has_active_session(user_id):
-            operator_handler.clear_session(user_id)
-        if ticket_recovery_handler.has_active_session(user_id):
-            ticket_recovery_handler.clear_session(user_id)
+        # Очищаем активный сценарий пользователя и историю диалога с DeepSeek
+        session_registry.clear_user(message.from_user.id)
+        ds_service.clear_user_context(message.from_user.id)
         
         restart_text = (
             "🔄 Бот перезапущен!\n\n"
@@ -1816,22 +1367,9 @@ async def restart_command(message: types.Message):
 async def restart_button(message: types.Message):
     """Обработчик кнопки перезапуска"""
     try:
-        # Очищаем все активные сессии пользователя
-        user_id = message.from_user.id
-        if payment_handler.has_active_session(user_id):
-            payment_handler.clear_session(user_id)
-        if refund_handler.has_active_session(user_id):
-            refund_handler.clear_session(user_id)
-        if email_change_handler.has_active_session(user_id):
-            email_change_handler.clear_session(user_id)
-        if partial_refund_handler.has_active_session(user_id):
-            partial_refund_handler.clear_session(user_id)
-        if wrong_event_handler.has_active_session(user_id):
-            wrong_event_handler.clear_session(user_id)
-        if operator_handler.has_active_session(user_id):
-            operator_handler.clear_session(user_id)
-        if ticket_recovery_handler.has_active_session(user_id):
-            ticket_recovery_handler.clear_session(user_id)
+        # Очищаем активный сценарий пользователя и историю диалога с DeepSeek
+        session_registry.clear_user(message.from_user.id)
+        ds_service.clear_user_context(message.from_user.id)
         
         restart_text = (
             "🔄 Бот перезапущен!\n\n"
@@ -1868,6 +1406,39 @@ async def operator_command(message: types.Message):
         logger.error(f"Ошибка в operator_command: {e}")
         await message.answer("Ошибка при вызове оператора. Попробуйте еще раз.")
 
+@dp.message(Command("profile"), F.chat.id == config.OPERATOR_CHAT_ID)
+async def profile_command(message: types.Message, command: CommandObject):
+    """Время по этапам обработки и выборочный профиль стеков - только в чате операторов.
+
+    /profile - сводка и файл стеков в формате collapsed (flamegraph.pl, speedscope), /profile reset - сброс.
+    """
+    try:
+        if command.args and command.args.strip() == 'reset':
+            if stack_sampler is not None:
+                stack_sampler.reset()
+            await message.answer("Профиль стеков сброшен", parse_mode=None)
+            return
+
+        lines = ["⏱ Этапы обработки (замеров, среднее):"]
+        lines.extend(f"• {stage}: {count}, {average:.1f} мс" for stage, count, average in stage_summary())
+        if stack_sampler is None:
+            lines.append("\nПрофилировщик выключен (PROFILE_SAMPLE_EVERY=0)")
+        else:
+            lines.append(
+                f"\n🔬 Профиль: {stack_sampler.profiled_updates} обновлений, {stack_sampler.samples} снимков стека"
+            )
+            lines.extend(f"• {name}: {count}" for name, count in stack_sampler.top())
+        # Имена функций вида <module> ломают HTML-разметку - отправляем простым текстом
+        await message.answer('\n'.join(lines)[:config.MAX_MESSAGE_LENGTH], parse_mode=None)
+
+        if stack_sampler is not None and stack_sampler.samples:
+            await message.answer_document(
+                BufferedInputFile(stack_sampler.collapsed().encode('utf-8'), filename='profile.collapsed.txt'),
+                caption="Стеки для flamegraph.pl / speedscope"
+            )
+    except Exception as e:
+        logger.error(f"Ошибка в profile_command: {e}", exc_info=True)
+
 @dp.message(F.text == "💳 Проблема с оплатой")
 async def payment_issue_button(message: types.Message):
     """Обработчик кнопки проблем с оплатой"""
@@ -1953,17 +1524,7 @@ async def tickets_not_received_main(message: types.Message):
 @dp.message(F.text == "🎫 Как купить билеты")
 async def how_to_buy_tickets_main(message: types.Message):
     """Обработчик кнопки 'Как купить билеты' в главном меню"""
-    response = (
-        "🎫 Как купить билеты:\n\n"
-        "1. Перейдите на официальный сайт наших партнеров (Театр Моссовета, Сфера и др.)\n"
-        "2. Выберите мероприятие и дату\n"
-        "3. Выберите места в зале\n"
-        "4. Заполните данные для получения билетов\n"
-        "5. Оплатите заказ картой или другим способом\n"
-        "6. Билеты придут на указанный email\n\n"
-        "Если возникли проблемы с оплатой или билеты не пришли - обращайтесь!"
-    )
-    await message.answer(response, reply_markup=get_main_keyboard())
+    await message.answer(HOW_TO_BUY_TEXT, reply_markup=get_main_keyboard())
 
 @dp.message(F.text == "🆘 Помощь")
 async def help_button(message: types.Message):
@@ -2042,6 +1603,238 @@ async def back_to_main(message: types.Message):
         logger.error(f"Ошибка в back_to_main: {e}")
         await message.answer("Произошла ошибка. Попробуйте еще раз.")
 
+async def handle_intent(message: types.Message, intent: str) -> bool:
+    """Отвечает на распознанное намерение. Возвращает True, если ответ отправлен"""
+    user_id = message.from_user.id
+    
+    # 10. Прощание и благодарность
+    if intent == 'farewell':
+        farewell_responses = [
+            "Хорошо! Если возникнут вопросы - обращайтесь! Хорошего дня! 👋",
+            "Понял! Буду рад помочь снова, если понадобится. Всего доброго! 😊",
+            "Ясно! Не стесняйтесь обращаться, если нужна помощь. До свидания! 👍",
+            "Окей! Желаю удачного дня! Если что-то понадобится - я здесь 🤗"
+        ]
+        response = random.choice(farewell_responses)
+        await message.answer(response, reply_markup=get_main_keyboard())
+        return True
+    
+    # 11. Положительные ответы
+    if intent == 'positive':
+        positive_responses = [
+            "Отлично! Чем еще могу помочь? Выберите действие или напишите вопрос! 😊",
+            "Рад помочь! Что вас интересует? Можете выбрать кнопку ниже или задать вопрос! 👍",
+            "Хорошо! Расскажите, с чем нужна помощь? Я здесь, чтобы помочь! 🤗",
+            "Отлично! Чем могу быть полезен? Выберите раздел или опишите проблему! 💫"
+        ]
+        response = random.choice(positive_responses)
+        await message.answer(response, reply_markup=get_main_keyboard())
+        return True
+    
+    # 12. Вопросы о покупке билетов
+    if intent == 'purchase':
+        await message.answer(HOW_TO_BUY_TEXT, reply_markup=get_main_keyboard())
+        return True
+    
+    # 13. Текстовые команды для оплаты
+    if intent == 'payment':
+        # Если нет активной сессии - создаем
+        if not payment_handler.has_active_session(user_id):
+            payment_handler.start_payment_session(user_id)
+        
+        # Сразу обрабатываем сообщение через payment_handler
+        payment_response = payment_handler.process_payment_message(user_id, message.text)
+        if payment_response:
+            await message.answer(payment_response, reply_markup=get_main_keyboard())
+            return True
+        else:
+            # Если обработчик не вернул ответ (не хватает данных), показываем стандартное сообщение
+            response = (
+                "💳 Проблема с оплатой\n\n"
+                "Чтобы мы могли помочь, опишите вашу проблему одним сообщением, указав:\n\n"
+                "• Номер заказа (6 цифр, например: 123456)\n\n"
+                "• Способ оплаты (карта/приложение/QR-код)\n\n"
+                "• Время оплаты (например: 30 минут назад, вчера, 25.12.2024)\n\n"
+                "• Описание проблемы:\n"
+                "- Деньги списались, статус заказа \"ожидает оплаты\"\n"
+                "- Двойное списание средств за один заказ.\n"
+                "- На email не пришел кассовый чек за оплаченный заказ\n"
+                "- Платеж не прошел, деньги вернулись на карту \n"
+                "- Не понятно, прошел ли платеж.\n"
+                "- Другое"
+            )
+            await message.answer(response, reply_markup=get_main_keyboard())
+            return True
+    
+    # 14. Вопросы о возврате билетов по тексту
+    if intent == 'refund':
+        refund_handler.start_refund_session(user_id)
+        response = (
+            "🔄 Возврат билетов\n\n"
+            "Для оформления возврата укажите, пожалуйста, номер вашего заказа (6 цифр).\n\n"
+            "Пример: 456321"
+        )
+        await message.answer(response, reply_markup=get_main_keyboard())
+        return True
+    
+    # 15. Покупка на другое мероприятие по ошибке
+    if intent == 'wrong_event':
+        logger.info(f"Обнаружен вопрос о покупке на другое мероприятие у пользователя {user_id}")
+        
+        # Начинаем сессию возврата ошибочных билетов
+        wrong_event_handler.start_wrong_event_session(user_id)
+        
+        response = (
+            "🔄 Покупка на другое мероприятие по ошибке\n\n"
+            "Понимаю ситуацию! Вот что можно сделать:\n\n"
+            "✅ Вариант 1 - Возврат и новая покупка:\n"
+            "1. Оформите возврат ошибочных билетов\n"
+            "2. Дождитесь подтверждения возврата\n"
+            "3. Купите билеты на нужное мероприятие\n\n"
+            "✅ Вариант 2 - Обмен через оператора:\n"
+            "• Подключу оператора для решения вопроса\n"
+            "• Возможен обмен на другое мероприятие\n"
+            "• При наличии свободных мест\n\n"
+            "Рекомендую оформить возврат:\n"
+            "• Укажите номер заказа (6 цифр)\n"
+            "• Затем укажите контактные данные\n\n"
+            "Пожалуйста, введите номер заказа:"
+        )
+        await message.answer(response, reply_markup=get_main_keyboard())
+        return True
+
+    # 16. Возврат одного билета
+    if intent == 'partial_refund':
+        logger.info(f"Обнаружен вопрос о возврате одного билета у пользователя {user_id}")
+        
+        # Начинаем сессию частичного возврата
+        partial_refund_handler.start_partial_refund_session(user_id)
+        
+        response = (
+            "🔄 Возврат одного билета из заказа\n\n"
+            "Да, можно вернуть только один билет из заказа!\n\n"
+            "Для оформления возврата укажите:\n\n"
+            "1️⃣ Номер заказа (6 цифр)\n"
+            "2️⃣ Номер или описание возвращаемого билета\n"
+            "3️⃣ Причину возврата\n\n"
+            "Пример:\n"
+            "Заказ 123456, билет 323243, по болезни\n\n"
+            "Пожалуйста, введите данные:"
+        )
+        await message.answer(response, reply_markup=get_main_keyboard())
+        return True
+
+    # 17. Смена email
+    if intent == 'email_change':
+        logger.info(f"Обнаружен вопрос о смене email у пользователя {user_id}")
+        
+        # Начинаем сессию смены email
+        email_change_handler.start_email_change_session(user_id)
+        
+        response = (
+            "📧 Изменение email для получения билетов\n\n"
+            "Да, можно изменить email!\n\n"
+            "Для смены email укажите:\n\n"
+            "1️⃣ Номер заказа (6 цифр)\n"
+            "2️⃣ Новый email адрес\n\n"
+            "Пример:\n"
+            "Заказ 123456, новый email example@mail.ru\n\n"
+            "Пожалуйста, введите номер заказа:"
+        )
+        await message.answer(response, reply_markup=get_main_keyboard())
+        return True
+
+    # 18. Проблемы с билетами (не пришли, восстановить)
+    if intent == 'ticket_problem':
+        # Начинаем сессию восстановления билетов
+        ticket_recovery_handler.start_recovery_session(user_id)
+        
+        response = (
+            "📧 Проблемы с билетами\n\n"
+            "🔍 Сначала попробуйте восстановить билеты самостоятельно:\n"
+            "1. Зайдите на сайт Intickets.ru\n"
+            "2. Перейдите во вкладку Для зрителей\n"
+            "3. Воспользуйтесь сервисом восстановления билетов\n\n"
+            "---\n\n"
+            "🔄 Если не получилось восстановить билеты:\n"
+            "Для повторной отправки билетов укажите:\n\n"
+            "• Номер заказа (6 цифр) ИЛИ\n"
+            "• Номер телефона, который использовали при заказе ИЛИ\n"
+            "• Email, на который покупали билеты\n\n"
+            "✅ Пример номера заказа: 123456\n"
+            "✅ Пример телефона: +7 (912) 345-67-89\n"
+            "✅ Пример email: example@mail.ru\n\n"
+            "Билеты будут отправлены повторно в течение 15 минут!"
+        )
+        await message.answer(response, reply_markup=get_main_keyboard())
+        return True
+
+    # 19. Проблемы с оплатой по тексту (даже без нажатия кнопки)
+    if intent == 'payment_problem':
+        # Если это похоже на проблему с оплатой, обрабатываем через payment_handler
+        # Сначала проверяем, есть ли активная сессия
+        if not payment_handler.has_active_session(user_id):
+            payment_handler.start_payment_session(user_id)
+        
+        payment_response = payment_handler.process_payment_message(user_id, message.text)
+        if payment_response:
+            await message.answer(payment_response, reply_markup=get_main_keyboard())
+            return True
+
+    # 20. Номер заказа для проверки билетов
+    if intent == 'order_number':
+        order_number = find_order_number(message.text)
+        logger.info(f"Найден номер заказа: {order_number}")
+        
+        # Используем OrderResponseManager для проверки статуса заказа
+        response = order_manager.get_order_status_response(order_number)
+        await message.answer(response, reply_markup=get_main_keyboard())
+        return True
+    
+    # 21. Введен только номер заказа без дополнительного текста - уточняем
+    if intent == 'order_number_only':
+        response = (
+            f"🔍 Вижу, что вы ввели номер заказа: {message.text}\n\n"
+            "Что именно вас интересует?\n\n"
+            "• Проверить статус заказа\n" 
+            "• Проблема с билетами\n"
+            "• Вопрос по оплате\n"
+            "• Возврат билетов\n\n"
+            "Опишите, пожалуйста, вашу проблему подробнее, чтобы я мог помочь эффективнее."
+        )
+        await message.answer(response, reply_markup=get_main_keyboard())
+        return True
+
+    return False
+
+# Счетчики шагов каскада handle_all_messages: метки регистрируются заранее, на горячем пути только inc()
+cascade_total = metrics.counter(
+    'bot_cascade_total', 'Сообщения по шагу каскада, на котором они получили ответ', ('stage',)
+)
+CASCADE = {
+    stage: cascade_total.labels(stage)
+    for stage in ('flow', 'thanks', 'dissatisfaction', 'need_help', 'degraded', 'faq', 'deepseek', 'fallback')
+}
+intent_total = metrics.counter(
+    'bot_intent_total', 'Намерения, переданные сценариям, по источнику распознавания', ('source', 'intent')
+)
+INTENT_COUNTERS = {
+    (source, name): intent_total.labels(source, name)
+    for source in ('router', 'typo', 'classifier') for name, _, _ in INTENT_TABLE
+}
+
+# Меню вместо ответа DeepSeek: сервис недоступен или бот перегружен
+FALLBACK_MENU_TEXT = (
+    "🤔 Не совсем понял ваш вопрос. Чем могу помочь?\n\n"
+    "Выберите один из вариантов:\n\n"
+    "💳 **Проблема с оплатой** - помощь с платежами и возвратами\n"
+    "📧 **Билеты не пришли** - восстановление и повторная отправка\n"
+    "🔄 **Возврат билетов** - оформление возврата\n"
+    "🎫 **Как купить билеты** - инструкция по покупке\n"
+    "📞 **Оператор** - связь со специалистом\n\n"
+    "Или просто опишите вашу проблему подробнее!"
+)
+
 @dp.message()
 async def handle_all_messages(message: types.Message):
     """Обработчик всех остальных сообщений (текст от пользователя)"""
@@ -2050,21 +1843,20 @@ async def handle_all_messages(message: types.Message):
         
         user_id = message.from_user.id
         message_text = message.text.lower()
-        
-        # 0. Сначала проверяем активные сессии вызова оператора (ВЫСШИЙ ПРИОРИТЕТ)
-        if operator_handler.has_active_session(user_id):
-            operator_response = operator_handler.process_operator_message(user_id, message.text)
-            if operator_response:
-                await message.answer(operator_response, reply_markup=get_main_keyboard())
-                return
-
-        # 1. Проверяем активные сессии восстановления билетов
-        if ticket_recovery_handler.has_active_session(user_id):
-            recovery_response = ticket_recovery_handler.process_recovery_message(user_id, message.text)
-            if recovery_response:
-                await message.answer(recovery_response, reply_markup=get_main_keyboard())
+        # При перегрузке - только сценарии, ключевые слова и меню
+        degraded = overload.degraded
+        
+        # 0-6. Активный сценарий пользователя: одна проверка индекса вместо опроса всех обработчиков
+        with span('flow'):
+            active_flow = session_registry.active_flow(user_id)
+            flow_response = FLOW_PROCESSORS[active_flow](user_id, message.text) if active_flow is not None else None
+        if active_flow is not None:
+            if flow_response:
+                CASCADE['flow'].inc()
+                await message.answer(flow_response, reply_markup=get_main_keyboard())
                 return
-            else:
+            
+            if active_flow == 'ticket_recovery':
                 # Если в сессии восстановления не распознаны данные, просим уточнить
                 response = (
                     "Не удалось распознать контактные данные. Пожалуйста, укажите:\n\n"
@@ -2073,49 +1865,18 @@ async def handle_all_messages(message: types.Message):
                     "• Email\n\n"
                     "Пример: 123456, +79123456789 или example@mail.ru"
                 )
+                CASCADE['flow'].inc()
                 await message.answer(response, reply_markup=get_main_keyboard())
                 return
-
-        # 2. Проверяем активные сессии возврата ошибочных билетов
-        if wrong_event_handler.has_active_session(user_id):
-            wrong_event_response = wrong_event_handler.process_wrong_event_message(user_id, message.text)
-            if wrong_event_response:
-                await message.answer(wrong_event_response, reply_markup=get_main_keyboard())
-                return
-
-        # 3. Проверяем активные сессии смены email
-        if email_change_handler.has_active_session(user_id):
-            email_response = email_change_handler.process_email_change_message(user_id, message.text)
-            if email_response:
-                await message.answer(email_response, reply_markup=get_main_keyboard())
-                return
-
-        # 4. Проверяем активные сессии частичного возврата
-        if partial_refund_handler.has_active_session(user_id):
-            partial_refund_response = partial_refund_handler.process_partial_refund_message(user_id, message.text)
-            if partial_refund_response:
-                await message.answer(partial_refund_response, reply_markup=get_main_keyboard())
-                return
-
-        # 5. Проверяем активные сессии возвратов
-        if refund_handler.has_active_session(user_id):
-            refund_response = refund_handler.process_refund_message(user_id, message.text)
-            if refund_response:
-                await message.answer(refund_response, reply_markup=get_main_keyboard())
-                return
         
-        # 6. Проверяем активные сессии оплаты
-        if payment_handler.has_active_session(user_id):
-            payment_response = payment_handler.process_payment_message(user_id, message.text)
-            if payment_response:
-                await message.answer(payment_response, reply_markup=get_main_keyboard())
-                return
-        
-        # Показываем "печатает"
-        await message.bot.send_chat_action(chat_id=message.chat.id, action="typing")
+        # Показываем "печатает" (при перегрузке не тратим на это лимит запросов)
+        if not degraded:
+            await message.bot.send_chat_action(chat_id=message.chat.id, action="typing")
         
         # 7. Проверяем благодарности и положительные отзывы (ВЫСОКИЙ ПРИОРИТЕТ)
-        if detect_thanks_and_praise(message.text):
+        with span('detectors'):
+            is_thanks = detect_thanks_and_praise(message.text)
+        if is_thanks:
             logger.info(f"Обнаружена благодарность у пользователя {user_id}")
             thanks_responses = [
                 "Ого, спасибо за такие теплые слова! 😊 Очень приятно слышать! Рад, что смог помочь!",
@@ -2130,21 +1891,27 @@ async def handle_all_messages(message: types.Message):
                 "Вау, я растроган! Спасибо за такие слова! 🥰 Буду и дальше помогать!"
             ]
             response = random.choice(thanks_responses)
+            CASCADE['thanks'].inc()
             await message.answer(response, reply_markup=get_main_keyboard())
             return
         
         # 8. Проверяем недовольство
-        if detect_dissatisfaction_improved(message.text):
+        with span('detectors'):
+            is_dissatisfied = detect_dissatisfaction_improved(message.text)
+        if is_dissatisfied:
             logger.info(f"Обнаружено недовольство у пользователя {user_id}")
             response = "Понимаю ваше недовольство. Сейчас подключу оператора для решения вопроса!"
+            CASCADE['dissatisfaction'].inc()
             await message.answer(response, reply_markup=get_main_keyboard())
             
             if OPERATOR_CHAT_ID is not None:
-                asyncio.create_task(call_operator(message.from_user, f"Недовольство: {message.text}"))
+                call_operator(message.from_user, f"Недовольство: {message.text}")
             return
         
         # 9. Проверяем, что пользователь не может разобраться сам
-        if detect_need_help(message.text):
+        with span('detectors'):
+            needs_help = detect_need_help(message.text)
+        if needs_help:
             logger.info(f"Пользователь {user_id} не может разобраться сам - подключаем оператора")
             response = (
                 "Понимаю, что вам сложно разобраться самостоятельно!\n\n"
@@ -2152,293 +1919,142 @@ async def handle_all_messages(message: types.Message):
                 "⏰ Ожидайте ответа в течение 2-5 минут\n\n"
                 "Оператор поможет разобраться с вашей проблемой и найдет решение!"
             )
+            CASCADE['need_help'].inc()
             await message.answer(response, reply_markup=get_main_keyboard())
             
             if OPERATOR_CHAT_ID is not None:
-                asyncio.create_task(call_operator(message.from_user, f"Не может разобраться: {message.text}"))
+                call_operator(message.from_user, f"Не может разобраться: {message.text}")
             return
         
-        # 10. Проверяем прощание и благодарность
-        farewell_words = ['нет', 'нет спасибо', 'не надо', 'всё', 'всего хорошего', 
-                         'пока', 'до свидания', 'спасибо нет', 'не нужно', 'закончили']
-        if message_text in farewell_words:
-            farewell_responses = [
-                "Хорошо! Если возникнут вопросы - обращайтесь! Хорошего дня! 👋",
-                "Понял! Буду рад помочь снова, если понадобится. Всего доброго! 😊",
-                "Ясно! Не стесняйтесь обращаться, если нужна помощь. До свидания! 👍",
-                "Окей! Желаю удачного дня! Если что-то понадобится - я здесь 🤗"
-            ]
-            response = random.choice(farewell_responses)
-            await message.answer(response, reply_markup=get_main_keyboard())
-            return
-        
-        # 11. Проверяем положительные ответы
-        positive_words = ['да', 'давай', 'конечно', 'хочу', 'нужно', 'помоги', 'помощь нужна']
-        if message_text in positive_words:
-            positive_responses = [
-                "Отлично! Чем еще могу помочь? Выберите действие или напишите вопрос! 😊",
-                "Рад помочь! Что вас интересует? Можете выбрать кнопку ниже или задать вопрос! 👍",
-                "Хорошо! Расскажите, с чем нужна помощь? Я здесь, чтобы помочь! 🤗",
-                "Отлично! Чем могу быть полезен? Выберите раздел или опишите проблему! 💫"
-            ]
-            response = random.choice(positive_responses)
-            await message.answer(response, reply_markup=get_main_keyboard())
-            return
-        
-        # 12. Проверяем вопросы о покупке билетов
-        purchase_patterns = [
-            'как купить', 'как приобрести', 'инструкция покупки', 'как оформить заказ',
-            'хочу купить', 'хочу приобрести', 'купить билет', 'приобрести билет',
-            'как заказать', 'как сделать заказ', 'как оплатить билет', 'процесс покупки',
-            'инструкция по покупке', 'как получить билет', 'как оформить билет'
-        ]
-
-        if any(phrase in message_text for phrase in purchase_patterns):
-            response = (
-                "🎫 Как купить билеты:\n\n"
-                "1. Перейдите на официальный сайт наших партнеров (Театр Моссовета, Сфера и др.)\n"
-                "2. Выберите мероприятие и дату\n"
-                "3. Выберите места в зале\n"
-                "4. Заполните данные для получения билетов\n"
-                "5. Оплатите заказ картой или другим способом\n"
-                "6. Билеты придут на указанный email\n\n"
-                "Если возникли проблемы с оплата или билеты не пришли - обращайтесь!"
-            )
-            await message.answer(response, reply_markup=get_main_keyboard())
-            return
-        
-        # 13. Проверяем текстовые команды для оплаты - ИСПРАВЛЕННЫЙ ВАРИАНТ
-        payment_keywords = ['оплат', 'платеж', 'деньги', 'карт', 'приложен', 'qr', 'чек', 'списались']
-        if any(keyword in message_text for keyword in payment_keywords):
-            # Если нет активной сессии - создаем
-            if not payment_handler.has_active_session(user_id):
-                payment_handler.start_payment_session(user_id)
-            
-            # Сразу обрабатываем сообщение через payment_handler
-            payment_response = payment_handler.process_payment_message(user_id, message.text)
-            if payment_response:
-                await message.answer(payment_response, reply_markup=get_main_keyboard())
-                return
-            else:
-                # Если обработчик не вернул ответ (не хватает данных), показываем стандартное сообщение
-                response = (
-                    "💳 Проблема с оплатой\n\n"
-                    "Чтобы мы могли помочь, опишите вашу проблему одним сообщением, указав:\n\n"
-                    "• Номер заказа (6 цифр, например: 123456)\n\n"
-                    "• Способ оплаты (карта/приложение/QR-код)\n\n"
-                    "• Время оплаты (например: 30 минут назад, вчера, 25.12.2024)\n\n"
-                    "• Описание проблемы:\n"
-                    "- Деньги списались, статус заказа \"ожидает оплаты\"\n"
-                    "- Двойное списание средств за один заказ.\n"
-                    "- На email не пришел кассовый чек за оплаченный заказ\n"
-                    "- Платеж не прошел, деньги вернулись на карту \n"
-                    "- Не понятно, прошел ли платеж.\n"
-                    "- Другое"
-                )
-                await message.answer(response, reply_markup=get_main_keyboard())
+        # 10-21. Ключевые слова и шаблоны: один проход скомпилированного маршрутизатора,
+        # намерения перебираются в порядке приоритета, как в прежнем каскаде
+        with span('router'):
+            intents = intent_router.match(message_text)
+            source = 'router'
+            if not intents:
+                # Ничего не распознано - пробуем исправить опечатки по словарю правил, прежде чем звать DeepSeek.
+                # Берутся только намерения, совпадение которых задевает исправленное слово
+                intents, corrected_text = intent_router.match_corrected(message_text)
+                if intents:
+                    source = 'typo'
+                    logger.info(f"Исправлены опечатки: '{message_text}' -> '{corrected_text}'")
+        for intent in intents:
+            if await handle_intent(message, intent):
+                INTENT_COUNTERS[source, intent].inc()
                 return
         
-        # 14. Проверяем вопросы о возврате билетов по тексту
-        if any(phrase in message_text for phrase in ['возврат', 'вернуть', 'вернул']):
-            refund_handler.start_refund_session(user_id)
-            response = (
-                "🔄 Возврат билетов\n\n"
-                "Для оформления возврата укажите, пожалуйста, номер вашего заказа (6 цифр).\n\n"
-                "Пример: 456321"
-            )
-            await message.answer(response, reply_markup=get_main_keyboard())
-            return
-        
-        # 15. Проверяем вопросы о покупке на другое мероприятие по ошибке
-        if any(phrase in message_text for phrase in ['купил по ошибке', 'не то мероприятие', 'ошибочно купил', 
-                                                   'неправильно выбрал', 'перепутал мероприятие', 
-                                                   'другое мероприятие по ошибке']):
-            logger.info(f"Обнаружен вопрос о покупке на другое мероприятие у пользователя {user_id}")
-            
-            # Начинаем сессию возврата ошибочных билетов
-            wrong_event_handler.start_wrong_event_session(user_id)
-            
-            response = (
-                "🔄 Покупка на другое мероприятие по ошибке\n\n"
-                "Понимаю ситуацию! Вот что можно сделать:\n\n"
-                "✅ Вариант 1 - Возврат и новая покупка:\n"
-                "1. Оформите возврат ошибочных билетов\n"
-                "2. Дождитесь подтверждения возврата\n"
-                "3. Купите билеты на нужное мероприятие\n\n"
-                "✅ Вариант 2 - Обмен через оператора:\n"
-                "• Подключу оператора для решения вопроса\n"
-                "• Возможен обмен на другое мероприятие\n"
-                "• При наличии свободных мест\n\n"
-                "Рекомендую оформить возврат:\n"
-                "• Укажите номер заказа (6 цифр)\n"
-                "• Затем укажите контактные данные\n\n"
-                "Пожалуйста, введите номер заказа:"
-            )
-            await message.answer(response, reply_markup=get_main_keyboard())
-            return
-
-        # 16. Проверяем вопросы о возврате одного билета
-        if any(phrase in message_text for phrase in ['вернуть один билет', 'только один билет', 'один из заказа', 
-                                                   'частичный возврат', 'не все билеты']):
-            logger.info(f"Обнаружен вопрос о возврате одного билета у пользователя {user_id}")
-            
-            # Начинаем сессию частичного возврата
-            partial_refund_handler.start_partial_refund_session(user_id)
-            
-            response = (
-                "🔄 Возврат одного билета из заказа\n\n"
-                "Да, можно вернуть только один билет из заказа!\n\n"
-                "Для оформления возврата укажите:\n\n"
-                "1️⃣ Номер заказа (6 цифр)\n"
-                "2️⃣ Номер или описание возвращаемого билета\n"
-                "3️⃣ Причину возврата\n\n"
-                "Пример:\n"
-                "Заказ 123456, билет 323243, по болезни\n\n"
-                "Пожалуйста, введите данные:"
-            )
-            await message.answer(response, reply_markup=get_main_keyboard())
-            return
-
-        # 17. Проверяем вопросы о смене email
-        if any(phrase in message_text for phrase in ['изменить email', 'поменять email', 'сменить почту', 
-                                                   'другой email', 'неправильный email']):
-            logger.info(f"Обнаружен вопрос о смене email у пользователя {user_id}")
-            
-            # Начинаем сессию смены email
-            email_change_handler.start_email_change_session(user_id)
-            
-            response = (
-                "📧 Изменение email для получения билетов\n\n"
-                "Да, можно изменить email!\n\n"
-                "Для смены email укажите:\n\n"
-                "1️⃣ Номер заказа (6 цифр)\n"
-                "2️⃣ Новый email адрес\n\n"
-                "Пример:\n"
-                "Заказ 123456, новый email example@mail.ru\n\n"
-                "Пожалуйста, введите номер заказа:"
-            )
-            await message.answer(response, reply_markup=get_main_keyboard())
-            return
-
-        # 18. Проверяем проблемы с билетами (объединенная логика) - РАСШИРЕННЫЙ ПОИСК
-        ticket_problem_patterns = [
-            r'не\s*пришли',
-            r'не\s*пришёл',
-            r'не\s*пришел',
-            r'не\s*получил',
-            r'не\s*получили',
-            r'не\s*поступал',
-            r'нет\s*билет',
-            r'билеты\s*не',
-            r'не\s*приходят',
-            r'не\s*дошли',
-            r'письмо\s*не',
-            r'восстановить',
-            r'нет билетов'
-        ]
-        
-        message_lower = message.text.lower()
-        if any(re.search(pattern, message_lower) for pattern in ticket_problem_patterns):
-            # Начинаем сессию восстановления билетов
-            ticket_recovery_handler.start_recovery_session(user_id)
-            
-            response = (
-                "📧 Проблемы с билетами\n\n"
-                "🔍 Сначала попробуйте восстановить билеты самостоятельно:\n"
-                "1. Зайдите на сайт Intickets.ru\n"
-                "2. Перейдите во вкладку Для зрителей\n"
-                "3. Воспользуйтесь сервисом восстановления билетов\n\n"
-                "---\n\n"
-                "🔄 Если не получилось восстановить билеты:\n"
-                "Для повторной отправки билетов укажите:\n\n"
-                "• Номер заказа (6 цифр) ИЛИ\n"
-                "• Номер телефона, который использовали при заказе ИЛИ\n"
-                "• Email, на который покупали билеты\n\n"
-                "✅ Пример номера заказа: 123456\n"
-                "✅ Пример телефона: +7 (912) 345-67-89\n"
-                "✅ Пример email: example@mail.ru\n\n"
-                "Билеты будут отправлены повторно в течение 15 минут!"
-            )
-            await message.answer(response, reply_markup=get_main_keyboard())
+        if degraded:
+            # Классификатор, поиск по FAQ и DeepSeek пропускаем - сразу меню
+            overload.shed()
+            CASCADE['degraded'].inc()
+            await message.answer(FALLBACK_MENU_TEXT, reply_markup=get_main_keyboard())
             return
-
-        # 19. Проверяем проблемы с оплатой по тексту (даже без нажатия кнопки)
-        payment_problem_patterns = [
-            r'\b\d{6}\b.*(?:плат[её]ж|оплат|деньги|списались|карт|приложен|qr|код)',
-            r'(?:плат[её]ж|оплат).*\b\d{6}\b',
-            r'деньги.*списались',
-            r'чек.*не.*пришел',
-            r'двойн.*списан',
-            r'статус.*ожидает.*оплат',
-            r'платеж.*не.*прошел',
-            r'деньги.*вернулись'
-        ]
         
-        message_lower = message.text.lower()
-        if any(re.search(pattern, message_lower) for pattern in payment_problem_patterns):
-            # Если это похоже на проблему с оплатой, обрабатываем через payment_handler
-            # Сначала проверяем, есть ли активная сессия
-            if not payment_handler.has_active_session(user_id):
-                payment_handler.start_payment_session(user_id)
-            
-            payment_response = payment_handler.process_payment_message(user_id, message.text)
-            if payment_response:
-                await message.answer(payment_response, reply_markup=get_main_keyboard())
+        # Правила не сработали - уверенное предсказание локального классификатора обходится без DeepSeek
+        if intent_classifier is not None:
+            with span('classifier'):
+                prediction = intent_classifier.predict(message_text)
+            if prediction is not None:
+                intent, confidence = prediction
+                logger.info(f"Классификатор определил намерение '{intent}' ({confidence:.2f}) у пользователя {user_id}")
+                if await handle_intent(message, intent):
+                    INTENT_COUNTERS['classifier', intent].inc()
+                    return
+        
+        # Частый вопрос: близкий по смыслу отвечается из FAQ, иначе ближайшие ответы идут в DeepSeek справкой
+        reference = None
+        if faq_index is not None:
+            with span('faq'):
+                faq_answer = faq_index.answer(message_text)
+                if faq_answer is None:
+                    reference = faq_index.context(message_text, config.FAQ_CONTEXT_TOP_K) or None
+            if faq_answer is not None:
+                CASCADE['faq'].inc()
+                logger.info(f"Ответ из FAQ для пользователя {user_id}")
+                await message.answer(faq_answer, reply_markup=get_main_keyboard())
                 return
-
-        # 20. Проверяем номер заказа для проверки билетов - ПЕРЕМЕЩЕНО НИЖЕ ПРОБЛЕМ С БИЛЕТАМИ
-        # Сначала проверяем контекст, потом номер заказа
-        order_match = re.search(r'\b(\d{6})\b', message.text)
-        if order_match:
-            order_number = order_match.group(1)
-            logger.info(f"Найден номер заказа: {order_number}")
-            
-            # Используем OrderResponseManager для проверки статуса заказа
-            response = order_manager.get_order_status_response(order_number)
-            await message.answer(response, reply_markup=get_main_keyboard())
-            return
-        
-        # 21. Если введен только номер заказа без дополнительного текста - уточняем
-        if re.match(r'^\d{6}$', message.text.strip()):
-            response = (
-                f"🔍 Вижу, что вы ввели номер заказа: {message.text}\n\n"
-                "Что именно вас интересует?\n\n"
-                "• Проверить статус заказа\n" 
-                "• Проблема с билетами\n"
-                "• Вопрос по оплате\n"
-                "• Возврат билетов\n\n"
-                "Опишите, пожалуйста, вашу проблему подробнее, чтобы я мог помочь эффективнее."
-            )
-            await message.answer(response, reply_markup=get_main_keyboard())
-            return
         
         # 22. Если ничего не распознано - используем DeepSeek для обработки опечаток и сложных запросов
         try:
             logger.info(f"Использую DeepSeek для обработки сообщения с опечатками: {message.text}")
-            ai_response = await ds_service.process_message(message.text)
-            await message.answer(ai_response, reply_markup=get_main_keyboard())
+            if config.DEEPSEEK_STREAMING:
+                # Ответ появляется после первого предложения и дописывается правками
+                # (правки сообщения попадают и в этап deepseek, и в telegram.EditMessageText)
+                with span('deepseek'):
+                    ai_response = await send_streaming_reply(
+                        message,
+                        ds_service.stream_message(message.text, user_id, reference=reference),
+                        edit_interval=config.STREAM_EDIT_INTERVAL,
+                        max_length=config.MAX_MESSAGE_LENGTH,
+                        reply_markup=get_main_keyboard()
+                    )
+                if ai_response is None:
+                    raise RuntimeError("DeepSeek не вернул ответ")
+            else:
+                with span('deepseek'):
+                    ai_response = await ds_service.process_message(message.text, user_id, reference=reference)
+                await message.answer(ai_response, reply_markup=get_main_keyboard())
+            CASCADE['deepseek'].inc()
         except Exception as e:
             logger.error(f"Ошибка DeepSeek: {e}")
             # Если DeepSeek недоступен, показываем стандартное сообщение
-            response = (
-                "🤔 Не совсем понял ваш вопрос. Чем могу помочь?\n\n"
-                "Выберите один из вариантов:\n\n"
-                "💳 **Проблема с оплатой** - помощь с платежами и возвратами\n"
-                "📧 **Билеты не пришли** - восстановление и повторная отправка\n"
-                "🔄 **Возврат билетов** - оформление возврата\n"
-                "🎫 **Как купить билеты** - инструкция по покупке\n"
-                "📞 **Оператор** - связь со специалистом\n\n"
-                "Или просто опишите вашу проблему подробнее!"
-            )
-            await message.answer(response, reply_markup=get_main_keyboard())
+            CASCADE['fallback'].inc()
+            await message.answer(FALLBACK_MENU_TEXT, reply_markup=get_main_keyboard())
             
     except Exception as e:
         logger.error(f"Ошибка обработки сообщения: {e}", exc_info=True)
         await message.answer("Произошла ошибка. Попробуйте еще раз или используйте кнопки ниже.", 
                            reply_markup=get_main_keyboard())
 
-async def main():
+async def run_polling():
+    """Получение обновлений через long polling"""
+    await bot.delete_webhook(drop_pending_updates=True)
+    logger.info("Вебхуки очищены")
+
+    logger.info("Бот запущен и готов к работе (polling)!")
+    await dp.start_polling(bot)
+
+def create_webhook_app(secret_token: str, path: str) -> web.Application:
+    """aiohttp-приложение, принимающее обновления от Telegram на path"""
+    app = web.Application()
+    # Проверяет заголовок X-Telegram-Bot-Api-Secret-Token и сразу отвечает Telegram,
+    # обработка обновления идет в фоне
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret_token
+    ).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+async def run_webhook():
+    """Получение обновлений через вебхук на aiohttp-сервере"""
+    config.validate_webhook()
+
+    app = create_webhook_app(config.WEBHOOK_SECRET, config.WEBHOOK_PATH)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Сервер вебхука слушает {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+
+    try:
+        # Вебхук регистрируется после старта сервера; накопившиеся за перезапуск обновления сохраняются
+        await bot.set_webhook(
+            url=f"{config.WEBHOOK_URL}{config.WEBHOOK_PATH}",
+            secret_token=config.WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=False
+        )
+        logger.info("Бот запущен и готов к работе (webhook)!")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+async def main(mode: str = 'polling'):
     """Основная функция"""
+    global intent_classifier, faq_index
+    metrics_runner = None
     logger.info("=" * 50)
     logger.info("ЗАПУСК БОТА INTICKETS SUPPORT")
     logger.info("=" * 50)
@@ -2448,23 +2064,97 @@ async def main():
             async with engine.begin() as conn:
                 await conn.run_sync(Base.metadata.create_all)
             logger.info("База данных инициализирована")
+            chat_recorder.start()
         except Exception as db_error:
             logger.warning(f"Ошибка инициализации БД (бот продолжает работу): {db_error}")
-        
-        await bot.delete_webhook(drop_pending_updates=True)
-        logger.info("Вебхуки очищены")
-        
-        logger.info("Бот запущен и готов к работе!")
-        await dp.start_polling(bot)
-        
+
+        try:
+            await asyncio.to_thread(order_lookup.reload)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки снимка заказов: {e}")
+
+        if config.INTENT_CLASSIFIER_ENABLED:
+            if not numpy_available():
+                logger.warning("numpy не установлен - классификатор намерений отключен")
+            else:
+                try:
+                    intent_classifier = await build_classifier(
+                        async_session, config.INTENT_MODEL_PATH, threshold=config.INTENT_CLASSIFIER_THRESHOLD
+                    )
+                except Exception as e:
+                    logger.error(f"Ошибка подготовки классификатора намерений: {e}")
+
+        if config.FAQ_ENABLED:
+            if not numpy_available():
+                logger.warning("numpy не установлен - поиск по FAQ отключен")
+            else:
+                try:
+                    faq_index = await asyncio.to_thread(
+                        FaqIndex.load_or_build, config.FAQ_INDEX_PATH,
+                        answer_threshold=config.FAQ_ANSWER_THRESHOLD, context_min_score=config.FAQ_CONTEXT_MIN_SCORE
+                    )
+                except Exception as e:
+                    logger.error(f"Ошибка подготовки индекса FAQ: {e}")
+
+        # Общий пул соединений к DeepSeek на все время работы бота
+        await ds_service.start()
+
+        # Фоновая очистка просроченных сессий вместо проверок на каждом запросе
+        session_registry.start_sweeper(config.SESSION_SWEEP_INTERVAL)
+
+        overload.start(config.OVERLOAD_CHECK_INTERVAL)
+
+        if config.METRICS_ENABLED:
+            try:
+                metrics_runner = await metrics.start_server(config.METRICS_HOST, config.METRICS_PORT, config.METRICS_PATH)
+            except OSError as e:
+                logger.error(f"Не удалось запустить сервер метрик: {e}")
+
+        if operator_notifier is not None:
+            operator_notifier.start()
+
+        if mode == 'webhook':
+            await run_webhook()
+        else:
+            await run_polling()
+
     except Exception as e:
         logger.error(f"Ошибка запуска: {e}")
         raise
+    finally:
+        if intent_classifier is not None:
+            logger.info(f"Классификатор намерений: {intent_classifier.stats()}")
+        if faq_index is not None:
+            logger.info(f"Поиск по FAQ: {faq_index.stats()}")
+        if operator_notifier is not None:
+            await operator_notifier.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await overload.stop()
+        if stack_sampler is not None:
+            stack_sampler.stop()
+        logger.info(f"Контроль перегрузки: {overload.stats()}")
+        await session_registry.stop_sweeper()
+        await session_registry.close_backend()
+        # Сбрасываем в БД все накопленные записи переписки до закрытия соединений
+        await chat_recorder.stop()
+        await engine.dispose()
+        await ds_service.close()
+        await bot.session.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бот поддержки Intickets")
+    parser.add_argument(
+        '--mode',
+        choices=['polling', 'webhook'],
+        default=config.BOT_MODE if config.BOT_MODE in ('polling', 'webhook') else 'polling',
+        help="Способ получения обновлений (по умолчанию из BOT_MODE или polling)"
+    )
+    args = parser.parse_args()
+
     try:
-        asyncio.run(main())
+        asyncio.run(main(args.mode))
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем")
     except Exception as e:
-        logger.error(f"Критическая ошибка: {e}")
\ No newline at end of file
+        logger.error(f"Критическая ошибка: {e}")
\ No newline at end of file
@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, Optional
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import EditMessageText, Response, SendMessage, TelegramMethod
+from aiogram.types import TelegramObject
+
+from services.chat_recorder import ChatRecorder
+from services.metrics import Counter
+from services.tracing import UPDATE_SECONDS, StackSampler, Trace, current_trace, new_trace_id, record_stage
+from services.session_store import SessionRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class TraceMiddleware(BaseMiddleware):
+    """Трасса обновления: trace_id для логов, время по этапам, выборочный профиль стеков.
+
+    Регистрируется первым внешним middleware обновлений, поэтому полное время включает
+    ожидание в очереди пользователя. Медленные обновления пишутся в лог с разбивкой по этапам.
+    """
+
+    def __init__(self, slow_threshold: float, sampler: Optional[StackSampler] = None):
+        self.slow_threshold = slow_threshold
+        self.sampler = sampler
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        profiled = self.sampler is not None and self.sampler.should_profile()
+        trace = Trace(new_trace_id(), profiled=profiled)
+        token = current_trace.set(trace)
+        if profiled:
+            self.sampler.begin()
+        try:
+            return await handler(event, data)
+        finally:
+            if profiled:
+                self.sampler.end()
+            duration = time.perf_counter() - trace.started
+            UPDATE_SECONDS.observe(duration)
+            if duration >= self.slow_threshold:
+                logger.warning(f"Медленное обновление: {duration * 1000:.0f} мс ({trace.summary() or 'без этапов'})")
+            current_trace.reset(token)
+
+
+class UserOrderMiddleware(BaseMiddleware):
+    """Обновления одного пользователя обрабатываются строго по очереди, разных - параллельно.
+
+    aiogram запускает каждое обновление отдельной задачей, и два быстрых сообщения одного
+    пользователя могли одновременно менять его сессию. Здесь у пользователя есть очередь
+    ожидающих обновлений (удаляется, когда он простаивает), а общее число выполняемых
+    обработчиков ограничено max_concurrency.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Пользователь с обновлением в работе -> ожидающие своей очереди обновления
+        self._mailboxes: Dict[int, Deque[asyncio.Future]] = {}
+        self._in_flight = 0
+        self._waiting = 0
+        self.processed_count = 0
+        self.queued_count = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Обработчики, выполняющиеся прямо сейчас"""
+        return self._in_flight
+
+    @property
+    def waiting(self) -> int:
+        """Обновления, ожидающие предыдущего обновления того же пользователя или общего лимита"""
+        return self._waiting
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None:
+            return await self._run(handler, event, data)
+
+        mailbox = self._mailboxes.get(user.id)
+        if mailbox is None:
+            self._mailboxes[user.id] = deque()
+        else:
+            future = asyncio.get_running_loop().create_future()
+            mailbox.append(future)
+            self.queued_count += 1
+            self._waiting += 1
+            try:
+                await future
+            except asyncio.CancelledError:
+                # Очередь уже дошла до отмененного обновления - передаем ее следующему
+                if not future.cancelled():
+                    self._release(user.id)
+                raise
+            finally:
+                self._waiting -= 1
+
+        try:
+            return await self._run(handler, event, data)
+        finally:
+            self._release(user.id)
+
+    async def _run(self, handler, event: TelegramObject, data: Dict[str, Any]) -> Any:
+        """Выполняет обработчик в пределах общего лимита"""
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._in_flight += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight -= 1
+            self.processed_count += 1
+            self._semaphore.release()
+
+    def _release(self, user_id: int):
+        """Запускает следующее обновление пользователя или освобождает его очередь"""
+        mailbox = self._mailboxes[user_id]
+        while mailbox:
+            future = mailbox.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        del self._mailboxes[user_id]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'users': len(self._mailboxes),
+            'in_flight': self._in_flight,
+            'waiting': self.waiting,
+            'processed': self.processed_count,
+            'queued': self.queued_count,
+            'max_concurrency': self.max_concurrency,
+        }
+
+
+class SessionSyncMiddleware(BaseMiddleware):
+    """Загружает сессии пользователя из внешнего бэкенда до обработчика и сохраняет после"""
+
+    def __init__(self, registry: SessionRegistry):
+        self.registry = registry
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None or not self.registry.is_external:
+            return await handler(event, data)
+
+        await self.registry.load_user(user.id)
+        try:
+            return await handler(event, data)
+        finally:
+            try:
+                await self.registry.flush_user(user.id)
+            except Exception as e:
+                logger.error(f"Ошибка сохранения сессий пользователя {user.id}: {e}", exc_info=True)
+
+
+class ChatLogMiddleware(BaseMiddleware):
+    """Записывает входящие сообщения клиентов и смену сценария диалога в БД (через очередь)"""
+
+    def __init__(self, recorder: ChatRecorder, registry: SessionRegistry):
+        self.recorder = recorder
+        self.registry = registry
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        chat = getattr(event, 'chat', None)
+        if user is None or chat is None or chat.type != 'private':
+            return await handler(event, data)
+
+        text = getattr(event, 'text', None) or getattr(event, 'caption', None)
+        self.recorder.record_incoming(user, text or f"[{getattr(event, 'content_type', 'unknown')}]")
+
+        flow_before = self.registry.active_flow(user.id)
+        try:
+            return await handler(event, data)
+        finally:
+            flow_after = self.registry.active_flow(user.id)
+            if flow_after != flow_before:
+                self.recorder.record_event(user.id, f"Сценарий: {flow_before or '-'} -> {flow_after or '-'}")
+
+
+class FlowMetricsMiddleware(BaseMiddleware):
+    """Считает начатые и завершенные сценарии: активный сценарий пользователя до и после обработчика"""
+
+    def __init__(self, registry: SessionRegistry, started: Counter, finished: Counter):
+        self.registry = registry
+        self.started = started
+        self.finished = finished
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+
+        flow_before = self.registry.active_flow(user.id)
+        try:
+            return await handler(event, data)
+        finally:
+            flow_after = self.registry.active_flow(user.id)
+            # Смена сценария - редкое событие, метки берутся по имени
+            if flow_after != flow_before:
+                if flow_before is not None:
+                    self.finished.labels(flow_before).inc()
+                if flow_after is not None:
+                    self.started.labels(flow_after).inc()
+
+
+class TraceRequestMiddleware(BaseRequestMiddleware):
+    """Время запросов к Bot API как этапы трассы: telegram.SendMessage, telegram.SendChatAction..."""
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Response:
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            record_stage(f"telegram.{type(method).__name__}", time.perf_counter() - started)
+
+
+class OutgoingLogMiddleware(BaseRequestMiddleware):
+    """Записывает в БД ответы бота клиентам (middleware запросов bot.session).
+
+    Правка отправленного сообщения заменяет записанный текст: потоковый ответ DeepSeek
+    отправляется с первым предложением и дописывается правками.
+    """
+
+    def __init__(self, recorder: ChatRecorder, exclude_chat_ids: Iterable[int] = ()):
+        self.recorder = recorder
+        self.exclude_chat_ids = {chat_id for chat_id in exclude_chat_ids if chat_id is not None}
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Response:
+        # Цепочка возвращает результат метода; ошибка API поднимается исключением и сюда не доходит
+        response = await make_request(bot, method)
+        if isinstance(method, (SendMessage, EditMessageText)):
+            chat_id = method.chat_id
+            # Личные чаты клиентов имеют положительный id; чат операторов не записываем
+            if isinstance(chat_id, int) and chat_id > 0 and chat_id not in self.exclude_chat_ids:
+                if isinstance(method, SendMessage):
+                    self.recorder.record_outgoing(chat_id, method.text, response.message_id)
+                elif method.message_id is not None:
+                    self.recorder.record_edit(chat_id, method.message_id, method.text)
+        return response
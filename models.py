@@ -16,7 +16,7 @@ class Client(Base):
     __tablename__ = 'clients'
     
     id = Column(Integer, primary_key=True)
-    telegram_id = Column(BigInteger, unique=True, nullable=False, index=True)
+    telegram_id = Column(BigInteger, unique=True, nullable=False)
     username = Column(String(100))
     first_name = Column(String(100))
     last_name = Column(String(100))
@@ -38,7 +38,7 @@ class Chat(Base):
     __tablename__ = 'chats'
     
     id = Column(Integer, primary_key=True)
-    client_id = Column(Integer, ForeignKey('clients.id'), nullable=False, index=True)
+    client_id = Column(Integer, ForeignKey('clients.id'), nullable=False)
     status = Column(Enum(ChatStatus), default=ChatStatus.ACTIVE)  # Используем Enum
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -60,7 +60,7 @@ class Message(Base):
     __tablename__ = 'messages'
     
     id = Column(Integer, primary_key=True)
-    chat_id = Column(Integer, ForeignKey('chats.id'), nullable=False, index=True)
+    chat_id = Column(Integer, ForeignKey('chats.id'), nullable=False)
     text = Column(Text)
     is_from_user = Column(Boolean, default=True)
     message_type = Column(String(20), default='text')  # text, system, operator_transfer
@@ -74,4 +74,20 @@ class Message(Base):
         Index('ix_messages_chat_id', 'chat_id'),
         Index('ix_messages_created_at', 'created_at'),
         Index('ix_messages_is_from_user', 'is_from_user'),
-    )
\ No newline at end of file
+    )
+
+class OperatorNotification(Base):
+    __tablename__ = 'operator_notifications'
+    
+    id = Column(Integer, primary_key=True)
+    telegram_id = Column(BigInteger, nullable=False)
+    client = Column(String(300))  # Имя и username клиента для сводки
+    description = Column(Text)
+    repeat_count = Column(Integer, default=1)  # Сколько раз клиент обращался до отправки
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)  # NULL - уведомление еще не доставлено оператору
+    
+    # Индексы
+    __table_args__ = (
+        Index('ix_operator_notifications_sent_at', 'sent_at'),
+    )
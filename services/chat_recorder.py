@@ -0,0 +1,288 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import insert, select, update
+
+from models import Chat, ChatStatus, Client, Message
+
+logger = logging.getLogger(__name__)
+
+# Виды событий в очереди записи
+_MESSAGE = 'message'
+_OUTGOING = 'outgoing'
+_EDIT = 'edit'
+_HANDOFF = 'handoff'
+_STOP = object()
+
+# Чаты, в которые дописываются новые сообщения клиента
+_OPEN_STATUSES = (ChatStatus.ACTIVE, ChatStatus.TRANSFERRED)
+
+# Сколько последних ответов бота можно обновить правкой (потоковый ответ правится секунды)
+_TRACKED_OUTGOING = 1000
+
+
+class ChatRecorder:
+    """Фоновая запись переписки в БД (write-behind).
+
+    Обработчики только кладут события в очередь и не ждут базу. Фоновая задача
+    собирает пачку до batch_size событий или до истечения flush_interval секунд
+    и записывает ее одной транзакцией: клиенты и открытые чаты ищутся одним
+    запросом на пачку, сообщения вставляются одним INSERT.
+
+    Правка ответа бота (потоковый ответ DeepSeek растет правками одного сообщения)
+    заменяет текст записанного сообщения: в пределах пачки - до вставки, позже - UPDATE
+    по id строки, запомненному для последних ответов.
+    """
+
+    def __init__(self, session_factory, batch_size: int = 200,
+                 flush_interval: float = 0.25, max_queue: int = 10000):
+        self._session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        # Кэш идентификаторов: telegram_id -> clients.id / id открытого чата
+        self._client_ids: Dict[int, int] = {}
+        self._chat_ids: Dict[int, int] = {}
+        # (telegram_id, message_id в Telegram) -> messages.id последних ответов бота
+        self._outgoing_ids: OrderedDict = OrderedDict()
+        self.written_count = 0
+        self.dropped_count = 0
+        self.failed_batches = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _enqueue(self, event: Tuple):
+        if not self.running:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped_count += 1
+            logger.warning(f"Очередь записи переписки переполнена, событие отброшено (всего: {self.dropped_count})")
+
+    def record_incoming(self, user: Any, text: str):
+        """Сообщение клиента"""
+        profile = {
+            'username': getattr(user, 'username', None),
+            'first_name': getattr(user, 'first_name', None),
+            'last_name': getattr(user, 'last_name', None),
+            'language_code': getattr(user, 'language_code', None),
+        }
+        self._enqueue((_MESSAGE, user.id, {
+            'text': text, 'is_from_user': True, 'message_type': 'text', 'created_at': datetime.utcnow()
+        }, profile))
+
+    def record_outgoing(self, telegram_id: int, text: str, message_id: Optional[int] = None):
+        """Ответ бота клиенту; message_id из Telegram позволяет потом заменить текст правкой"""
+        self._enqueue((_OUTGOING, telegram_id, {
+            'text': text, 'is_from_user': False, 'message_type': 'text', 'created_at': datetime.utcnow()
+        }, message_id))
+
+    def record_edit(self, telegram_id: int, message_id: int, text: str):
+        """Правка ответа бота: новый текст заменяет записанный"""
+        self._enqueue((_EDIT, telegram_id, (message_id, text), None))
+
+    def record_event(self, telegram_id: int, text: str):
+        """Служебное событие диалога (например, смена сценария)"""
+        self._enqueue((_MESSAGE, telegram_id, {
+            'text': text, 'is_from_user': False, 'message_type': 'system', 'created_at': datetime.utcnow()
+        }, None))
+
+    def record_handoff(self, telegram_id: int, description: str):
+        """Передача диалога оператору"""
+        now = datetime.utcnow()
+        self._enqueue((_MESSAGE, telegram_id, {
+            'text': description, 'is_from_user': False, 'message_type': 'operator_transfer', 'created_at': now
+        }, None))
+        self._enqueue((_HANDOFF, telegram_id, now, None))
+
+    def start(self):
+        """Запускает фоновую задачу записи"""
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+            logger.info(
+                f"Фоновая запись переписки запущена (пачка: {self.batch_size}, "
+                f"интервал: {self.flush_interval} с)"
+            )
+
+    async def stop(self):
+        """Останавливает запись, предварительно сбросив в БД все накопленные события"""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        logger.info(f"Фоновая запись переписки остановлена (записано: {self.written_count}, отброшено: {self.dropped_count})")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+
+            batch = [item]
+            stopping = False
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[Tuple]):
+        try:
+            await self._write_batch(batch)
+            self.written_count += len(batch)
+        except Exception as e:
+            self.failed_batches += 1
+            # Кэш мог устареть (например, чат удален вручную) - перечитаем при следующей пачке
+            self._client_ids.clear()
+            self._chat_ids.clear()
+            logger.error(f"Ошибка записи пачки переписки ({len(batch)} событий): {e}", exc_info=True)
+
+    async def _write_batch(self, batch: List[Tuple]):
+        profiles: Dict[int, Dict] = {}
+        for kind, telegram_id, _, profile in batch:
+            if kind == _MESSAGE and profile is not None:
+                profiles[telegram_id] = profile
+            else:
+                profiles.setdefault(telegram_id, {})
+
+        async with self._session_factory() as session:
+            async with session.begin():
+                client_ids = await self._resolve_clients(session, profiles)
+                chat_ids = await self._resolve_chats(session, client_ids)
+
+                rows = []
+                # Ответы бота с id сообщения в Telegram: ключ -> номер строки в rows
+                keyed: Dict[Tuple[int, int], int] = {}
+                edits: Dict[int, str] = {}
+                handoffs: Dict[int, datetime] = {}
+                for kind, telegram_id, payload, extra in batch:
+                    if kind == _MESSAGE:
+                        rows.append(dict(payload, chat_id=chat_ids[telegram_id]))
+                    elif kind == _OUTGOING:
+                        if extra is not None:
+                            keyed[(telegram_id, extra)] = len(rows)
+                        rows.append(dict(payload, chat_id=chat_ids[telegram_id]))
+                    elif kind == _EDIT:
+                        message_id, text = payload
+                        key = (telegram_id, message_id)
+                        if key in keyed:
+                            # Сообщение еще не вставлено - вставим сразу последний текст
+                            rows[keyed[key]]['text'] = text
+                        elif key in self._outgoing_ids:
+                            edits[self._outgoing_ids[key]] = text
+                    elif kind == _HANDOFF:
+                        handoffs[chat_ids[telegram_id]] = payload
+
+                inserted_ids: List[int] = []
+                if keyed:
+                    result = await session.execute(
+                        insert(Message).returning(Message.id, sort_by_parameter_order=True), rows
+                    )
+                    inserted_ids = list(result.scalars())
+                elif rows:
+                    await session.execute(insert(Message), rows)
+
+                for row_id, text in edits.items():
+                    await session.execute(update(Message).where(Message.id == row_id).values(text=text))
+
+                for chat_id, transferred_at in handoffs.items():
+                    await session.execute(
+                        update(Chat)
+                        .where(Chat.id == chat_id)
+                        .values(status=ChatStatus.TRANSFERRED, transferred_at=transferred_at, updated_at=transferred_at)
+                    )
+
+                await session.execute(
+                    update(Client)
+                    .where(Client.id.in_(client_ids.values()))
+                    .values(last_activity=datetime.utcnow())
+                )
+
+        # Кэш обновляется только после успешной фиксации транзакции
+        self._client_ids.update(client_ids)
+        self._chat_ids.update(chat_ids)
+        for key, row in keyed.items():
+            self._outgoing_ids[key] = inserted_ids[row]
+        while len(self._outgoing_ids) > _TRACKED_OUTGOING:
+            self._outgoing_ids.popitem(last=False)
+
+    async def _resolve_clients(self, session, profiles: Dict[int, Dict]) -> Dict[int, int]:
+        """Возвращает clients.id для всех telegram_id пачки, создавая недостающих клиентов"""
+        client_ids = {tid: self._client_ids[tid] for tid in profiles if tid in self._client_ids}
+        missing: Set[int] = set(profiles) - set(client_ids)
+        if not missing:
+            return client_ids
+
+        result = await session.execute(select(Client).where(Client.telegram_id.in_(missing)))
+        for client in result.scalars():
+            # Клиент впервые встречен этим процессом - обновляем данные профиля
+            for field, value in profiles[client.telegram_id].items():
+                if value is not None:
+                    setattr(client, field, value)
+            client_ids[client.telegram_id] = client.id
+            missing.discard(client.telegram_id)
+
+        new_clients = [Client(telegram_id=tid, **profiles[tid]) for tid in missing]
+        if new_clients:
+            session.add_all(new_clients)
+            await session.flush()
+            for client in new_clients:
+                client_ids[client.telegram_id] = client.id
+        return client_ids
+
+    async def _resolve_chats(self, session, client_ids: Dict[int, int]) -> Dict[int, int]:
+        """Возвращает id открытого чата для всех клиентов пачки, открывая недостающие чаты"""
+        chat_ids = {tid: self._chat_ids[tid] for tid in client_ids if tid in self._chat_ids}
+        missing = {client_ids[tid]: tid for tid in client_ids if tid not in chat_ids}
+        if not missing:
+            return chat_ids
+
+        result = await session.execute(
+            select(Chat.id, Chat.client_id)
+            .where(Chat.client_id.in_(missing), Chat.status.in_(_OPEN_STATUSES))
+            .order_by(Chat.id)
+        )
+        for chat_id, client_id in result:
+            # Последний открытый чат клиента
+            chat_ids[missing[client_id]] = chat_id
+
+        new_chats = [Chat(client_id=client_id) for client_id, tid in missing.items() if tid not in chat_ids]
+        if new_chats:
+            session.add_all(new_chats)
+            await session.flush()
+            for chat in new_chats:
+                chat_ids[missing[chat.client_id]] = chat.id
+        return chat_ids
+
+    def stats(self) -> Dict[str, int]:
+        """Размер очереди и счетчики записи"""
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written_count,
+            'dropped': self.dropped_count,
+            'failed_batches': self.failed_batches,
+        }
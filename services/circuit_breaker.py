@@ -0,0 +1,89 @@
+import logging
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Предохранитель для внешнего API.
+
+    После failure_threshold ошибок подряд переходит в состояние open и сразу отказывает
+    в запросах на reset_timeout секунд. Затем пропускает один пробный запрос (half_open):
+    успех закрывает предохранитель, ошибка снова открывает его на тот же срок.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected_count = 0
+        self.opened_count = 0
+
+    def rejects(self) -> bool:
+        """Открыт и пауза еще не истекла: запрос отклоняется сразу, не занимая очередь"""
+        if self.state == self.OPEN and time.monotonic() - self._opened_at < self.reset_timeout:
+            self.rejected_count += 1
+            return True
+        return False
+
+    def allow(self) -> bool:
+        """Можно ли выполнить запрос сейчас"""
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+            logger.info(f"Предохранитель '{self.name}': пробный запрос после паузы")
+
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+
+        self.rejected_count += 1
+        return False
+
+    def release_probe(self):
+        """Пробный запрос прерван без результата (отмена, закрытие потока): следующий запрос станет пробным"""
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info(f"Предохранитель '{self.name}' закрыт: сервис снова отвечает")
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        if self.state != self.OPEN:
+            self.opened_count += 1
+            logger.warning(
+                f"Предохранитель '{self.name}' открыт после {self._failures} ошибок: "
+                f"запросы отклоняются {self.reset_timeout} с"
+            )
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'state': self.state,
+            'failures': self._failures,
+            'opened': self.opened_count,
+            'rejected': self.rejected_count,
+        }
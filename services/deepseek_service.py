@@ -1,95 +1,489 @@
 import asyncio
 import aiohttp
+import hashlib
+import json
 import random
 import logging
 import re
-from typing import Optional, List, Dict, Any
+from contextlib import asynccontextmanager
+from typing import Optional, List, Dict, Any, AsyncIterator
 from datetime import datetime, timedelta
 from config import config
+from services.circuit_breaker import CircuitBreaker
+from services.lexicons import scan_lexicons
+from services.metrics import metrics
+from services.rate_limiter import RequestLimiter
+from services.response_cache import ResponseCache, normalize_question
+from services.session_store import session_registry
 
 logger = logging.getLogger(__name__)
 
+# Номер заказа в вопросе делает ответ персональным - такие ответы не кэшируются
+ORDER_NUMBER_PATTERN = re.compile(r'\d{6,}')
+
+# Ответы API, после которых имеет смысл повторить запрос
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Метрики запросов: наборы меток регистрируются заранее, на горячем пути только inc()/observe()
+DEEPSEEK_LATENCY = metrics.histogram(
+    'bot_deepseek_request_seconds', 'Длительность попытки запроса к DeepSeek', ('mode',)
+)
+DEEPSEEK_FIRST_TOKEN = metrics.histogram(
+    'bot_deepseek_first_token_seconds', 'Время до первого фрагмента потокового ответа DeepSeek'
+)
+DEEPSEEK_RESPONSES = metrics.counter('bot_deepseek_responses_total', 'Ответы DeepSeek по коду статуса', ('status',))
+DEEPSEEK_TOKENS = metrics.counter('bot_deepseek_tokens_total', 'Расход токенов DeepSeek', ('kind',))
+LATENCY_BY_MODE = {mode: DEEPSEEK_LATENCY.labels(mode) for mode in ('completion', 'stream')}
+RESPONSES_BY_STATUS = {
+    status: DEEPSEEK_RESPONSES.labels(status) for status in (200, 400, 401, 402, 422, *RETRYABLE_STATUSES, 'error')
+}
+TOKENS_BY_KIND = {
+    kind: DEEPSEEK_TOKENS.labels(kind) for kind in ('prompt_tokens', 'completion_tokens', 'prompt_cache_hit_tokens')
+}
+
+
+def count_response(status):
+    """Учитывает ответ DeepSeek по коду статуса ('error' - ошибка соединения или таймаут)"""
+    counter = RESPONSES_BY_STATUS.get(status)
+    if counter is None:
+        counter = RESPONSES_BY_STATUS[status] = DEEPSEEK_RESPONSES.labels(status)
+    counter.inc()
+
+
+def count_tokens(usage: Optional[Dict[str, Any]]):
+    """Учитывает расход токенов из поля usage ответа"""
+    if not usage:
+        return
+    for kind, counter in TOKENS_BY_KIND.items():
+        value = usage.get(kind)
+        if value:
+            counter.inc(value)
+
+SYSTEM_PROMPT = """Ты - AI-помощник службы поддержки Intickets. Отвечай вежливо и профессионально.
+Если не знаешь ответа - предложи подключить оператора.
+При недовольстве клиента сразу извинись и предложи оператора."""
+
 class DeepSeekService:
+    # Версия промпта входит в ключ кэша: правка промпта или модели сбрасывает кэшированные ответы
+    PROMPT_VERSION = hashlib.sha1(f"{config.DEEPSEEK_MODEL}\n{SYSTEM_PROMPT}".encode('utf-8')).hexdigest()[:12]
+
     def __init__(self):
         self.api_key = config.DEEPSEEK_API_KEY
-        self.api_url = "https://api.deepseek.com/v1/chat/completions"
+        self.api_url = config.DEEPSEEK_API_URL
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        self.user_contexts: Dict[int, Dict] = {}
         self.session_timeout = timedelta(minutes=30)
+        self.user_contexts = session_registry.create_store(
+            'deepseek_context', ttl=self.session_timeout, max_entries=config.SESSION_MAX_ENTRIES
+        )
+        # История диалога с моделью для process_message: список сообщений {"role", "content"}
+        self.chat_histories = session_registry.create_store(
+            'deepseek_history', ttl=self.session_timeout, max_entries=config.SESSION_MAX_ENTRIES
+        )
+        self._http_session: Optional[aiohttp.ClientSession] = None
+        self.breaker = CircuitBreaker(
+            'deepseek',
+            failure_threshold=config.DEEPSEEK_BREAKER_FAILURES,
+            reset_timeout=config.DEEPSEEK_BREAKER_COOLDOWN
+        )
+        # Ограничение одновременных запросов и RPS с честной очередью по пользователям
+        self.limiter = RequestLimiter(
+            'deepseek',
+            max_concurrency=config.DEEPSEEK_MAX_CONCURRENCY,
+            rps=config.DEEPSEEK_RPS
+        )
+        # Одинаковые общие вопросы в работе: ключ кэша -> будущий ответ первого запроса
+        self._pending: Dict[tuple, asyncio.Future] = {}
+        self.response_cache = ResponseCache(
+            ttl_seconds=config.DEEPSEEK_CACHE_TTL_MINUTES * 60,
+            max_entries=config.DEEPSEEK_CACHE_MAX_ENTRIES
+        ) if config.DEEPSEEK_CACHE_ENABLED else None
         logger.info("DeepSeekService инициализирован")
 
-    def _clean_old_contexts(self):
-        """Очищает старые контексты"""
-        now = datetime.now()
-        expired_users = []
+    async def start(self):
+        """Создает общую HTTP-сессию с пулом keep-alive соединений"""
+        if self._http_session is not None and not self._http_session.closed:
+            return
         
-        for user_id, context in self.user_contexts.items():
-            if 'created_at' in context and now - context['created_at'] > self.session_timeout:
-                expired_users.append(user_id)
-        
-        for user_id in expired_users:
-            del self.user_contexts[user_id]
-            logger.debug(f"Удален контекст для пользователя {user_id} по таймауту")
+        connector = aiohttp.TCPConnector(
+            limit=config.DEEPSEEK_POOL_SIZE,
+            limit_per_host=config.DEEPSEEK_POOL_PER_HOST,
+            keepalive_timeout=config.DEEPSEEK_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300,
+            enable_cleanup_closed=True
+        )
+        self._http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=config.DEEPSEEK_TIMEOUT),
+            headers=self.headers
+        )
+        logger.info(
+            f"HTTP-сессия DeepSeek создана (пул: {config.DEEPSEEK_POOL_SIZE}, "
+            f"на хост: {config.DEEPSEEK_POOL_PER_HOST})"
+        )
 
-    async def get_ai_response(self, user_message: str, user_id: int = None, chat_history: Optional[List[Dict]] = None) -> Optional[str]:
-        """Получает ответ от DeepSeek с учетом контекста"""
-        # Очищаем старые контексты
-        self._clean_old_contexts()
-        
+    async def close(self):
+        """Закрывает общую HTTP-сессию"""
+        if self._http_session is not None and not self._http_session.closed:
+            await self._http_session.close()
+            logger.info("HTTP-сессия DeepSeek закрыта")
+        self._http_session = None
+
+    async def _get_http_session(self) -> aiohttp.ClientSession:
+        """Возвращает общую HTTP-сессию, создавая ее при необходимости"""
+        if self._http_session is None or self._http_session.closed:
+            await self.start()
+        return self._http_session
+
+    async def get_ai_response(self, user_message: str, user_id: int = None, chat_history: Optional[List[Dict]] = None,
+                              reference: Optional[List[str]] = None) -> Optional[str]:
+        """Получает ответ от DeepSeek с учетом контекста; reference - справки из FAQ для этого вопроса"""
         # Сначала проверяем контекст пользователя
         if user_id and user_id in self.user_contexts:
             context_response = self._handle_user_context(user_id, user_message)
             if context_response:
                 return context_response
 
-        # Подготавливаем историю сообщений
+        # Общие вопросы без истории и номера заказа отвечаются из кэша
+        cache_key = self._cache_key(user_message, chat_history, reference)
+        if cache_key is not None:
+            cached_response = self.response_cache.get(cache_key)
+            if cached_response is not None:
+                logger.info(f"Ответ DeepSeek из кэша для пользователя {user_id} ({self.response_cache.stats()})")
+                return cached_response
+
+            # Такой же вопрос уже запрошен - ждем его ответ вместо второго запроса
+            pending = self._pending.get(cache_key)
+            if pending is not None:
+                logger.info(f"Вопрос пользователя {user_id} присоединен к такому же запросу в работе")
+                return await asyncio.shield(pending)
+
+        payload = self._build_payload(user_message, chat_history, stream=False, reference=reference)
+        logger.info(f"Запрос к DeepSeek от пользователя {user_id}: {user_message[:100]}...")
+
+        if cache_key is None:
+            return await self._request_completion(payload, user_id)
+
+        pending = self._pending[cache_key] = asyncio.get_running_loop().create_future()
+        response_text = None
+        try:
+            response_text = await self._request_completion(payload, user_id)
+            if response_text:
+                self.response_cache.put(cache_key, response_text)
+            return response_text
+        finally:
+            del self._pending[cache_key]
+            pending.set_result(response_text)
+
+    async def _request_completion(self, payload: Dict[str, Any], user_id: Optional[int]) -> Optional[str]:
+        """Запрос chat/completions с повторами; None, если ответа получить не удалось"""
+        loop = asyncio.get_running_loop()
+        # Общий бюджет времени на все попытки, чтобы повторы не растягивали ожидание пользователя
+        deadline = loop.time() + config.DEEPSEEK_TIMEOUT
+
+        for attempt in range(config.DEEPSEEK_MAX_ATTEMPTS):
+            async with self._upstream_slot(user_id, deadline) as allowed:
+                if not allowed:
+                    return None
+
+                remaining = deadline - loop.time()
+                started = loop.time()
+                try:
+                    session = await self._get_http_session()
+                    async with session.post(self.api_url, json=payload,
+                                            timeout=aiohttp.ClientTimeout(total=remaining)) as response:
+                        count_response(response.status)
+                        if response.status == 200:
+                            data = await response.json()
+                            LATENCY_BY_MODE['completion'].observe(loop.time() - started)
+                            count_tokens(data.get('usage'))
+                            self.breaker.record_success()
+                            response_text = data['choices'][0]['message']['content'].strip()
+                            logger.info(f"DeepSeek ответил: {response_text[:100]}...")
+                            return response_text
+
+                        error_text = await response.text()
+                        LATENCY_BY_MODE['completion'].observe(loop.time() - started)
+                        logger.error(f"Ошибка DeepSeek API: {response.status} - {error_text}")
+                        if response.status not in RETRYABLE_STATUSES:
+                            # Ошибка запроса, а не сервиса: повтор не поможет, предохранитель не трогаем
+                            self.breaker.record_success()
+                            return None
+                        self.breaker.record_failure()
+
+                except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                    count_response('error')
+                    LATENCY_BY_MODE['completion'].observe(loop.time() - started)
+                    self.breaker.record_failure()
+                    logger.error(f"Ошибка соединения с DeepSeek (попытка {attempt + 1}): {type(e).__name__} {e}")
+                except Exception as e:
+                    self.breaker.record_failure()
+                    logger.error(f"Ошибка при запросе к DeepSeek: {e}")
+                    return None
+
+            if not await self._backoff(attempt, deadline):
+                break
+
+        return None
+
+    async def stream_ai_response(self, user_message: str, user_id: int = None,
+                                 chat_history: Optional[List[Dict]] = None,
+                                 reference: Optional[List[str]] = None) -> AsyncIterator[str]:
+        """Потоковый ответ DeepSeek: отдает фрагменты текста по мере генерации (SSE).
+
+        Ответы из контекста пользователя и из кэша отдаются одним фрагментом.
+        При ошибке поток просто завершается - вызывающий код видит, что текста нет или он неполный.
+        """
+        if user_id and user_id in self.user_contexts:
+            context_response = self._handle_user_context(user_id, user_message)
+            if context_response:
+                yield context_response
+                return
+
+        cache_key = self._cache_key(user_message, chat_history, reference)
+        if cache_key is not None:
+            cached_response = self.response_cache.get(cache_key)
+            if cached_response is not None:
+                logger.info(f"Ответ DeepSeek из кэша для пользователя {user_id} ({self.response_cache.stats()})")
+                yield cached_response
+                return
+
+            # Такой же вопрос уже запрошен - ответ придет одним фрагментом, когда первый запрос завершится
+            pending = self._pending.get(cache_key)
+            if pending is not None:
+                logger.info(f"Вопрос пользователя {user_id} присоединен к такому же запросу в работе")
+                response_text = await asyncio.shield(pending)
+                if response_text:
+                    yield response_text
+                return
+            pending = self._pending[cache_key] = asyncio.get_running_loop().create_future()
+
+        payload = self._build_payload(user_message, chat_history, stream=True, reference=reference)
+        logger.info(f"Потоковый запрос к DeepSeek от пользователя {user_id}: {user_message[:100]}...")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + config.DEEPSEEK_TIMEOUT
+        parts: List[str] = []
+        completed = False
+
+        try:
+            for attempt in range(config.DEEPSEEK_MAX_ATTEMPTS):
+                async with self._upstream_slot(user_id, deadline) as allowed:
+                    if not allowed:
+                        break
+
+                    # Бюджет ограничивает ожидание начала ответа; саму генерацию ограничивают паузы между фрагментами
+                    remaining = deadline - loop.time()
+                    timeout = aiohttp.ClientTimeout(total=None, sock_connect=remaining, sock_read=remaining)
+                    started = loop.time()
+                    try:
+                        session = await self._get_http_session()
+                        async with session.post(self.api_url, json=payload, timeout=timeout) as response:
+                            count_response(response.status)
+                            if response.status != 200:
+                                error_text = await response.text()
+                                logger.error(f"Ошибка DeepSeek API: {response.status} - {error_text}")
+                                if response.status not in RETRYABLE_STATUSES:
+                                    self.breaker.record_success()
+                                    break
+                                self.breaker.record_failure()
+                            else:
+                                # Поток SSE: строки "data: {json}", завершается "data: [DONE]"
+                                async for line in response.content:
+                                    line = line.strip()
+                                    if not line.startswith(b'data:'):
+                                        continue
+                                    data = line[5:].strip()
+                                    if data == b'[DONE]':
+                                        completed = True
+                                        break
+
+                                    chunk = json.loads(data)
+                                    # Последний фрагмент (stream_options.include_usage) - только расход токенов
+                                    count_tokens(chunk.get('usage'))
+                                    if not chunk.get('choices'):
+                                        continue
+                                    choice = chunk['choices'][0]
+                                    delta = (choice.get('delta') or {}).get('content')
+                                    if delta:
+                                        if not parts:
+                                            DEEPSEEK_FIRST_TOKEN.observe(loop.time() - started)
+                                        parts.append(delta)
+                                        yield delta
+                                    if choice.get('finish_reason'):
+                                        completed = True
+
+                                LATENCY_BY_MODE['stream'].observe(loop.time() - started)
+                                self.breaker.record_success()
+                                break
+
+                    except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                        count_response('error')
+                        LATENCY_BY_MODE['stream'].observe(loop.time() - started)
+                        self.breaker.record_failure()
+                        logger.error(f"Ошибка потокового соединения с DeepSeek (попытка {attempt + 1}): {type(e).__name__} {e}")
+                        if parts:
+                            # Часть ответа уже показана пользователю - повтор начал бы текст заново
+                            break
+                    except Exception as e:
+                        self.breaker.record_failure()
+                        logger.error(f"Ошибка при потоковом запросе к DeepSeek: {e}")
+                        break
+
+                if not await self._backoff(attempt, deadline):
+                    break
+
+        finally:
+            response_text = ''.join(parts).strip()
+            if response_text:
+                logger.info(f"DeepSeek ответил (поток): {response_text[:100]}...")
+            # Кэшируем и отдаем присоединившимся только полностью полученный ответ
+            if not completed:
+                response_text = None
+            if cache_key is not None:
+                if response_text:
+                    self.response_cache.put(cache_key, response_text)
+                del self._pending[cache_key]
+                pending.set_result(response_text)
+
+    @asynccontextmanager
+    async def _upstream_slot(self, user_id: Optional[int], deadline: float):
+        """Место в ограничителе запросов и разрешение предохранителя на одну попытку.
+
+        Отдает False, если запрос отправлять нельзя: предохранитель открыт
+        или место в очереди не освободилось до конца бюджета времени.
+        """
+        if self.breaker.rejects():
+            logger.warning("DeepSeek временно недоступен (предохранитель открыт) - запрос не отправлен")
+            yield False
+            return
+
+        remaining = deadline - asyncio.get_running_loop().time()
+        try:
+            await asyncio.wait_for(self.limiter.acquire(user_id), max(0.0, remaining))
+        except asyncio.TimeoutError:
+            logger.warning(f"Очередь к DeepSeek не продвинулась за отведенное время ({self.limiter.stats()})")
+            yield False
+            return
+
+        probe = False
+        try:
+            if not self.breaker.allow():
+                logger.warning("DeepSeek временно недоступен (предохранитель открыт) - запрос не отправлен")
+                yield False
+            else:
+                probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+                yield True
+        except BaseException:
+            # Пробный запрос отменен или поток закрыт до ответа: исход не записан,
+            # и без освобождения предохранитель ждал бы этот запрос до перезапуска
+            if probe:
+                self.breaker.release_probe()
+            raise
+        finally:
+            self.limiter.release()
+
+    async def _backoff(self, attempt: int, deadline: float) -> bool:
+        """Пауза перед повтором с экспоненциальным ростом и случайным разбросом (full jitter).
+
+        Возвращает False, если повторять не нужно: попытки кончились или пауза не уложится в бюджет.
+        """
+        if attempt + 1 >= config.DEEPSEEK_MAX_ATTEMPTS:
+            return False
+        delay = random.uniform(0, min(config.DEEPSEEK_RETRY_MAX_DELAY, config.DEEPSEEK_RETRY_BASE_DELAY * 2 ** attempt))
+        if asyncio.get_running_loop().time() + delay >= deadline:
+            return False
+        await asyncio.sleep(delay)
+        return True
+
+    async def process_message(self, message_text: str, user_id: int = None,
+                              reference: Optional[List[str]] = None) -> str:
+        """Ответ DeepSeek на свободный вопрос с учетом истории диалога пользователя.
+
+        Бросает RuntimeError, если ответа нет (сервис недоступен или предохранитель открыт).
+        """
+        response_text = await self.get_ai_response(
+            message_text, user_id, chat_history=self._get_history(user_id), reference=reference
+        )
+        if not response_text:
+            raise RuntimeError("DeepSeek не вернул ответ")
+        self._remember(user_id, message_text, response_text)
+        return response_text
+
+    async def stream_message(self, message_text: str, user_id: int = None,
+                             reference: Optional[List[str]] = None) -> AsyncIterator[str]:
+        """Потоковый вариант process_message: фрагменты ответа, затем запись в историю"""
+        parts: List[str] = []
+        async for delta in self.stream_ai_response(message_text, user_id, chat_history=self._get_history(user_id),
+                                                   reference=reference):
+            parts.append(delta)
+            yield delta
+        self._remember(user_id, message_text, ''.join(parts).strip())
+
+    def _get_history(self, user_id: Optional[int]) -> Optional[List[Dict]]:
+        if not user_id:
+            return None
+        return self.chat_histories.get(user_id)
+
+    def _remember(self, user_id: Optional[int], message_text: str, response_text: str):
+        """Добавляет обмен репликами в историю пользователя (хранятся последние DEEPSEEK_HISTORY_MESSAGES)"""
+        if not user_id or not response_text:
+            return
+        history = list(self.chat_histories.get(user_id) or [])
+        history.append({"role": "user", "content": message_text})
+        history.append({"role": "assistant", "content": response_text})
+        self.chat_histories[user_id] = history[-config.DEEPSEEK_HISTORY_MESSAGES:]
+
+    def _build_payload(self, user_message: str, chat_history: Optional[List[Dict]], stream: bool,
+                       reference: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Тело запроса к chat/completions: системный промпт, справки FAQ, последние сообщения истории, вопрос"""
         messages = [{"role": "system", "content": self._get_system_prompt()}]
-        
+
+        if reference:
+            # Только ближайшие к вопросу ответы из FAQ, а не весь справочник
+            messages.append({
+                "role": "system",
+                "content": "Справочная информация для ответа:\n\n" + "\n\n".join(reference)
+            })
+
         if chat_history:
-            messages.extend(chat_history[-6:])
-        
+            messages.extend(chat_history[-config.DEEPSEEK_HISTORY_MESSAGES:])
+
         messages.append({"role": "user", "content": user_message})
 
         payload = {
-            "model": "deepseek-chat",
+            "model": config.DEEPSEEK_MODEL,
             "messages": messages,
             "temperature": 0.3,
             "max_tokens": 500,
-            "stream": False
+            "stream": stream
         }
-
-        try:
-            logger.info(f"Запрос к DeepSeek от пользователя {user_id}: {user_message[:100]}...")
-            
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(self.api_url, json=payload, headers=self.headers) as response:
-                    
-                    if response.status == 200:
-                        data = await response.json()
-                        response_text = data['choices'][0]['message']['content'].strip()
-                        logger.info(f"DeepSeek ответил: {response_text[:100]}...")
-                        return response_text
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Ошибка DeepSeek API: {response.status} - {error_text}")
-                        return None
-                        
-        except asyncio.TimeoutError:
-            logger.error("Таймаут запроса к DeepSeek")
-            return None
-        except Exception as e:
-            logger.error(f"Ошибка при запросе к DeepSeek: {e}")
-            return None
+        if stream:
+            # Расход токенов приходит отдельным фрагментом в конце потока
+            payload["stream_options"] = {"include_usage": True}
+        return payload
 
     def _get_system_prompt(self) -> str:
         """Возвращает системный промпт для AI"""
-        return """Ты - AI-помощник службы поддержки Intickets. Отвечай вежливо и профессионально.
-Если не знаешь ответа - предложи подключить оператора.
-При недовольстве клиента сразу извинись и предложи оператора."""
+        return SYSTEM_PROMPT
+
+    def _cache_key(self, user_message: str, chat_history: Optional[List[Dict]],
+                   reference: Optional[List[str]] = None) -> Optional[tuple]:
+        """Ключ кэша ответа или None, если запрос персональный и кэшировать его нельзя.
+
+        Кэш общий для всех пользователей, поэтому кэшируются только вопросы без истории
+        диалога: ответ на уточняющий вопрос зависит от контекста конкретного диалога. Справки FAQ входят
+        в ключ: после правки FAQ старые ответы из кэша не используются.
+        """
+        if self.response_cache is None or chat_history or ORDER_NUMBER_PATTERN.search(user_message):
+            return None
+        normalized = normalize_question(user_message)
+        if not normalized:
+            return None
+        reference_version = hashlib.sha1("\n".join(reference).encode('utf-8')).hexdigest()[:12] if reference else ''
+        return (self.PROMPT_VERSION, normalized, reference_version)
 
     def _handle_user_context(self, user_id: int, user_message: str) -> Optional[str]:
         """Обрабатывает контекст пользователя"""
@@ -203,17 +597,7 @@ class DeepSeekService:
 
     def detect_dissatisfaction(self, message_text: str) -> bool:
         """Определяет недовольство клиента"""
-        dissatisfaction_phrases = [
-            'недоволен', 'плохой', 'ужасный', 'кошмар', 'безобразие', 'возмущен',
-            'хреново', 'отстой', 'бесит', 'раздражает', 'достало', 'надоело',
-            'человека', 'оператора', 'менеджера', 'живого',
-            'это не помогает', 'бесполезно', 'зря', 'напрасно',
-            'верните деньги', 'жалоба', 'претензия', 'верните',
-            'свяжите с человеком', 'позовите оператора', 'до человека'
-        ]
-        
-        message_lower = message_text.lower()
-        return any(phrase in message_lower for phrase in dissatisfaction_phrases)
+        return 'dissatisfaction' in scan_lexicons(message_text)
 
     def get_greeting_response(self, message_text: str) -> Optional[str]:
         """Обрабатывает приветственные сообщения"""
@@ -242,9 +626,6 @@ class DeepSeekService:
         """Обрабатывает частые запросы"""
         normalized_text = ' '.join(message_text.lower().split())
         
-        # Очищаем старые контексты
-        self._clean_old_contexts()
-        
         # 1. Проверяем проблемы с оплатой (ВЫСШИЙ ПРИОРИТЕТ)
         if self._is_payment_issue(normalized_text):
             if user_id:
@@ -320,6 +701,7 @@ class DeepSeekService:
 
     def clear_user_context(self, user_id: int):
         """Очищает контекст пользователя"""
+        self.chat_histories.pop(user_id)
         if user_id in self.user_contexts:
             del self.user_contexts[user_id]
             logger.debug(f"Контекст очищен для пользователя {user_id}")
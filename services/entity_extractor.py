@@ -0,0 +1,114 @@
+import re
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional
+
+from services.lexicons import detect_payment_method
+
+# Номер заказа - ровно 6 цифр
+ORDER_NUMBER_PATTERN = r'\b\d{6}\b'
+ORDER_NUMBER_RE = re.compile(r'\b(\d{6})\b')
+
+EMAIL_PATTERN = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b'
+EMAIL_FULL_RE = re.compile(r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}')
+
+# Российский телефон: +7 (999) 123-45-67, 8 999 123 45 67, 89991234567 или 10 цифр (7999123456)
+PHONE_PATTERN = r'(?<![\d+])\+?[78](?:[\s\-]?\(?\d{3}\)?[\s\-]?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}|\d{9})(?!\d)'
+PHONE_SEPARATORS_RE = re.compile(r'[\s()\-+]')
+
+# Временные выражения: дата (01.02.2025), время (14:30), длительность (20 минут, 2 часа, 3 дня)
+TIME_EXPRESSION_PATTERN = r'(?i:\d{1,2}[.\-/]\d{1,2}[.\-/]\d{4}|\d{1,2}:\d{2}|\d+\s*(?:мин|час|дн|день|дня|дней))'
+
+# Все сущности одним проходом. Альтернативы на одной позиции пробуются по порядку:
+# email раньше номера заказа, иначе адрес вида 123456@mail.ru потерялся бы.
+# Опережающая проверка первого символа (любая сущность начинается с латиницы, цифры
+# или .%+-) отсекает кириллицу и пробелы, не перебирая на них все альтернативы
+ENTITY_RE = re.compile(
+    r'(?=[A-Za-z0-9._%+-])(?:'
+    f'(?P<email>{EMAIL_PATTERN})'
+    f'|(?P<phone>{PHONE_PATTERN})'
+    f'|(?P<order_number>{ORDER_NUMBER_PATTERN})'
+    f'|(?P<time_expression>{TIME_EXPRESSION_PATTERN})'
+    r')'
+)
+ENTITY_KINDS = len(ENTITY_RE.groupindex)
+
+
+class Entities(NamedTuple):
+    """Сущности одного сообщения (неизменяемые - безопасно кэшировать)"""
+    order_number: Optional[str] = None
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    time_expression: Optional[str] = None
+    payment_method: Optional[str] = None
+
+    def contacts(self, with_order: bool = False) -> Dict[str, str]:
+        """Контактные данные в формате, который ожидают сценарии"""
+        contacts = {}
+        if self.email:
+            contacts['email'] = self.email
+        if self.phone:
+            contacts['phone'] = self.phone
+        if with_order and self.order_number:
+            contacts['order_number'] = self.order_number
+        return contacts
+
+
+def clean_phone(phone: str) -> str:
+    return PHONE_SEPARATORS_RE.sub('', phone)
+
+
+def is_valid_phone(phone: str) -> bool:
+    """Российский номер: 10 или 11 цифр, начинается с 7 или 8"""
+    digits = clean_phone(phone)
+    return len(digits) in (10, 11) and digits.isdigit() and digits[0] in '78'
+
+
+def is_valid_email(email: str) -> bool:
+    return EMAIL_FULL_RE.fullmatch(email) is not None
+
+
+def format_phone(phone: str) -> str:
+    """Приводит номер к виду +7 (999) 123-45-67"""
+    digits = clean_phone(phone)
+    if len(digits) == 11 and digits[0] in '78':
+        return f"+7 ({digits[1:4]}) {digits[4:7]}-{digits[7:9]}-{digits[9:]}"
+    if len(digits) == 10:
+        return f"+7 ({digits[0:3]}) {digits[3:6]}-{digits[6:8]}-{digits[8:]}"
+    return phone
+
+
+def find_order_number(text: str) -> Optional[str]:
+    match = ORDER_NUMBER_RE.search(text)
+    return match.group(1) if match else None
+
+
+@lru_cache(maxsize=1024)
+def extract_entities(text: str) -> Entities:
+    """Извлекает номер заказа, телефон, email, время и способ оплаты из сообщения.
+
+    Номер заказа, телефон, email и время находит один проход ENTITY_RE (берется первое
+    вхождение каждого вида), способ оплаты - общий для всех детекторов проход словарей.
+    Результат кэшируется по тексту, так что сценарии и роутер, разбирающие одно
+    сообщение, повторно его не сканируют.
+    """
+    found: Dict[str, str] = {}
+    for match in ENTITY_RE.finditer(text):
+        kind = match.lastgroup
+        if kind in found:
+            continue
+        found[kind] = match.group(kind)
+        if kind == 'email' and 'order_number' not in found:
+            # Шесть цифр в начале адреса (123456@mail.ru) - тоже номер заказа, как и при отдельном поиске
+            order_number = ORDER_NUMBER_RE.search(found[kind])
+            if order_number:
+                found['order_number'] = order_number.group(1)
+        if len(found) == ENTITY_KINDS:
+            break
+
+    return Entities(
+        order_number=found.get('order_number'),
+        phone=found.get('phone'),
+        email=found.get('email'),
+        time_expression=found.get('time_expression'),
+        payment_method=detect_payment_method(text),
+    )
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from services.text_vectorizer import HashingVectorizer, np
+
+logger = logging.getLogger(__name__)
+
+HOW_TO_BUY_TEXT = (
+    "🎫 Как купить билеты:\n\n"
+    "1. Перейдите на официальный сайт наших партнеров (Театр Моссовета, Сфера и др.)\n"
+    "2. Выберите мероприятие и дату\n"
+    "3. Выберите места в зале\n"
+    "4. Заполните данные для получения билетов\n"
+    "5. Оплатите заказ картой или другим способом\n"
+    "6. Билеты придут на указанный email\n\n"
+    "Если возникли проблемы с оплатой или билеты не пришли - обращайтесь!"
+)
+
+REFUND_TERMS_TEXT = (
+    "🔄 Условия возврата билетов:\n\n"
+    "• Менее, чем за 3 дня до начала мероприятия - деньги не возвращаются\n"
+    "• от 3 до 5 дней до начала мероприятия - возвращается 30% стоимости\n"
+    "• от 5 до 10 дней до начала мероприятия - возвращается 50% стоимости\n"
+    "• от 10 дней и более - возвращается 100% стоимости\n\n"
+    "Сроки рассчитываются от даты мероприятия. Для оформления возврата напишите «возврат» и номер заказа."
+)
+
+# Частые вопросы: варианты формулировок -> готовый ответ
+FAQ_ENTRIES: List[Dict] = [
+    {
+        'questions': [
+            'как купить билеты', 'где купить билет', 'как оформить заказ на сайте',
+            'как выбрать места в зале', 'как приобрести билеты на спектакль',
+        ],
+        'answer': HOW_TO_BUY_TEXT,
+    },
+    {
+        'questions': [
+            'условия возврата билетов', 'сколько денег вернут при возврате', 'можно ли вернуть билет за день до спектакля',
+            'какой процент возвращается', 'за сколько дней можно вернуть билеты', 'вернут ли деньги если я не пойду',
+        ],
+        'answer': REFUND_TERMS_TEXT,
+    },
+    {
+        'questions': [
+            'возврат по болезни', 'заболел не могу пойти на спектакль', 'заболел хочу вернуть билеты',
+            'какие документы нужны для возврата по болезни', 'справка от врача для возврата',
+        ],
+        'answer': (
+            "🏥 Для возврата по болезни отправьте документы, подтверждающие болезнь, на почту info@intickets.ru\n\n"
+            "Подходящие документы:\n"
+            "• Справка от врача\n"
+            "• Больничный лист\n"
+            "• Выписка из медицинской карты\n\n"
+            "После получения документов мы обработаем возврат в течение 24 часов."
+        ),
+    },
+    {
+        'questions': [
+            'мероприятие отменили', 'концерт отменен что с билетами', 'спектакль перенесли как вернуть деньги',
+            'отмена мероприятия возврат',
+        ],
+        'answer': (
+            "❌ Если мероприятие отменено, деньги вернутся автоматически на карту, с которой была оплата, "
+            "в течение 5–10 рабочих дней. Уведомление придет на ваш email."
+        ),
+    },
+    {
+        'questions': [
+            'какие способы оплаты', 'чем можно оплатить', 'можно ли оплатить электронным кошельком',
+            'принимаете ли вы карты', 'как оплатить заказ',
+        ],
+        'answer': (
+            "💳 Принимаем банковские карты и электронные кошельки. "
+            "Если с оплатой возникла проблема - нажмите «💳 Проблема с оплатой»."
+        ),
+    },
+    {
+        'questions': [
+            'билеты не пришли на почту', 'где мои билеты', 'письмо с билетами не пришло',
+            'проверить папку спам',
+        ],
+        'answer': (
+            "📧 Проверьте папку «Спам» - письма с билетами иногда попадают туда. "
+            "Если письма нет, нажмите «📧 Билеты не пришли/Восстановить» и укажите номер заказа, телефон или email."
+        ),
+    },
+    {
+        'questions': [
+            'контакты поддержки', 'как связаться с поддержкой', 'почта поддержки', 'телефон поддержки',
+        ],
+        'answer': "📞 Поддержка: support@intickets.ru, +7 (999) 123-45-67\nДля связи с оператором нажмите «📞 Связаться с оператором».",
+    },
+    {
+        'questions': [
+            'адрес сайта', 'ваш сайт', 'где почитать faq', 'официальный сайт intickets',
+        ],
+        'answer': (
+            "🌐 Официальные ресурсы Intickets:\n\n"
+            "• Основной сайт: https://intickets.ru\n"
+            "• FAQ с вопросами: https://intickets.ru/faq\n"
+            "• Поддержка: support@intickets.ru"
+        ),
+    },
+]
+
+
+def entries_checksum(entries: Sequence[Dict]) -> str:
+    """Контрольная сумма содержимого: индекс на диске перестраивается, если FAQ изменился"""
+    return hashlib.sha1(json.dumps(entries, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+class FaqIndex:
+    """Векторный индекс частых вопросов: матрица нормированных векторов формулировок.
+
+    Косинусная близость вопроса ко всем формулировкам - одно умножение разреженного
+    вектора вопроса на столбцы матрицы. Достаточно близкий вопрос получает готовый ответ,
+    иначе несколько ближайших ответов уходят в DeepSeek как справка вместо всего FAQ.
+    """
+
+    def __init__(self, entries: Sequence[Dict], vectorizer: HashingVectorizer, matrix: "np.ndarray",
+                 row_entries: "np.ndarray", answer_threshold: float = 0.6, context_min_score: float = 0.3):
+        self.entries = list(entries)
+        self.vectorizer = vectorizer
+        # Строка матрицы - формулировка вопроса, row_entries - номер записи FAQ для строки
+        self.matrix = matrix
+        self.row_entries = row_entries
+        self.answer_threshold = answer_threshold
+        self.context_min_score = context_min_score
+        self.answered = 0
+        self.contexts = 0
+        self.searches = 0
+        self.latency_total = 0.0
+
+    @classmethod
+    def build(cls, entries: Sequence[Dict] = FAQ_ENTRIES, vectorizer: Optional[HashingVectorizer] = None,
+              **kwargs) -> "FaqIndex":
+        if vectorizer is None:
+            vectorizer = HashingVectorizer()
+        questions, row_entries = [], []
+        for number, entry in enumerate(entries):
+            for question in entry['questions']:
+                questions.append(question)
+                row_entries.append(number)
+        matrix = vectorizer.transform(questions)
+        logger.info(f"Индекс FAQ построен: {len(entries)} ответов, {len(questions)} формулировок")
+        return cls(entries, vectorizer, matrix, np.array(row_entries, dtype=np.int32), **kwargs)
+
+    @classmethod
+    def load_or_build(cls, path: str, entries: Sequence[Dict] = FAQ_ENTRIES, **kwargs) -> "FaqIndex":
+        """Загружает индекс с диска; если файла нет или FAQ изменился - строит и сохраняет заново"""
+        checksum = entries_checksum(entries)
+        if os.path.exists(path):
+            with np.load(path, allow_pickle=False) as data:
+                if str(data['checksum']) == checksum:
+                    vectorizer = HashingVectorizer(
+                        n_features=int(data['n_features']), ngram_min=int(data['ngram_min']),
+                        ngram_max=int(data['ngram_max'])
+                    )
+                    logger.info(f"Индекс FAQ загружен: {path}")
+                    return cls(entries, vectorizer, data['matrix'], data['row_entries'], **kwargs)
+            logger.info("FAQ изменился - индекс перестраивается")
+
+        index = cls.build(entries, **kwargs)
+        try:
+            index.save(path, checksum)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить индекс FAQ: {e}")
+        return index
+
+    def save(self, path: str, checksum: Optional[str] = None):
+        np.savez_compressed(
+            path, matrix=self.matrix, row_entries=self.row_entries,
+            checksum=np.array(checksum or entries_checksum(self.entries)),
+            **{name: np.array(value) for name, value in self.vectorizer.params().items()}
+        )
+
+    def search(self, text: str, top_k: int = 3) -> List[Tuple[int, float]]:
+        """Ближайшие записи FAQ: (номер записи, косинусная близость) по убыванию"""
+        started = time.perf_counter()
+        indices, values = self.vectorizer.transform_one(text)
+        scores = self.matrix[:, indices] @ values
+
+        # У записи несколько формулировок - берем лучшую
+        best: Dict[int, float] = {}
+        for row in np.argsort(scores)[::-1]:
+            entry = int(self.row_entries[row])
+            if entry not in best:
+                best[entry] = float(scores[row])
+                if len(best) >= top_k:
+                    break
+
+        self.searches += 1
+        self.latency_total += time.perf_counter() - started
+        return list(best.items())
+
+    def answer(self, text: str) -> Optional[str]:
+        """Готовый ответ, если вопрос достаточно близок к одной из формулировок"""
+        results = self.search(text, top_k=1)
+        if results and results[0][1] >= self.answer_threshold:
+            self.answered += 1
+            return self.entries[results[0][0]]['answer']
+        return None
+
+    def context(self, text: str, top_k: int = 3) -> List[str]:
+        """Ответы ближайших записей FAQ - справка для DeepSeek"""
+        snippets = [
+            self.entries[entry]['answer'] for entry, score in self.search(text, top_k)
+            if score >= self.context_min_score
+        ]
+        if snippets:
+            self.contexts += 1
+        return snippets
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'searches': self.searches,
+            'answered': self.answered,
+            'contexts': self.contexts,
+            'avg_latency_ms': round(self.latency_total / self.searches * 1000, 3) if self.searches else 0.0,
+        }
@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+
+from models import Message
+from services.intent_router import INTENT_TABLE, IntentRouter
+from services.text_vectorizer import HashingVectorizer, np
+
+logger = logging.getLogger(__name__)
+
+# Намерения, которые классификатор может передать сценариям; остальное остается DeepSeek
+CLASSIFIED_INTENTS = (
+    'purchase', 'payment', 'refund', 'wrong_event', 'partial_refund', 'email_change', 'ticket_problem'
+)
+OTHER = 'other'
+
+# Вопросы не по сценариям (класс 'other'): без них модель уверенно относила бы любой текст к сценарию
+OTHER_SAMPLES = [
+    'привет', 'здравствуйте', 'добрый день', 'как дела', 'кто ты', 'ты бот',
+    'какая погода', 'расскажи анекдот', 'что ты умеешь', 'как тебя зовут',
+    'во сколько начинается спектакль', 'где находится театр', 'есть ли парковка у театра',
+    'можно ли прийти с ребенком', 'какой дресс код', 'есть ли гардероб',
+    'сколько длится концерт', 'будет ли антракт', 'можно ли пронести еду',
+    'какие мероприятия на выходных', 'посоветуйте спектакль', 'какой возрастной ценз',
+]
+
+# Фрагменты регулярных выражений, которые не являются словами
+REGEX_SYNTAX_RE = re.compile(r'\\s\*|\\s\+|\[[^\]]*\]|[()?*+.|^$\\]')
+
+
+def keyword_samples(table=INTENT_TABLE) -> List[Tuple[str, str]]:
+    """Обучающие примеры из таблицы намерений: фразы и регулярные выражения без цифр"""
+    samples = []
+    for name, kind, patterns in table:
+        if name not in CLASSIFIED_INTENTS:
+            continue
+        for pattern in patterns:
+            if kind == 'regex':
+                if '\\d' in pattern:
+                    continue
+                pattern = REGEX_SYNTAX_RE.sub(' ', pattern)
+            samples.append((' '.join(pattern.split()), name))
+    samples.extend((text, OTHER) for text in OTHER_SAMPLES)
+    return samples
+
+
+async def history_samples(session_factory, router: IntentRouter, limit: int = 20000,
+                          per_class: int = 3000) -> List[Tuple[str, str]]:
+    """Обучающие примеры из сохраненной переписки.
+
+    Сообщения пользователей размечаются маршрутизатором намерений; не распознанные им
+    вопросы из нескольких слов без цифр и email (то, что уходило в DeepSeek) - класс 'other'.
+    """
+    async with session_factory() as session:
+        result = await session.execute(
+            select(Message.text)
+            .where(Message.is_from_user.is_(True), Message.message_type == 'text')
+            .order_by(Message.id.desc())
+            .limit(limit)
+        )
+        texts = [text for text in result.scalars().all() if text]
+
+    by_class: Dict[str, List[str]] = defaultdict(list)
+    for text in texts:
+        lowered = text.lower()
+        intent = router.route(lowered)
+        if intent in CLASSIFIED_INTENTS:
+            by_class[intent].append(lowered)
+        elif intent is None and len(lowered.split()) >= 3 and not re.search(r'[\d@]', lowered):
+            by_class[OTHER].append(lowered)
+
+    samples = []
+    for label, class_texts in by_class.items():
+        samples.extend((text, label) for text in class_texts[:per_class])
+    return samples
+
+
+class IntentClassifier:
+    """Линейный классификатор намерений (softmax-регрессия) на хэшированных n-граммах.
+
+    Обучается на CPU за секунды и предсказывает за десятки микросекунд: вектор сообщения
+    разреженный, поэтому считаются только столбцы весов его признаков.
+    """
+
+    def __init__(self, vectorizer: HashingVectorizer, labels: Sequence[str],
+                 weights: "np.ndarray", bias: "np.ndarray", threshold: float = 0.75):
+        self.vectorizer = vectorizer
+        self.labels = list(labels)
+        self.weights = weights
+        self.bias = bias
+        self.threshold = threshold
+        self.predictions = 0
+        self.routed = 0
+        self.latency_total = 0.0
+
+    @classmethod
+    def train(cls, samples: List[Tuple[str, str]], vectorizer: Optional[HashingVectorizer] = None,
+              steps: int = 1000, learning_rate: float = 5.0, l2: float = 1e-4,
+              batch_size: int = 256, threshold: float = 0.75, seed: int = 0) -> "IntentClassifier":
+        """Обучает модель мини-пакетным градиентным спуском (steps пакетов по batch_size примеров)"""
+        if vectorizer is None:
+            vectorizer = HashingVectorizer()
+        labels = sorted({label for _, label in samples})
+        label_index = {label: i for i, label in enumerate(labels)}
+        rows = [vectorizer.transform_one(text) for text, _ in samples]
+        targets = np.array([label_index[label] for _, label in samples], dtype=np.int64)
+
+        weights = np.zeros((len(labels), vectorizer.n_features), dtype=np.float32)
+        bias = np.zeros(len(labels), dtype=np.float32)
+        order = list(range(len(rows)))
+        rng = random.Random(seed)
+
+        start = len(order)
+        for _ in range(steps):
+            # Новая эпоха - новый порядок примеров
+            if start >= len(order):
+                rng.shuffle(order)
+                start = 0
+            batch = order[start:start + batch_size]
+            start += batch_size
+
+            features = np.zeros((len(batch), vectorizer.n_features), dtype=np.float32)
+            for row, sample in enumerate(batch):
+                indices, values = rows[sample]
+                features[row, indices] = values
+
+            probabilities = _softmax(features @ weights.T + bias)
+            probabilities[np.arange(len(batch)), targets[batch]] -= 1.0
+            gradient = probabilities.T @ features / len(batch)
+            weights -= learning_rate * (gradient + l2 * weights)
+            bias -= learning_rate * probabilities.mean(axis=0)
+
+        model = cls(vectorizer, labels, weights, bias, threshold=threshold)
+        # Примеры 'other' модель запоминает почти дословно - в точность они не входят
+        scenario_samples = [(text, label) for text, label in samples if label != OTHER]
+        correct = sum(model.classify(text)[0] == label for text, label in scenario_samples)
+        logger.info(
+            f"Классификатор намерений обучен: {len(samples)} примеров, {len(labels)} классов, "
+            f"точность на обучающих примерах сценариев {correct / max(1, len(scenario_samples)):.1%}"
+        )
+        return model
+
+    def classify(self, text: str) -> Tuple[str, float]:
+        """Самый вероятный класс и его вероятность"""
+        indices, values = self.vectorizer.transform_one(text)
+        logits = self.weights[:, indices] @ values + self.bias
+        probabilities = _softmax(logits[np.newaxis, :])[0]
+        best = int(probabilities.argmax())
+        return self.labels[best], float(probabilities[best])
+
+    def predict(self, text: str) -> Optional[Tuple[str, float]]:
+        """Намерение для передачи сценарию, если модель достаточно уверена, иначе None"""
+        started = time.perf_counter()
+        label, confidence = self.classify(text)
+        self.latency_total += time.perf_counter() - started
+        self.predictions += 1
+        if label == OTHER or confidence < self.threshold:
+            return None
+        self.routed += 1
+        return label, confidence
+
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(
+            path, weights=self.weights, bias=self.bias, labels=np.array(self.labels),
+            **{name: np.array(value) for name, value in self.vectorizer.params().items()}
+        )
+        logger.info(f"Модель намерений сохранена: {path}")
+
+    @classmethod
+    def load(cls, path: str, threshold: float = 0.75) -> "IntentClassifier":
+        with np.load(path, allow_pickle=False) as data:
+            vectorizer = HashingVectorizer(
+                n_features=int(data['n_features']), ngram_min=int(data['ngram_min']), ngram_max=int(data['ngram_max'])
+            )
+            model = cls(vectorizer, [str(label) for label in data['labels']], data['weights'], data['bias'],
+                        threshold=threshold)
+        logger.info(f"Модель намерений загружена: {path} ({len(model.labels)} классов)")
+        return model
+
+    def stats(self) -> Dict[str, float]:
+        """Сколько сообщений классифицировано, доля переданных сценариям вместо DeepSeek и задержка"""
+        return {
+            'predictions': self.predictions,
+            'routed': self.routed,
+            'llm_avoided_share': round(self.routed / self.predictions, 3) if self.predictions else 0.0,
+            'avg_latency_ms': round(self.latency_total / self.predictions * 1000, 3) if self.predictions else 0.0,
+        }
+
+
+def _softmax(logits: "np.ndarray") -> "np.ndarray":
+    shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+
+async def build_classifier(session_factory, path: str, threshold: float = 0.75,
+                           retrain: bool = False) -> IntentClassifier:
+    """Загружает модель с диска, а если ее нет (или retrain) - обучает на словарях и истории и сохраняет"""
+    if os.path.exists(path) and not retrain:
+        return await asyncio.to_thread(IntentClassifier.load, path, threshold)
+
+    samples = keyword_samples()
+    try:
+        samples.extend(await history_samples(session_factory, IntentRouter()))
+    except Exception as e:
+        logger.warning(f"История переписки недоступна, модель обучается только на словарях: {e}")
+
+    model = await asyncio.to_thread(IntentClassifier.train, samples, None, threshold=threshold)
+    try:
+        await asyncio.to_thread(model.save, path)
+    except OSError as e:
+        logger.warning(f"Не удалось сохранить модель намерений: {e}")
+    return model
+
+
+if __name__ == '__main__':
+    # Офлайн-переобучение: python -m services.intent_classifier [--model intent_model.npz]
+    import argparse
+
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+
+    parser = argparse.ArgumentParser(description="Обучение классификатора намерений на словарях и истории переписки")
+    parser.add_argument('--model', default=os.getenv('INTENT_MODEL_PATH', 'intent_model.npz'))
+    parser.add_argument('--database', default=os.getenv('DATABASE_URL', 'sqlite+aiosqlite:///./bot.db'))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    async def retrain():
+        engine = create_async_engine(args.database)
+        try:
+            await build_classifier(
+                sessionmaker(engine, class_=AsyncSession, expire_on_commit=False), args.model, retrain=True
+            )
+        finally:
+            await engine.dispose()
+
+    asyncio.run(retrain())
@@ -0,0 +1,213 @@
+import re
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from services.typo_index import TypoIndex, WORD_RE
+
+logger = logging.getLogger(__name__)
+
+# Декларативная таблица намерений. Порядок строк = приоритет (как в каскаде handle_all_messages).
+# Типы правил:
+#   'exact'  - сообщение целиком совпадает с одной из фраз
+#   'phrase' - фраза встречается в тексте как подстрока
+#   'regex'  - регулярное выражение ищется в тексте (re.search)
+INTENT_TABLE: List[Tuple[str, str, List[str]]] = [
+    ('farewell', 'exact', [
+        'нет', 'нет спасибо', 'не надо', 'всё', 'всего хорошего',
+        'пока', 'до свидания', 'спасибо нет', 'не нужно', 'закончили'
+    ]),
+    ('positive', 'exact', [
+        'да', 'давай', 'конечно', 'хочу', 'нужно', 'помоги', 'помощь нужна'
+    ]),
+    ('purchase', 'phrase', [
+        'как купить', 'как приобрести', 'инструкция покупки', 'как оформить заказ',
+        'хочу купить', 'хочу приобрести', 'купить билет', 'приобрести билет',
+        'как заказать', 'как сделать заказ', 'как оплатить билет', 'процесс покупки',
+        'инструкция по покупке', 'как получить билет', 'как оформить билет'
+    ]),
+    ('payment', 'phrase', [
+        'оплат', 'платеж', 'деньги', 'карт', 'приложен', 'qr', 'чек', 'списались'
+    ]),
+    ('refund', 'phrase', [
+        'возврат', 'вернуть', 'вернул'
+    ]),
+    ('wrong_event', 'phrase', [
+        'купил по ошибке', 'не то мероприятие', 'ошибочно купил',
+        'неправильно выбрал', 'перепутал мероприятие', 'другое мероприятие по ошибке'
+    ]),
+    ('partial_refund', 'phrase', [
+        'вернуть один билет', 'только один билет', 'один из заказа',
+        'частичный возврат', 'не все билеты'
+    ]),
+    ('email_change', 'phrase', [
+        'изменить email', 'поменять email', 'сменить почту',
+        'другой email', 'неправильный email'
+    ]),
+    ('ticket_problem', 'regex', [
+        r'не\s*пришли',
+        r'не\s*пришёл',
+        r'не\s*пришел',
+        r'не\s*получил',
+        r'не\s*получили',
+        r'не\s*поступал',
+        r'нет\s*билет',
+        r'билеты\s*не',
+        r'не\s*приходят',
+        r'не\s*дошли',
+        r'письмо\s*не',
+        r'восстановить',
+        r'нет билетов'
+    ]),
+    ('payment_problem', 'regex', [
+        r'\b\d{6}\b.*(?:плат[её]ж|оплат|деньги|списались|карт|приложен|qr|код)',
+        r'(?:плат[её]ж|оплат).*\b\d{6}\b',
+        r'деньги.*списались',
+        r'чек.*не.*пришел',
+        r'двойн.*списан',
+        r'статус.*ожидает.*оплат',
+        r'платеж.*не.*прошел',
+        r'деньги.*вернулись'
+    ]),
+    ('order_number', 'regex', [
+        r'\b\d{6}\b'
+    ]),
+    ('order_number_only', 'regex', [
+        r'^\s*\d{6}\s*$'
+    ]),
+]
+
+# Слова короче не исправляются: у коротких слов слишком много правильных соседей (поко - пока)
+TYPO_MIN_LENGTH = 5
+
+# Правильные слова, которые отличаются от слов правил на 1-2 правки: их не исправляем.
+# Слова словарей и FAQ добавляются при создании маршрутизатора (known_words)
+KNOWN_WORDS = (
+    'сдать', 'сдал', 'сдала', 'балет', 'балета', 'пошли', 'вошли', 'прошли', 'прошел', 'прошёл',
+    'прошла', 'прошло', 'сказать', 'показать', 'рассказать', 'вернуться', 'свернуть', 'нужны',
+)
+
+# Слово в регулярном выражении целое, если с обеих сторон граница: начало или конец
+# шаблона, пробел, \s* / \s+ или \b; основы вроде плат[её]ж и двойн.* в словарь не попадают
+REGEX_WORD_RE = re.compile(r'(?:^|(?<=\s)|(?<=\\s\*)|(?<=\\s\+)|(?<=\\b))([а-яёa-z]+)(?=$|\s|\\s|\\b)')
+
+
+def keyword_words(kind: str, pattern: str) -> List[str]:
+    """Целые слова правила для словаря опечаток.
+
+    Фраза 'phrase' из одного слова ищется как подстрока и может быть основой
+    ('оплат', 'карт', 'приложен'): исправление к основе превращает в нее настоящие
+    слова (март - карт), поэтому такие фразы в словарь не берутся. Слова фраз
+    из нескольких слов и фраз 'exact' - целые.
+    """
+    if kind == 'regex':
+        return REGEX_WORD_RE.findall(pattern)
+    words = WORD_RE.findall(pattern)
+    if kind == 'phrase' and len(words) == 1:
+        return []
+    return words
+
+
+def _overlaps(span: Tuple[int, int], spans: List[Tuple[int, int]]) -> bool:
+    start, end = span
+    return any(start < other_end and other_start < end for other_start, other_end in spans)
+
+
+class IntentRouter:
+    """Компилирует таблицу намерений один раз и определяет намерения по тексту.
+
+    Каждое намерение - одно скомпилированное регулярное выражение из всех его фраз
+    и шаблонов, поиск идет в C-движке re. Один общий шаблон на все намерения
+    (lookahead с именованной группой на каждое) оказался медленнее прежнего каскада:
+    ленивый .*? для каждой группы повторно проходит текст уже внутри интерпретатора
+    шаблона (см. bench/intent_router.py).
+    """
+
+    def __init__(self, table: List[Tuple[str, str, List[str]]] = INTENT_TABLE, known_words: Iterable[str] = ()):
+        self.priority: List[str] = []
+        self._exact: Dict[str, str] = {}
+        # Правила в порядке приоритета: (намерение, шаблон); у 'exact' шаблона нет
+        self._rules: List[Tuple[str, Optional["re.Pattern"]]] = []
+        vocabulary = []
+
+        for name, kind, patterns in table:
+            self.priority.append(name)
+            for pattern in patterns:
+                vocabulary.extend(keyword_words(kind, pattern))
+
+            if kind == 'exact':
+                for phrase in patterns:
+                    self._exact.setdefault(phrase, name)
+                self._rules.append((name, None))
+                continue
+
+            if kind == 'phrase':
+                alternatives = [re.escape(phrase) for phrase in patterns]
+            elif kind == 'regex':
+                alternatives = [f"(?:{pattern})" for pattern in patterns]
+            else:
+                raise ValueError(f"Неизвестный тип правила '{kind}' для намерения '{name}'")
+            self._rules.append((name, re.compile('|'.join(alternatives))))
+
+        # Словарь опечаток из целых слов правил: используется, только если текст не распознан как есть.
+        # Известные слова (словари, FAQ) - правильные слова сообщений, их не исправляем (сдать - сделать)
+        self.typo_index = TypoIndex(vocabulary, known_words=(*KNOWN_WORDS, *known_words), min_length=TYPO_MIN_LENGTH)
+        logger.info(f"Маршрутизатор намерений скомпилирован: {len(self.priority)} намерений")
+
+    def match(self, text: str) -> List[str]:
+        """Возвращает все сработавшие намерения в порядке приоритета"""
+        exact_intent = self._exact.get(text)
+        return [
+            name for name, pattern in self._rules
+            if (name == exact_intent if pattern is None else pattern.search(text))
+        ]
+
+    def correct(self, text: str) -> Tuple[str, List[Tuple[int, int]]]:
+        """Исправляет опечатки в словах, близких к словам правил (до 1-2 правок).
+
+        Возвращает исправленный текст и границы исправленных слов в нем.
+        """
+        pieces: List[str] = []
+        spans: List[Tuple[int, int]] = []
+        length = position = 0
+        for match in WORD_RE.finditer(text):
+            word = match.group(0)
+            corrected = self.typo_index.lookup(word)
+            if corrected is None or corrected == word:
+                continue
+            pieces.append(text[position:match.start()])
+            length += match.start() - position
+            pieces.append(corrected)
+            spans.append((length, length + len(corrected)))
+            length += len(corrected)
+            position = match.end()
+        pieces.append(text[position:])
+        return ''.join(pieces), spans
+
+    def match_corrected(self, text: str) -> Tuple[List[str], str]:
+        """Намерения, которые появляются только благодаря исправленным словам.
+
+        Намерение засчитывается, если его не было в исходном тексте и совпадение
+        в исправленном тексте задевает исправленное слово: исправление, не давшее
+        нового совпадения, ничего не меняет. Возвращает (намерения, исправленный текст).
+        """
+        corrected_text, spans = self.correct(text)
+        if not spans:
+            return [], text
+
+        original = set(self.match(text))
+        exact_intent = self._exact.get(corrected_text)
+        intents = []
+        for name, pattern in self._rules:
+            if name in original:
+                continue
+            if pattern is None:
+                if name == exact_intent:
+                    intents.append(name)
+            elif any(_overlaps(found.span(), spans) for found in pattern.finditer(corrected_text)):
+                intents.append(name)
+        return intents, corrected_text
+
+    def route(self, text: str) -> Optional[str]:
+        """Возвращает намерение с наивысшим приоритетом или None"""
+        intents = self.match(text)
+        return intents[0] if intents else None
@@ -0,0 +1,103 @@
+from functools import lru_cache
+from typing import FrozenSet, Optional
+
+from services.text_matcher import PhraseMatcher
+
+# Недовольство клиента
+DISSATISFACTION_PHRASES = [
+    'недоволен', 'плохой', 'ужасный', 'кошмар', 'безобразие', 'возмущен',
+    'хреново', 'отстой', 'бесит', 'раздражает', 'достало', 'надоело',
+    'человека', 'оператора', 'менеджера', 'живого',
+    'это не помогает', 'бесполезно', 'зря', 'напрасно',
+    'верните деньги', 'жалоба', 'претензия', 'верните',
+    'свяжите с человеком', 'позовите оператора', 'до человека',
+    'не помогает', 'без толку', 'напрасн', 'бесполезно',
+    'проблема не решена', 'ничего не меняется', 'не решается',
+    'уже пробовал', 'уже пытался', 'всё равно не работает',
+    'надоело ждать', 'достало ждать', 'устал ждать',
+    'это не решает проблему', 'беспонтово', 'фигня', 'ерунда',
+    'зря только', 'напрасная трата', 'разочарован', 'разочаровал'
+]
+
+# Пользователь не может разобраться сам
+NEED_HELP_PHRASES = [
+    'не могу разобраться', 'не понимаю', 'не ясно', 'не понятно',
+    'не получается', 'не выходит', 'не знаю как', 'не знаю что делать',
+    'запутался', 'не разберусь', 'не соображу', 'не могу понять',
+    'помогите разобраться', 'объясните', 'подскажите как быть',
+    'что делать не знаю', 'не могу понять в чем проблема',
+    'не могу понять что случилось', 'не могу понять почему',
+    'не могу понять как решить', 'не могу решить проблему',
+    'не получается решить', 'не выходит решить', 'не могу справиться',
+    'не могу сам разобраться', 'сам не справлюсь', 'сам не могу',
+    'нужна помощь', 'требуется помощь', 'помогите пожалуйста',
+    'не могу понять в чем дело', 'не могу понять что не так'
+]
+
+# Благодарности и положительные отзывы
+THANKS_PHRASES = [
+    'спасибо', 'благодарю', 'thanks', 'thank you', 'мерси', 'пасиб', 'сяб',
+    'благодарочка', 'признателен', 'признательна', 'благодарствую',
+    'выручил', 'помог', 'спас', 'супер', 'отлично', 'прекрасно', 'замечательно',
+    'великолепно', 'потрясающе', 'офигенно', 'офигенный', 'круто', 'крутой',
+    'здорово', 'молодец', 'умница', 'красавчик', 'лучший', 'лучшая',
+    'работает', 'все работает', 'всё работает', 'все ок', 'всё ок', 'все хорошо',
+    'всё хорошо', 'отличная работа', 'хорошая работа', 'вау', 'ого', 'здорово',
+    'суперски', 'класс', 'классно', 'заебись', 'ахуенно', 'шикарно', 'превосходно',
+    'идеально', 'безупречно', 'восхитительно', 'потрясающе', 'невероятно',
+    'обалденно', 'чудесно', 'изумительно', 'фантастически', 'блестяще'
+]
+
+# Типы проблем с оплатой (порядок словаря = приоритет при определении типа)
+PAYMENT_PROBLEM_PHRASES = {
+    'double_charge': ['дважды', 'двойн', 'два раза', 'двойное', 'списалась дважды'],
+    'money_taken_but_status_pending': ['списались', 'деньги списали', 'статус ожидает оплаты', 'статус не изменился'],
+    'receipt_not_received': ['чек не пришел', 'кассовый чек', 'email не пришел'],
+    'payment_failed': ['платеж не прошел', 'деньги вернулись', 'сначала списались'],
+    'unclear_status': ['ошибка в процессе оплаты', 'не понятно прошел ли платеж', 'ошибка при оплате'],
+}
+
+# Способы оплаты с учетом опечаток (порядок словаря = приоритет)
+PAYMENT_METHOD_PHRASES = {
+    'мобильное приложение': ['приложен', 'приложени', 'мобильн', 'телефон', 'приложении', 'приложение', 'апп', 'app'],
+    'QR-код': ['qr', 'код', 'qr-код', 'кьюар', 'кюар', 'по qr'],
+    'банковская карта': ['карт', 'картой', 'карту', 'карта', 'карточк', 'кард', 'card'],
+}
+
+LEXICONS = {
+    'dissatisfaction': DISSATISFACTION_PHRASES,
+    'need_help': NEED_HELP_PHRASES,
+    'thanks': THANKS_PHRASES,
+    **PAYMENT_PROBLEM_PHRASES,
+    **PAYMENT_METHOD_PHRASES,
+}
+
+_matcher = PhraseMatcher(LEXICONS)
+
+
+@lru_cache(maxsize=1024)
+def scan_lexicons(message_text: str) -> FrozenSet[str]:
+    """Один проход по тексту: возвращает метки всех сработавших словарей.
+
+    Результат кэшируется по исходному тексту, поэтому все детекторы,
+    вызванные для одного сообщения, переиспользуют один и тот же проход.
+    """
+    return _matcher.find_labels(message_text.lower())
+
+
+def detect_payment_problem_type(message_text: str) -> Optional[str]:
+    """Определяет тип проблемы с оплатой по словарям PAYMENT_PROBLEM_PHRASES"""
+    labels = scan_lexicons(message_text)
+    for problem_type in PAYMENT_PROBLEM_PHRASES:
+        if problem_type in labels:
+            return problem_type
+    return None
+
+
+def detect_payment_method(message_text: str) -> Optional[str]:
+    """Определяет способ оплаты по словарям PAYMENT_METHOD_PHRASES"""
+    labels = scan_lexicons(message_text)
+    for method in PAYMENT_METHOD_PHRASES:
+        if method in labels:
+            return method
+    return None
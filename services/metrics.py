@@ -0,0 +1,281 @@
+import logging
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class CounterChild:
+    """Значение счетчика для одного набора меток"""
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class GaugeChild:
+    """Значение показателя для одного набора меток"""
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+
+class HistogramChild:
+    """Гистограмма для одного набора меток: счетчики корзин, сумма и количество"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # Последняя корзина - +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    """Семейство метрик с фиксированными именами меток.
+
+    Наборы меток регистрируются заранее вызовом labels(); на горячем пути код держит
+    ссылку на готовый дочерний объект и вызывает только inc()/observe() - без блокировок
+    (все в одном цикле событий) и без создания объектов.
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> object:
+        """Дочерний объект для набора меток (создается при первом обращении)"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"Метрика {self.name}: ожидались метки {self.labelnames}, получено {key}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def samples(self) -> Iterable[str]:
+        for key, child in self._children.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def _new_child(self) -> GaugeChild:
+        return GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def samples(self) -> Iterable[str]:
+        bounds = [_format_value(bound) for bound in self.buckets] + ['+Inf']
+        for key, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(bounds, child.counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {child.count}"
+
+
+class CallbackMetric:
+    """Значение, которое читается при сборе метрик: число или {метки: число}"""
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], object],
+                 labelnames: Sequence[str] = (), kind: str = 'gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def samples(self) -> Iterable[str]:
+        value = self.callback()
+        if not isinstance(value, dict):
+            yield f"{self.name} {_format_value(value)}"
+            return
+        for key, item in value.items():
+            key = key if isinstance(key, tuple) else (key,)
+            yield f"{self.name}{_format_labels(self.labelnames, [str(part) for part in key])} {_format_value(item)}"
+
+
+class StatsCollector:
+    """Числовые поля словаря stats() компонента - отдельные метрики prefix_<поле>.
+
+    Если stats() возвращает словарь словарей ({хранилище: {size: ...}}), ключ внешнего
+    словаря становится меткой label.
+    """
+
+    def __init__(self, prefix: str, stats: Callable[[], dict], documentation: str, label: Optional[str] = None):
+        self.prefix = prefix
+        self.stats = stats
+        self.documentation = documentation
+        self.label = label
+
+    def render(self) -> Iterable[str]:
+        stats = self.stats()
+        rows: Dict[str, List[str]] = {}
+        if self.label is None:
+            for field, value in stats.items():
+                if isinstance(value, (int, float)):
+                    rows.setdefault(field, []).append(f"{self.prefix}_{field} {_format_value(value)}")
+        else:
+            for name, nested in stats.items():
+                labels = _format_labels((self.label,), (str(name),))
+                for field, value in nested.items():
+                    if isinstance(value, (int, float)):
+                        rows.setdefault(field, []).append(f"{self.prefix}_{field}{labels} {_format_value(value)}")
+
+        for field, lines in rows.items():
+            yield f"# HELP {self.prefix}_{field} {self.documentation}: {field}"
+            yield f"# TYPE {self.prefix}_{field} gauge"
+            yield from lines
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса и вывод в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[StatsCollector] = []
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, callback: Callable[[], object],
+                 labelnames: Sequence[str] = (), kind: str = 'gauge') -> CallbackMetric:
+        return self._register(CallbackMetric(name, documentation, callback, labelnames, kind))
+
+    def stats(self, prefix: str, stats: Callable[[], dict], documentation: str, label: Optional[str] = None):
+        """Экспорт словаря stats() компонента как набора показателей"""
+        self._collectors.append(StatsCollector(prefix, stats, documentation, label))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.samples())
+            except Exception as e:
+                logger.error(f"Ошибка сбора метрики {metric.name}: {e}")
+        for collector in self._collectors:
+            try:
+                lines.extend(collector.render())
+            except Exception as e:
+                logger.error(f"Ошибка сбора метрик {collector.prefix}: {e}")
+        lines.append('')
+        return '\n'.join(lines)
+
+    async def start_server(self, host: str, port: int, path: str = '/metrics') -> web.AppRunner:
+        """HTTP-сервер с метриками; работает рядом с polling или вебхуком"""
+        async def handle(request: web.Request) -> web.Response:
+            return web.Response(body=self.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+        app = web.Application()
+        app.router.add_get(path, handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"Метрики доступны на {host}:{port}{path}")
+        return runner
+
+
+# Общий реестр метрик процесса
+metrics = MetricsRegistry()
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from sqlalchemy import select, update
+
+from models import OperatorNotification
+
+logger = logging.getLogger(__name__)
+
+
+class OperatorNotifier:
+    """Очередь уведомлений оператора.
+
+    Обращения, пришедшие в течение digest_window секунд, отправляются одной сводкой.
+    Повторные обращения пользователя, ожидающие отправки, объединяются с первым, а
+    после отправки в течение dedupe_window секунд не дублируются. Лимиты Telegram на
+    сообщения в группу соблюдает SendScheduler в bot.session; отказ RetryAfter, оставшийся
+    после его повторов, переживается паузой. Неотправленные обращения хранятся в БД
+    и дошлются после перезапуска.
+    """
+
+    def __init__(self, bot: Bot, chat_id: int, session_factory=None,
+                 digest_window: float = 5.0, dedupe_window: float = 600.0, max_length: int = 4000):
+        self.bot = bot
+        self.chat_id = chat_id
+        self._session_factory = session_factory
+        self.digest_window = digest_window
+        self.dedupe_window = dedupe_window
+        self.max_length = max_length
+        # telegram_id -> обращение, ожидающее отправки
+        self._pending: "OrderedDict[int, Dict]" = OrderedDict()
+        # telegram_id -> момент последней отправки (для подавления повторов)
+        self._last_sent: Dict[int, float] = {}
+        self._event = asyncio.Event()
+        self._stop_event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.sent_count = 0
+        self.merged_count = 0
+        self.suppressed_count = 0
+
+    def submit(self, telegram_id: int, client: str, description: str):
+        """Ставит обращение в очередь (без ожидания)"""
+        pending = self._pending.get(telegram_id)
+        if pending is not None:
+            pending['description'] = description
+            pending['count'] += 1
+            pending['dirty'] = True
+            self.merged_count += 1
+            logger.info(f"Повторное обращение пользователя {telegram_id} объединено с ожидающим отправки")
+            self._event.set()
+            return
+
+        last_sent = self._last_sent.get(telegram_id)
+        if last_sent is not None and time.monotonic() - last_sent < self.dedupe_window:
+            self.suppressed_count += 1
+            logger.info(f"Обращение пользователя {telegram_id} уже передано оператору - повтор не отправляется")
+            return
+
+        self._pending[telegram_id] = {
+            'id': None,
+            'telegram_id': telegram_id,
+            'client': client,
+            'description': description,
+            'count': 1,
+            'created_at': datetime.now(),
+            'dirty': True,
+        }
+        self._event.set()
+
+    def start(self):
+        """Запускает фоновую отправку"""
+        if self._task is None or self._task.done():
+            self._stop_event.clear()
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Очередь уведомлений оператора запущена (окно сводки: {self.digest_window} с)")
+
+    async def stop(self):
+        """Останавливает отправку: последняя попытка отправить сводку, остальное остается в БД"""
+        if self._task is None:
+            return
+        self._stop_event.set()
+        self._event.set()
+        await self._task
+        self._task = None
+        logger.info(f"Очередь уведомлений оператора остановлена (не отправлено: {len(self._pending)})")
+
+    async def _run(self):
+        await self._load_pending()
+        while not self._stop_event.is_set():
+            if not self._pending:
+                await self._event.wait()
+            self._event.clear()
+            await self._save_pending()
+            if self._stop_event.is_set():
+                break
+
+            # Окно сбора сводки: обращения, пришедшие за это время, уйдут одним сообщением
+            await self._sleep(self.digest_window)
+            await self._save_pending()
+            if not await self._send_digest():
+                await self._sleep(self.digest_window)
+
+        await self._save_pending()
+        if self._pending:
+            await self._send_digest(final=True)
+
+    async def _sleep(self, delay: float):
+        """Пауза, прерываемая остановкой"""
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _send_digest(self, final: bool = False) -> bool:
+        """Отправляет все ожидающие обращения; возвращает True, если очередь опустела"""
+        entries = list(self._pending.values())
+        for chunk, text in self._format_digest(entries):
+            # Повтор, объединенный с обращением во время отправки, меняет счетчик
+            sent_counts = [entry['count'] for entry in chunk]
+            while True:
+                try:
+                    await self.bot.send_message(chat_id=self.chat_id, text=text)
+                    break
+                except TelegramRetryAfter as e:
+                    logger.warning(f"Telegram ограничил отправку оператору, повтор через {e.retry_after} с")
+                    if final:
+                        return False
+                    await self._sleep(e.retry_after)
+                    if self._stop_event.is_set():
+                        return False
+                except Exception as e:
+                    logger.error(f"Ошибка отправки уведомления оператору (обращения сохранены): {e}")
+                    return False
+
+            await self._mark_sent(chunk, sent_counts)
+        return not self._pending
+
+    def _format_digest(self, entries: List[Dict]):
+        """Разбивает обращения на сообщения не длиннее max_length"""
+        if len(entries) == 1:
+            yield entries, self._format_single(entries[0])
+            return
+
+        chunk: List[Dict] = []
+        blocks: List[str] = []
+        length = 0
+        for entry in entries:
+            block = self._format_block(len(chunk) + 1, entry)
+            if chunk and length + len(block) > self.max_length - 100:
+                yield chunk, self._digest_header(len(chunk)) + "\n\n".join(blocks)
+                chunk, blocks, length = [], [], 0
+                block = self._format_block(1, entry)
+            chunk.append(entry)
+            blocks.append(block)
+            length += len(block) + 2
+        if chunk:
+            yield chunk, self._digest_header(len(chunk)) + "\n\n".join(blocks)
+
+    def _digest_header(self, count: int) -> str:
+        return f"ТРЕБУЕТСЯ ОПЕРАТОР (обращений: {count})\n\n"
+
+    def _format_single(self, entry: Dict) -> str:
+        repeats = f"Повторных обращений: {entry['count'] - 1}\n" if entry['count'] > 1 else ""
+        return (
+            f"ТРЕБУЕТСЯ ОПЕРАТОР\n\n"
+            f"Клиент: {entry['client']}\n"
+            f"ID: {entry['telegram_id']}\n"
+            f"Проблема: {entry['description']}\n"
+            f"{repeats}\n"
+            f"Время: {entry['created_at'].strftime('%H:%M %d.%m.%Y')}"
+        )[:self.max_length]
+
+    def _format_block(self, number: int, entry: Dict) -> str:
+        repeats = f" (обращений: {entry['count']})" if entry['count'] > 1 else ""
+        return (
+            f"{number}. Клиент: {entry['client']}, ID: {entry['telegram_id']}{repeats}\n"
+            f"Проблема: {entry['description'][:1000]}\n"
+            f"Время: {entry['created_at'].strftime('%H:%M %d.%m.%Y')}"
+        )
+
+    async def _load_pending(self):
+        """Загружает неотправленные обращения, сохраненные до перезапуска"""
+        if self._session_factory is None:
+            return
+        try:
+            async with self._session_factory() as session:
+                result = await session.execute(
+                    select(OperatorNotification)
+                    .where(OperatorNotification.sent_at.is_(None))
+                    .order_by(OperatorNotification.id)
+                )
+                rows = result.scalars().all()
+        except Exception as e:
+            logger.error(f"Ошибка загрузки неотправленных уведомлений оператора: {e}")
+            return
+
+        for row in rows:
+            self._pending.setdefault(row.telegram_id, {
+                'id': row.id,
+                'telegram_id': row.telegram_id,
+                'client': row.client,
+                'description': row.description,
+                'count': row.repeat_count,
+                'created_at': row.created_at,
+                'dirty': False,
+            })
+        if rows:
+            logger.info(f"Загружено неотправленных уведомлений оператора: {len(rows)}")
+            self._event.set()
+
+    async def _save_pending(self):
+        """Сохраняет новые и измененные обращения в БД"""
+        dirty = [entry for entry in self._pending.values() if entry['dirty']]
+        if not dirty or self._session_factory is None:
+            return
+        try:
+            created = []
+            async with self._session_factory() as session:
+                async with session.begin():
+                    for entry in dirty:
+                        if entry['id'] is None:
+                            row = OperatorNotification(
+                                telegram_id=entry['telegram_id'],
+                                client=entry['client'],
+                                description=entry['description'],
+                                repeat_count=entry['count'],
+                                created_at=entry['created_at'],
+                            )
+                            session.add(row)
+                            created.append((entry, row))
+                        else:
+                            await session.execute(
+                                update(OperatorNotification)
+                                .where(OperatorNotification.id == entry['id'])
+                                .values(description=entry['description'], repeat_count=entry['count'])
+                            )
+            # Идентификаторы закрепляются только после успешной фиксации
+            for entry, row in created:
+                entry['id'] = row.id
+            for entry in dirty:
+                entry['dirty'] = False
+        except Exception as e:
+            logger.error(f"Ошибка сохранения уведомлений оператора: {e}")
+
+    async def _mark_sent(self, entries: List[Dict], sent_counts: List[int]):
+        """Убирает отправленные обращения из очереди и отмечает их в БД.
+
+        Обращение, к которому во время отправки добавился повтор, остается в очереди
+        и уйдет следующей сводкой с новым описанием.
+        """
+        now = time.monotonic()
+        sent = []
+        for entry, sent_count in zip(entries, sent_counts):
+            if entry['count'] != sent_count:
+                logger.info(f"Обращение пользователя {entry['telegram_id']} изменилось во время отправки - повторим")
+                continue
+            self._pending.pop(entry['telegram_id'], None)
+            self._last_sent[entry['telegram_id']] = now
+            sent.append(entry)
+        self.sent_count += len(sent)
+
+        # Старые отметки больше не подавляют повторы
+        for telegram_id in [tid for tid, sent_at in self._last_sent.items() if now - sent_at >= self.dedupe_window]:
+            del self._last_sent[telegram_id]
+
+        ids = [entry['id'] for entry in sent if entry['id'] is not None]
+        if not ids or self._session_factory is None:
+            return
+        try:
+            async with self._session_factory() as session:
+                async with session.begin():
+                    await session.execute(
+                        update(OperatorNotification)
+                        .where(OperatorNotification.id.in_(ids))
+                        .values(sent_at=datetime.now())
+                    )
+        except Exception as e:
+            logger.error(f"Ошибка отметки отправленных уведомлений оператора: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'pending': len(self._pending),
+            'sent': self.sent_count,
+            'merged': self.merged_count,
+            'suppressed': self.suppressed_count,
+        }
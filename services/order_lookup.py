@@ -0,0 +1,168 @@
+import csv
+import logging
+import os
+import sqlite3
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class OrderIndex:
+    """Отсортированный массив номеров заказов (8 байт на заказ) с двоичным поиском"""
+
+    def __init__(self, numbers: Optional[array] = None):
+        self._numbers = numbers if numbers is not None else array('q')
+
+    @classmethod
+    def build(cls, numbers: Iterable[int]) -> "OrderIndex":
+        """Строит индекс; уже отсортированный поток (ORDER BY) не пересортировывается"""
+        values = array('q')
+        is_sorted = True
+        previous = None
+        for number in numbers:
+            if previous is not None and number <= previous:
+                if number == previous:
+                    # Повтор подряд: в отсортированном потоке это единственный вид повторов
+                    continue
+                is_sorted = False
+            values.append(number)
+            previous = number
+
+        if is_sorted:
+            return cls(values)
+
+        # Поток вперемешку: сортируем и убираем оставшиеся повторы за один проход
+        unique = array('q')
+        previous = None
+        for number in sorted(values):
+            if number != previous:
+                unique.append(number)
+                previous = number
+        return cls(unique)
+
+    def __contains__(self, number: int) -> bool:
+        numbers = self._numbers
+        position = bisect_left(numbers, number)
+        return position < len(numbers) and numbers[position] == number
+
+    def __len__(self) -> int:
+        return len(self._numbers)
+
+    @property
+    def nbytes(self) -> int:
+        return self._numbers.itemsize * len(self._numbers)
+
+
+class OrderLookup:
+    """Поиск заказа по номеру в снимке заказов (CSV или SQLite) с LRU последних запросов.
+
+    Снимок загружается целиком в OrderIndex; reload() строит новый индекс и подменяет
+    старый одним присваиванием, так что поиск не блокируется на время перезагрузки.
+    """
+
+    def __init__(self, path: str, table: str = 'orders', column: str = 'order_number', cache_size: int = 1024):
+        self.path = path
+        self.table = table
+        self.column = column
+        self.cache_size = cache_size
+        self._index = OrderIndex()
+        self._recent: "OrderedDict[int, bool]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def exists(self, order_number: str) -> bool:
+        """Есть ли заказ с таким номером в снимке"""
+        try:
+            number = int(order_number)
+        except (TypeError, ValueError):
+            return False
+
+        found = self._recent.get(number)
+        if found is not None:
+            self._recent.move_to_end(number)
+            self.hits += 1
+            return found
+
+        self.misses += 1
+        found = number in self._index
+        self._recent[number] = found
+        if len(self._recent) > self.cache_size:
+            self._recent.popitem(last=False)
+        return found
+
+    def load(self, numbers: Iterable[int]):
+        """Массовая загрузка номеров заказов (заменяет текущий индекс)"""
+        index = OrderIndex.build(numbers)
+        self._index = index
+        self._recent.clear()
+        logger.info(f"Индекс заказов загружен: {len(index)} заказов, {index.nbytes // 1024} КБ")
+
+    def reload(self):
+        """Перечитывает снимок заказов из файла"""
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Снимок заказов не найден: {self.path}")
+
+        if self.path.endswith(('.db', '.sqlite', '.sqlite3')):
+            self.load(self._read_sqlite())
+        else:
+            self.load(self._read_csv())
+
+    def _read_csv(self) -> Iterable[int]:
+        with open(self.path, newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                return
+            # Колонка с номером заказа по заголовку; без заголовка - первая колонка
+            if self.column in header:
+                position = header.index(self.column)
+            else:
+                position = 0
+                if header and header[0].strip().isdigit():
+                    yield int(header[0])
+            for row in reader:
+                if len(row) > position and row[position].strip().isdigit():
+                    yield int(row[position])
+
+    def _read_sqlite(self) -> Iterable[int]:
+        # Только чтение: снимок не должен блокироваться или меняться ботом
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            cursor = connection.execute(
+                f'SELECT "{self.column}" FROM "{self.table}" '
+                f'WHERE "{self.column}" IS NOT NULL ORDER BY "{self.column}"'
+            )
+            for (value,) in cursor:
+                try:
+                    yield int(value)
+                except (TypeError, ValueError):
+                    continue
+        finally:
+            connection.close()
+
+    def stats(self) -> dict:
+        return {
+            'orders': len(self._index),
+            'bytes': self._index.nbytes,
+            'cache_size': len(self._recent),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+class DemoOrderLookup:
+    """Демо-режим без снимка: найдены все заказы, кроме фиксированного набора «ненайденных»"""
+
+    NOT_FOUND_ORDERS = frozenset({'999999', '888888', '777777', '666666', '555555'})
+
+    def exists(self, order_number: str) -> bool:
+        return order_number not in self.NOT_FOUND_ORDERS
+
+    def reload(self):
+        pass
+
+    def stats(self) -> dict:
+        return {'orders': 0, 'demo': True}
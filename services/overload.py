@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class OverloadController:
+    """Переключатель режима работы при перегрузке.
+
+    Фоновая задача раз в interval секунд измеряет задержку цикла событий (насколько позже
+    срока проснулся sleep) и опрашивает число обновлений в работе и очередь к DeepSeek.
+    Если любой показатель достиг порога, включается упрощенный режим: только ответы по
+    ключевым словам и меню, без DeepSeek. Обратно - когда все показатели держатся ниже
+    recover_ratio от порогов recover_seconds секунд подряд (гистерезис, без дребезга).
+    """
+
+    NORMAL = 'normal'
+    DEGRADED = 'degraded'
+
+    def __init__(self, in_flight: Callable[[], int], llm_queue: Callable[[], int],
+                 max_in_flight: int, max_loop_lag: float, max_llm_queue: int,
+                 recover_ratio: float = 0.5, recover_seconds: float = 10.0):
+        self._in_flight = in_flight
+        self._llm_queue = llm_queue
+        self.max_in_flight = max_in_flight
+        self.max_loop_lag = max_loop_lag
+        self.max_llm_queue = max_llm_queue
+        self.recover_ratio = recover_ratio
+        self.recover_seconds = recover_seconds
+        self.mode = self.NORMAL
+        self.loop_lag = 0.0
+        self._calm_since: Optional[float] = None
+        self._changed_at = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self.degraded_count = 0
+        self.recovered_count = 0
+        self.degraded_seconds = 0.0
+        self.shed_count = 0
+
+    @property
+    def degraded(self) -> bool:
+        return self.mode == self.DEGRADED
+
+    def shed(self):
+        """Отмечает сообщение, обработанное в упрощенном режиме"""
+        self.shed_count += 1
+
+    def _signals(self) -> Dict[str, float]:
+        return {'in_flight': self._in_flight(), 'loop_lag': self.loop_lag, 'llm_queue': self._llm_queue()}
+
+    def _load(self, signals: Dict[str, float]) -> float:
+        """Самый нагруженный показатель как доля от своего порога"""
+        return max(
+            signals['in_flight'] / self.max_in_flight,
+            signals['loop_lag'] / self.max_loop_lag,
+            signals['llm_queue'] / self.max_llm_queue,
+        )
+
+    def update(self, now: Optional[float] = None) -> str:
+        """Пересчитывает режим по текущим показателям"""
+        now = time.monotonic() if now is None else now
+        signals = self._signals()
+        load = self._load(signals)
+
+        if self.mode == self.NORMAL:
+            if load >= 1.0:
+                self._switch(self.DEGRADED, now, signals)
+        elif load > self.recover_ratio:
+            self._calm_since = None
+        elif self._calm_since is None:
+            self._calm_since = now
+        elif now - self._calm_since >= self.recover_seconds:
+            self._switch(self.NORMAL, now, signals)
+        return self.mode
+
+    def _switch(self, mode: str, now: float, signals: Dict[str, float]):
+        duration = now - self._changed_at
+        self.mode = mode
+        self._changed_at = now
+        self._calm_since = None
+        details = (
+            f"в работе {signals['in_flight']}, задержка цикла {signals['loop_lag'] * 1000:.0f} мс, "
+            f"очередь DeepSeek {signals['llm_queue']}"
+        )
+        if mode == self.DEGRADED:
+            self.degraded_count += 1
+            logger.warning(f"Перегрузка: упрощенный режим без DeepSeek ({details})")
+        else:
+            self.recovered_count += 1
+            self.degraded_seconds += duration
+            logger.info(f"Нагрузка снизилась: обычный режим после {duration:.1f} с упрощенного ({details})")
+
+    async def _monitor_loop(self, interval: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.loop_lag = max(0.0, loop.time() - expected)
+            try:
+                self.update()
+            except Exception as e:
+                logger.error(f"Ошибка контроля нагрузки: {e}", exc_info=True)
+
+    def start(self, interval: float):
+        """Запускает фоновое измерение нагрузки"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._monitor_loop(interval))
+            logger.info(f"Контроль перегрузки запущен (интервал: {interval} с)")
+
+    async def stop(self):
+        """Останавливает фоновое измерение нагрузки"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, float]:
+        degraded_seconds = self.degraded_seconds
+        if self.degraded:
+            degraded_seconds += time.monotonic() - self._changed_at
+        return {
+            'mode': self.mode,
+            'loop_lag_ms': round(self.loop_lag * 1000, 1),
+            'degraded_count': self.degraded_count,
+            'recovered_count': self.recovered_count,
+            'degraded_seconds': round(degraded_seconds, 1),
+            'shed': self.shed_count,
+        }
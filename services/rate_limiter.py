@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RequestLimiter:
+    """Ограничитель исходящих запросов: не больше max_concurrency одновременно и не чаще rps в секунду.
+
+    Ожидающие запросы стоят в очередях по ключу (пользователю), а разрешения выдаются
+    по кругу между ключами: всплеск запросов одного пользователя не задерживает остальных.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, rps: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.rps = rps
+        # Корзина токенов: емкость не меньше одного запроса
+        self._capacity = max(1.0, rps)
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._in_flight = 0
+        self._queues: Dict[Hashable, Deque[asyncio.Future]] = {}
+        self._ring: Deque[Hashable] = deque()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self.granted_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _take_token(self) -> bool:
+        if self.rps <= 0:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self.rps)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self, key: Hashable = None):
+        """Ждет разрешения на запрос; при отмене ожидания место в очереди освобождается"""
+        if not self._ring and self._in_flight < self.max_concurrency and self._take_token():
+            self._in_flight += 1
+            self.granted_count += 1
+            return
+
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._ring.append(key)
+        queue.append(future)
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Разрешение выдано одновременно с отменой - возвращаем его
+                self.release()
+            else:
+                self._remove_waiter(key, future)
+            raise
+
+        waited = time.monotonic() - started
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    def release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable = None):
+        """Контекст одного запроса: async with limiter.slot(user_id): ..."""
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _remove_waiter(self, key: Hashable, future: asyncio.Future):
+        queue = self._queues.get(key)
+        if queue is None or future not in queue:
+            return
+        queue.remove(future)
+        if not queue:
+            del self._queues[key]
+            self._ring.remove(key)
+
+    def _dispatch(self):
+        """Выдает разрешения ожидающим по кругу, пока есть свободные места и токены"""
+        while self._ring and self._in_flight < self.max_concurrency:
+            key = self._ring[0]
+            queue = self._queues[key]
+            if queue[0].done():
+                # Ожидание уже отменено (например, таймаут wait_for), а задача еще не убрала
+                # его из очереди - разрешение ему не выдается
+                queue.popleft()
+                if not queue:
+                    del self._queues[key]
+                    self._ring.popleft()
+                continue
+
+            if not self._take_token():
+                self._schedule_wakeup()
+                return
+
+            self._ring.popleft()
+            future = queue.popleft()
+            if queue:
+                self._ring.append(key)
+            else:
+                del self._queues[key]
+
+            self._in_flight += 1
+            self.granted_count += 1
+            future.set_result(None)
+
+    def _schedule_wakeup(self):
+        """Повторная раздача, когда накопится следующий токен"""
+        if self._wakeup is not None:
+            return
+        delay = max(0.0, (1 - self._tokens) / self.rps)
+        self._wakeup = asyncio.get_running_loop().call_later(delay, self._on_wakeup)
+
+    def _on_wakeup(self):
+        self._wakeup = None
+        self._dispatch()
+
+    def stats(self) -> Dict[str, float]:
+        """Глубина очереди, запросы в работе и время ожидания разрешения"""
+        return {
+            'queue_depth': self.queue_depth,
+            'in_flight': self._in_flight,
+            'granted': self.granted_count,
+            'avg_wait': round(self.wait_total / self.granted_count, 3) if self.granted_count else 0.0,
+            'max_wait': round(self.wait_max, 3),
+        }
@@ -0,0 +1,73 @@
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r'[^\w\s]+')
+
+
+def normalize_question(text: str) -> str:
+    """Приводит вопрос к каноническому виду: регистр, ё, пунктуация, пробелы"""
+    text = text.lower().replace('ё', 'е')
+    return ' '.join(_PUNCTUATION.sub(' ', text).split())
+
+
+class ResponseCache:
+    """Кэш ответов с TTL и ограничением размера (LRU) и счетчиками попаданий.
+
+    Срок жизни отсчитывается от записи: устаревший ответ не продлевается обращениями.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # ключ -> (ответ, момент истечения по time.monotonic())
+        self._entries: "OrderedDict[Hashable, Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evicted_count = 0
+        self.expired_count = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry[1] <= time.monotonic():
+            del self._entries[key]
+            self.expired_count += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Hashable, value: str):
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted_count += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Размер, попадания/промахи и доля попаданий"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'evicted': self.evicted_count,
+            'expired': self.expired_count,
+        }
@@ -0,0 +1,192 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    CopyMessage, EditMessageCaption, EditMessageMedia, EditMessageReplyMarkup, EditMessageText,
+    ForwardMessage, Response, SendAnimation, SendAudio, SendContact, SendDocument, SendLocation,
+    SendMediaGroup, SendMessage, SendPhoto, SendPoll, SendSticker, SendVideo, SendVoice, TelegramMethod
+)
+
+logger = logging.getLogger(__name__)
+
+# Методы, которые Telegram учитывает в лимитах отправки (sendChatAction и служебные запросы не ограничиваются)
+THROTTLED_METHODS = (
+    SendMessage, SendPhoto, SendDocument, SendVideo, SendAudio, SendVoice, SendAnimation,
+    SendSticker, SendMediaGroup, SendLocation, SendContact, SendPoll, ForwardMessage, CopyMessage,
+    EditMessageText, EditMessageCaption, EditMessageReplyMarkup, EditMessageMedia,
+)
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity в запасе"""
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0:
+            raise ValueError(f"Скорость корзины токенов должна быть больше 0: {rate}")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # Запрет отправки до этого момента (RetryAfter от Telegram)
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Забирает токен (возможно, в долг) и возвращает, сколько секунд подождать до отправки"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def ready_in(self) -> float:
+        """Через сколько секунд появится токен (без списания)"""
+        now = time.monotonic()
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def idle(self, now: float) -> bool:
+        return now - self.updated > self.capacity / self.rate and now >= self.blocked_until
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """Планировщик исходящих сообщений (middleware запросов bot.session).
+
+    Каждая отправка сначала ждет токен корзины своего чата (личный чат или группа),
+    затем - токен общей корзины бота. Очередь к общей корзине упорядочена по приоритету:
+    сообщения в чаты из priority_chat_ids (оператор) уходят первыми. На RetryAfter
+    планировщик блокирует чат на указанное время и повторяет запрос сам.
+    """
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: int = 3,
+                 group_per_minute: int = 20, max_retries: int = 3,
+                 priority_chat_ids: Iterable[int] = ()):
+        if global_rate <= 0 or chat_rate <= 0 or chat_burst <= 0 or group_per_minute <= 0:
+            raise ValueError(
+                f"Лимиты отправки должны быть больше 0: global_rate={global_rate}, chat_rate={chat_rate}, "
+                f"chat_burst={chat_burst}, group_per_minute={group_per_minute}"
+            )
+        if max_retries < 0:
+            raise ValueError(f"max_retries не может быть отрицательным: {max_retries}")
+        self.global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_per_minute / 60
+        self.max_retries = max_retries
+        self.priority_chat_ids = {chat_id for chat_id in priority_chat_ids if chat_id is not None}
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        # Очередь к общей корзине: (приоритет, порядковый номер, future)
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self.sent_count = 0
+        self.retry_after_count = 0
+        self.wait_total = 0.0
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= 10000:
+                self._prune()
+            # У групп и каналов id отрицательный, лимит у них поминутный
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_rate, capacity=self.chat_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, capacity=self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _prune(self):
+        """Удаляет корзины чатов, которые давно ничего не отправляли"""
+        now = time.monotonic()
+        for chat_id in [cid for cid, bucket in self._chat_buckets.items() if bucket.idle(now)]:
+            del self._chat_buckets[chat_id]
+
+    async def _acquire_global(self, priority: int):
+        """Ждет токен общей корзины в порядке приоритета"""
+        if not self._waiters and self.global_bucket.ready_in() == 0:
+            self.global_bucket.take()
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._dispatch()
+        # Отмененные ожидания остаются в куче и пропускаются при раздаче
+        await future
+
+    def _dispatch(self):
+        while self._waiters:
+            if self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+                continue
+            delay = self.global_bucket.ready_in()
+            if delay > 0:
+                if self._wakeup is None:
+                    self._wakeup = asyncio.get_running_loop().call_later(delay, self._on_wakeup)
+                return
+            self.global_bucket.take()
+            heapq.heappop(self._waiters)[2].set_result(None)
+
+    def _on_wakeup(self):
+        self._wakeup = None
+        self._dispatch()
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Response:
+        chat_id = getattr(method, 'chat_id', None)
+        if not isinstance(method, THROTTLED_METHODS) or not isinstance(chat_id, int):
+            return await make_request(bot, method)
+
+        priority = PRIORITY_HIGH if chat_id in self.priority_chat_ids else PRIORITY_NORMAL
+        bucket = self._chat_bucket(chat_id)
+        started = time.monotonic()
+
+        for attempt in range(self.max_retries + 1):
+            delay = bucket.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._acquire_global(priority)
+            waited = time.monotonic() - started
+
+            try:
+                response = await make_request(bot, method)
+                self.sent_count += 1
+                self.wait_total += waited
+                return response
+            except TelegramRetryAfter as e:
+                self.retry_after_count += 1
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(
+                    f"RetryAfter для чата {chat_id}: пауза {e.retry_after} с "
+                    f"(попытка {attempt + 1} из {self.max_retries})"
+                )
+                bucket.block(e.retry_after)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'queue_depth': len(self._waiters),
+            'sent': self.sent_count,
+            'retry_after': self.retry_after_count,
+            'avg_wait': round(self.wait_total / self.sent_count, 3) if self.sent_count else 0.0,
+            'chats': len(self._chat_buckets),
+        }
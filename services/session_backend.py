@@ -0,0 +1,97 @@
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в сессию")
+
+
+def _decode_hook(value: Dict) -> Any:
+    if len(value) == 1 and '$dt' in value:
+        return datetime.fromisoformat(value['$dt'])
+    return value
+
+
+def encode_session(session: Dict) -> bytes:
+    """Компактная сериализация сессии (JSON без пробелов, datetime в ISO-формате)"""
+    return json.dumps(session, ensure_ascii=False, separators=(',', ':'), default=_encode_default).encode('utf-8')
+
+
+def decode_session(raw: bytes) -> Dict:
+    """Обратное преобразование для encode_session"""
+    return json.loads(raw, object_hook=_decode_hook)
+
+
+class InMemorySessionBackend:
+    """Бэкенд по умолчанию: состояние живет только в памяти процесса"""
+
+    is_external = False
+
+    async def load(self, user_id: int, names: Iterable[str]) -> Dict[str, Dict]:
+        return {}
+
+    async def save(self, user_id: int, sessions: Dict[str, Optional[Dict]], ttls: Dict[str, int]):
+        pass
+
+    async def close(self):
+        pass
+
+
+class RedisSessionBackend:
+    """Внешнее хранилище сессий по протоколу Redis (Redis, KeyDB, Valkey, fakeredis).
+
+    Сессия каждого сценария лежит в отдельном ключе <prefix>:<сценарий>:<user_id> со сроком
+    жизни сценария. Все сессии пользователя читаются одним MGET, а изменения
+    записываются одним конвейером (pipeline) без транзакции.
+    """
+
+    is_external = True
+
+    def __init__(self, url: str, prefix: str = 'bot:session', client: Any = None):
+        self.prefix = prefix
+        if client is None:
+            try:
+                import redis.asyncio as aioredis
+            except ImportError as e:
+                raise RuntimeError("Для SESSION_BACKEND=redis установите пакет redis (pip install redis)") from e
+            client = aioredis.from_url(url)
+        self._redis = client
+        logger.info(f"Бэкенд сессий Redis подключен (префикс ключей: {prefix})")
+
+    def _key(self, name: str, user_id: int) -> str:
+        return f"{self.prefix}:{name}:{user_id}"
+
+    async def load(self, user_id: int, names: Iterable[str]) -> Dict[str, Dict]:
+        """Читает все сессии пользователя за один запрос"""
+        names = list(names)
+        values = await self._redis.mget([self._key(name, user_id) for name in names])
+        return {
+            name: decode_session(raw)
+            for name, raw in zip(names, values)
+            if raw is not None
+        }
+
+    async def save(self, user_id: int, sessions: Dict[str, Optional[Dict]], ttls: Dict[str, int]):
+        """Записывает (или удаляет, если сессия None) сессии пользователя одним конвейером"""
+        if not sessions:
+            return
+
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for name, session in sessions.items():
+                key = self._key(name, user_id)
+                if session is None:
+                    pipe.delete(key)
+                else:
+                    pipe.set(key, encode_session(session), ex=ttls[name])
+            await pipe.execute()
+
+    async def close(self):
+        close = getattr(self._redis, 'aclose', None) or self._redis.close
+        await close()
+        logger.info("Бэкенд сессий Redis отключен")
@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from services.session_backend import InMemorySessionBackend
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class SessionStore:
+    """Хранилище сессий одного сценария с TTL и ограничением размера (LRU).
+
+    Ведет себя как словарь user_id -> сессия. Срок жизни отсчитывается от последнего
+    обращения, поэтому порядок LRU совпадает с порядком истечения, и очистка
+    снимает просроченные записи с начала очереди без полного обхода.
+
+    Хранилища сценариев (exclusive=True) регистрируют пользователя в индексе
+    активных сценариев реестра: у пользователя может быть только один активный сценарий.
+    """
+
+    def __init__(self, name: str, ttl: timedelta, max_entries: int,
+                 exclusive: bool = False, registry: Optional["SessionRegistry"] = None):
+        self.name = name
+        self.ttl_seconds = ttl.total_seconds()
+        self.max_entries = max_entries
+        self.exclusive = exclusive
+        self._registry = registry
+        # user_id -> [сессия, момент истечения по time.monotonic()]
+        self._entries: "OrderedDict[int, List[Any]]" = OrderedDict()
+        self.expired_count = 0
+        self.evicted_count = 0
+
+    def _is_expired(self, entry: List[Any], now: float) -> bool:
+        return entry[1] <= now
+
+    def _released(self, user_id: int):
+        """Снимает пользователя с индекса активных сценариев"""
+        if self.exclusive and self._registry is not None:
+            self._registry._release(self.name, user_id)
+
+    def __contains__(self, user_id: int) -> bool:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return False
+        if self._is_expired(entry, time.monotonic()):
+            del self._entries[user_id]
+            self.expired_count += 1
+            self._released(user_id)
+            return False
+        return True
+
+    def __getitem__(self, user_id: int) -> Dict:
+        value = self.get(user_id, _MISSING)
+        if value is _MISSING:
+            raise KeyError(user_id)
+        return value
+
+    def __setitem__(self, user_id: int, session: Dict):
+        if self.exclusive and self._registry is not None and user_id not in self._entries:
+            self._registry._claim(self.name, user_id)
+
+        now = time.monotonic()
+        self._entries[user_id] = [session, now + self.ttl_seconds]
+        self._entries.move_to_end(user_id)
+
+        while len(self._entries) > self.max_entries:
+            evicted_id, _ = self._entries.popitem(last=False)
+            self.evicted_count += 1
+            self._released(evicted_id)
+            logger.info(f"Сессия '{self.name}' пользователя {evicted_id} вытеснена (превышен лимит {self.max_entries})")
+
+    def __delitem__(self, user_id: int):
+        del self._entries[user_id]
+        self._released(user_id)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: int, default: Any = None) -> Any:
+        """Возвращает сессию и продлевает ее срок жизни"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return default
+
+        now = time.monotonic()
+        if self._is_expired(entry, now):
+            del self._entries[user_id]
+            self.expired_count += 1
+            self._released(user_id)
+            return default
+
+        entry[1] = now + self.ttl_seconds
+        self._entries.move_to_end(user_id)
+        return entry[0]
+
+    def pop(self, user_id: int, default: Any = None) -> Any:
+        """Удаляет сессию и возвращает ее"""
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return default
+        self._released(user_id)
+        return entry[0]
+
+    def sweep(self) -> int:
+        """Удаляет просроченные сессии, возвращает их количество"""
+        now = time.monotonic()
+        removed = 0
+        while self._entries:
+            user_id, entry = next(iter(self._entries.items()))
+            if not self._is_expired(entry, now):
+                break
+            del self._entries[user_id]
+            self._released(user_id)
+            removed += 1
+
+        self.expired_count += removed
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        """Текущий размер и счетчики удалений"""
+        return {
+            'size': len(self._entries),
+            'expired': self.expired_count,
+            'evicted': self.evicted_count,
+        }
+
+
+class SessionRegistry:
+    """Реестр всех хранилищ сессий с фоновой очисткой просроченных записей"""
+
+    def __init__(self):
+        self._stores: Dict[str, SessionStore] = {}
+        # Индекс активных сценариев: user_id -> имя хранилища, владеющего сессией
+        self._active_flows: Dict[int, str] = {}
+        self._sweeper_task: Optional[asyncio.Task] = None
+        self.backend = InMemorySessionBackend()
+        # Для внешнего бэкенда: какие сессии пользователя были прочитаны в начале обработки
+        self._loaded: Dict[int, Set[str]] = {}
+
+    def create_store(self, name: str, ttl: timedelta, max_entries: int, exclusive: bool = False) -> SessionStore:
+        """Создает и регистрирует хранилище сессий.
+
+        exclusive=True - хранилище сценария диалога, участвует в индексе активных сценариев.
+        """
+        if name in self._stores:
+            raise ValueError(f"Хранилище сессий '{name}' уже зарегистрировано")
+
+        store = SessionStore(name, ttl, max_entries, exclusive=exclusive, registry=self)
+        self._stores[name] = store
+        logger.info(f"Хранилище сессий '{name}' создано (TTL: {ttl}, лимит: {max_entries})")
+        return store
+
+    def _claim(self, name: str, user_id: int):
+        """Назначает сценарий пользователю, завершая предыдущий активный сценарий"""
+        previous = self._active_flows.get(user_id)
+        if previous is not None and previous != name:
+            self._stores[previous].pop(user_id)
+            logger.info(f"Сценарий '{previous}' пользователя {user_id} завершен: начат сценарий '{name}'")
+        self._active_flows[user_id] = name
+
+    def _release(self, name: str, user_id: int):
+        if self._active_flows.get(user_id) == name:
+            del self._active_flows[user_id]
+
+    def active_flow(self, user_id: int) -> Optional[str]:
+        """Возвращает имя активного сценария пользователя или None"""
+        name = self._active_flows.get(user_id)
+        if name is None:
+            return None
+        # Проверка членства заодно снимает просроченную сессию с индекса
+        if user_id in self._stores[name]:
+            return name
+        return None
+
+    def clear_user(self, user_id: int) -> Optional[str]:
+        """Завершает активный сценарий пользователя, возвращает его имя"""
+        name = self._active_flows.get(user_id)
+        if name is not None:
+            self._stores[name].pop(user_id)
+        return name
+
+    @property
+    def stores(self) -> Dict[str, SessionStore]:
+        return self._stores
+
+    def sweep(self) -> int:
+        """Очищает просроченные сессии во всех хранилищах"""
+        return sum(store.sweep() for store in self._stores.values())
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Размеры и счетчики удалений по всем хранилищам"""
+        return {name: store.stats() for name, store in self._stores.items()}
+
+    def active_flow_count(self) -> int:
+        """Количество пользователей с активным сценарием"""
+        return len(self._active_flows)
+
+    def set_backend(self, backend):
+        """Подключает бэкенд хранения (по умолчанию - память процесса)"""
+        self.backend = backend
+
+    @property
+    def is_external(self) -> bool:
+        return self.backend.is_external
+
+    async def load_user(self, user_id: int):
+        """Загружает все сессии пользователя из внешнего бэкенда перед обработкой обновления"""
+        if not self.backend.is_external:
+            return
+
+        sessions = await self.backend.load(user_id, self._stores.keys())
+        for store in self._stores.values():
+            store.pop(user_id)
+        for name, session in sessions.items():
+            if name in self._stores:
+                self._stores[name][user_id] = session
+        self._loaded[user_id] = set(sessions)
+
+    async def flush_user(self, user_id: int):
+        """Сохраняет сессии пользователя во внешний бэкенд после обработки и освобождает память"""
+        if not self.backend.is_external:
+            return
+
+        loaded = self._loaded.pop(user_id, set())
+        changes: Dict[str, Optional[Dict]] = {}
+        ttls: Dict[str, int] = {}
+        for name, store in self._stores.items():
+            session = store.pop(user_id)
+            if session is not None:
+                changes[name] = session
+                ttls[name] = max(1, int(store.ttl_seconds))
+            elif name in loaded:
+                changes[name] = None
+
+        await self.backend.save(user_id, changes, ttls)
+
+    async def close_backend(self):
+        await self.backend.close()
+
+    async def _sweep_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = self.sweep()
+                if removed:
+                    logger.info(f"Очистка сессий: удалено просроченных {removed}, состояние: {self.stats()}")
+            except Exception as e:
+                logger.error(f"Ошибка фоновой очистки сессий: {e}", exc_info=True)
+
+    def start_sweeper(self, interval: float):
+        """Запускает фоновую задачу очистки"""
+        if self._sweeper_task is None or self._sweeper_task.done():
+            self._sweeper_task = asyncio.create_task(self._sweep_loop(interval))
+            logger.info(f"Фоновая очистка сессий запущена (интервал: {interval} с)")
+
+    async def stop_sweeper(self):
+        """Останавливает фоновую задачу очистки"""
+        if self._sweeper_task is not None:
+            self._sweeper_task.cancel()
+            try:
+                await self._sweeper_task
+            except asyncio.CancelledError:
+                pass
+            self._sweeper_task = None
+
+
+# Общий реестр хранилищ сессий процесса
+session_registry = SessionRegistry()
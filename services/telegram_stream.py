@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import re
+import time
+from typing import Any, AsyncIterator, Optional
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Конец первого предложения: знак препинания перед пробелом или перевод строки
+_SENTENCE_END = re.compile(r'[.!?…](?:\s|$)|\n')
+
+
+class StreamingReply:
+    """Показывает потоковый ответ в Telegram: первое сообщение после первого предложения,
+    затем правки этого сообщения не чаще, чем раз в edit_interval секунд.
+
+    Текст отправляется без разметки: незакрытый тег в середине генерации сломал бы правку.
+    """
+
+    def __init__(self, message: types.Message, edit_interval: float, max_length: int,
+                 reply_markup: Any = None):
+        self.message = message
+        self.edit_interval = edit_interval
+        self.max_length = max_length
+        self.reply_markup = reply_markup
+        self.text = ''
+        self._sent: Optional[types.Message] = None
+        self._shown = ''
+        self._next_edit_at = 0.0
+
+    async def feed(self, delta: str):
+        """Добавляет фрагмент ответа и при необходимости обновляет сообщение"""
+        self.text += delta
+        if self._sent is None:
+            if _SENTENCE_END.search(self.text.lstrip()):
+                await self._send()
+        elif time.monotonic() >= self._next_edit_at:
+            await self._edit()
+
+    async def finish(self) -> Optional[str]:
+        """Показывает полный ответ; возвращает его или None, если текста не было"""
+        if not self.text.strip():
+            return None
+
+        if self._sent is None:
+            await self._send()
+        else:
+            # Финальная правка обязательна - ждем окончания ограничения, если оно действует
+            for _ in range(3):
+                if self._visible_text() == self._shown:
+                    break
+                delay = self._next_edit_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await self._edit()
+        return self.text.strip()
+
+    def _visible_text(self) -> str:
+        return self.text.strip()[:self.max_length]
+
+    async def _send(self):
+        text = self._visible_text()
+        self._sent = await self.message.answer(text, parse_mode=None, reply_markup=self.reply_markup)
+        self._shown = text
+        self._next_edit_at = time.monotonic() + self.edit_interval
+
+    async def _edit(self):
+        text = self._visible_text()
+        if text == self._shown:
+            return
+
+        try:
+            await self._sent.edit_text(text, parse_mode=None)
+            self._shown = text
+            self._next_edit_at = time.monotonic() + self.edit_interval
+        except TelegramRetryAfter as e:
+            logger.warning(f"Ограничение частоты правок, пауза {e.retry_after} с")
+            self._next_edit_at = time.monotonic() + e.retry_after
+        except TelegramBadRequest as e:
+            if 'not modified' in str(e):
+                self._shown = text
+            else:
+                logger.warning(f"Правка сообщения отклонена: {e}")
+            self._next_edit_at = time.monotonic() + self.edit_interval
+
+
+async def send_streaming_reply(message: types.Message, chunks: AsyncIterator[str],
+                               edit_interval: float, max_length: int,
+                               reply_markup: Any = None) -> Optional[str]:
+    """Выводит поток фрагментов ответом на сообщение, возвращает итоговый текст или None"""
+    reply = StreamingReply(message, edit_interval=edit_interval, max_length=max_length,
+                           reply_markup=reply_markup)
+    try:
+        async for delta in chunks:
+            await reply.feed(delta)
+    finally:
+        await chunks.aclose()
+    return await reply.finish()
@@ -0,0 +1,74 @@
+import logging
+from typing import Dict, FrozenSet, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+
+class PhraseMatcher:
+    """Автомат Ахо-Корасик: находит все фразы словарей за один проход по тексту.
+
+    Каждая фраза помечена меткой словаря (например, 'thanks' или 'need_help'),
+    поиск возвращает множество меток, фразы которых встретились в тексте как подстроки.
+    """
+
+    def __init__(self, lexicons: Dict[str, Iterable[str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[FrozenSet[str]] = [frozenset()]
+
+        phrase_count = 0
+        for label, phrases in lexicons.items():
+            for phrase in phrases:
+                self._add_phrase(phrase, label)
+                phrase_count += 1
+
+        self._build_fail_links()
+        logger.info(f"PhraseMatcher построен: {phrase_count} фраз, {len(self._goto)} состояний")
+
+    def _add_phrase(self, phrase: str, label: str):
+        """Добавляет фразу в бор"""
+        node = 0
+        for char in phrase:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(frozenset())
+            node = next_node
+        self._output[node] = self._output[node] | {label}
+
+    def _build_fail_links(self):
+        """Строит суффиксные ссылки обходом бора в ширину"""
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                fail_node = self._goto[fallback].get(char, 0)
+                self._fail[child] = fail_node if fail_node != child else 0
+                # Метки более коротких фраз, оканчивающихся здесь же
+                self._output[child] = self._output[child] | self._output[self._fail[child]]
+
+    def find_labels(self, text: str) -> FrozenSet[str]:
+        """Возвращает метки всех словарей, чьи фразы встречаются в тексте"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        hits = set()
+        node = 0
+
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                hits.update(output[node])
+
+        return frozenset(hits)
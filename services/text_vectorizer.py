@@ -0,0 +1,73 @@
+import math
+import re
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy - необязательная зависимость: без нее локальные модели отключены
+    np = None
+
+NON_WORD_RE = re.compile(r'[^0-9a-zа-я]+')
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+
+def normalize_text(text: str) -> str:
+    """Нижний регистр, ё -> е, все кроме букв и цифр - пробелы"""
+    return NON_WORD_RE.sub(' ', text.lower().replace('ё', 'е')).strip()
+
+
+class HashingVectorizer:
+    """Хэшированные символьные n-граммы слов (и сами слова) в вектор фиксированной длины.
+
+    Словарь не хранится: номер признака - crc32 n-граммы по модулю n_features, поэтому
+    векторизатор не нужно обучать, а опечатки и словоформы дают близкие векторы.
+    Веса - сублинейная частота (1 + log tf), вектор нормирован по L2.
+    """
+
+    def __init__(self, n_features: int = 2 ** 14, ngram_min: int = 2, ngram_max: int = 4):
+        if np is None:
+            raise RuntimeError("Для локальных моделей установите пакет numpy (pip install numpy)")
+        self.n_features = n_features
+        self.ngram_min = ngram_min
+        self.ngram_max = ngram_max
+
+    def _tokens(self, text: str) -> Iterable[str]:
+        for word in normalize_text(text).split():
+            yield f"w:{word}"
+            padded = f" {word} "
+            for n in range(self.ngram_min, self.ngram_max + 1):
+                for i in range(len(padded) - n + 1):
+                    yield padded[i:i + n]
+
+    def features(self, text: str) -> Dict[int, float]:
+        """Разреженный вектор текста: номер признака -> вес"""
+        counts = Counter(zlib.crc32(token.encode('utf-8')) % self.n_features for token in self._tokens(text))
+        weights = {index: 1.0 + math.log(count) for index, count in counts.items()}
+        norm = math.sqrt(sum(value * value for value in weights.values()))
+        if norm:
+            weights = {index: value / norm for index, value in weights.items()}
+        return weights
+
+    def transform_one(self, text: str) -> Tuple["np.ndarray", "np.ndarray"]:
+        """Разреженный вектор в виде массивов (индексы, веса)"""
+        weights = self.features(text)
+        indices = np.fromiter(weights.keys(), dtype=np.int32, count=len(weights))
+        values = np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+        return indices, values
+
+    def transform(self, texts: List[str]) -> "np.ndarray":
+        """Плотная матрица (тексты x признаки) - для пакетов и индексов небольшого размера"""
+        matrix = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for index, value in self.features(text).items():
+                matrix[row, index] = value
+        return matrix
+
+    def params(self) -> Dict[str, int]:
+        """Параметры для сохранения вместе с моделью"""
+        return {'n_features': self.n_features, 'ngram_min': self.ngram_min, 'ngram_max': self.ngram_max}
@@ -0,0 +1,178 @@
+import re
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from services.typo_index import TypoIndex
+
+# Один проход токенизатора: дата, время, число, слово
+TOKEN_RE = re.compile(
+    r'(?P<date>\d{1,2}[.\-/]\d{1,2}[.\-/]\d{4})'
+    r'|(?P<clock>\d{1,2}:\d{2})'
+    r'|(?P<number>\d+)'
+    r'|(?P<word>[а-яёa-z]+\.?)'
+)
+
+# Относительные выражения времени: фраза -> сколько дней назад (опечатки находит индекс опечаток)
+RELATIVE_DAY_PHRASES = {
+    'сегодня': 0,
+    'вчера': 1,
+    'позавчера': 2,
+    # «на прошлой неделе» находится с позиции второго слова: предлог не обязателен
+    'прошлой неделе': 7, 'прошлая неделя': 7,
+    'неделю назад': 7, 'недели назад': 7, 'неделя назад': 7,
+}
+
+# Единицы длительности после числа: начало слова -> вид выражения
+DURATION_UNITS = (
+    ('мин', 'minutes'),
+    ('час', 'hours'),
+    ('день', 'days'), ('дня', 'days'), ('дней', 'days'), ('дн.', 'days'),
+)
+
+# Приоритет при нескольких выражениях в одном сообщении
+PRIORITY = ('clock', 'minutes', 'hours', 'days', 'relative', 'date')
+
+
+class PhraseTrie:
+    """Бор по словам: фраза из нескольких слов находится за один спуск от текущего токена"""
+
+    def __init__(self, phrases: Dict[str, int]):
+        self._root: Dict = {}
+        for phrase, value in phrases.items():
+            node = self._root
+            for word in phrase.split():
+                node = node.setdefault(word, {})
+            node[None] = value
+
+    def longest_match(self, words: List[str], start: int) -> Tuple[Optional[int], int]:
+        """Самая длинная фраза с позиции start: (значение, число слов)"""
+        node = self._root
+        value, length = None, 0
+        position = start
+        while position < len(words):
+            node = node.get(words[position])
+            if node is None:
+                break
+            position += 1
+            if None in node:
+                value, length = node[None], position - start
+        return value, length
+
+
+_relative_days = PhraseTrie(RELATIVE_DAY_PHRASES)
+_time_words = TypoIndex(
+    (word for phrase in RELATIVE_DAY_PHRASES for word in phrase.split()),
+    known_words=('вечера', 'вечером', 'вечер')
+)
+
+
+def _time_word(word: str) -> str:
+    """Слово фразы для слова сообщения: опечатки исправляются, обычные слова остаются как есть.
+
+    Короткие слова фраз (вчера, назад) исправляются только заменой или перестановкой
+    букв: вставка одной буквы превращает в них настоящие слова (вера -> вчера).
+    """
+    corrected = _time_words.lookup(word)
+    if corrected is None:
+        return word
+    if len(corrected) < _time_words.long_word and len(corrected) != len(word):
+        return word
+    return corrected
+
+
+def _duration_unit(word: str) -> Optional[str]:
+    for prefix, kind in DURATION_UNITS:
+        if word.startswith(prefix):
+            return kind
+    return None
+
+
+def _plural(number: int, one: str, few: str, many: str) -> str:
+    return one if number == 1 else few if 2 <= number <= 4 else many
+
+
+def _scan(text_lower: str) -> Dict[str, tuple]:
+    """Один проход по токенам: первое найденное выражение каждого вида"""
+    found: Dict[str, tuple] = {}
+    tokens = [(match.lastgroup, match.group()) for match in TOKEN_RE.finditer(text_lower)]
+    # Слова с опечатками приводятся к словам фраз (седня -> сегодня, позафчера -> позавчера)
+    words = [
+        _time_word(value.rstrip('.')) if kind == 'word' else ''
+        for kind, value in tokens
+    ]
+
+    for position, (kind, value) in enumerate(tokens):
+        if kind == 'clock':
+            hour, minute = map(int, value.split(':'))
+            if hour < 24 and minute < 60:
+                found.setdefault('clock', (hour, minute))
+        elif kind == 'date':
+            found.setdefault('date', tuple(map(int, re.split(r'[.\-/]', value))))
+        elif kind == 'number':
+            if position + 1 < len(tokens) and tokens[position + 1][0] == 'word':
+                unit = _duration_unit(tokens[position + 1][1])
+                if unit is not None:
+                    found.setdefault(unit, (int(value),))
+        elif kind == 'word' and 'relative' not in found:
+            days_back, _ = _relative_days.longest_match(words, position)
+            if days_back is not None:
+                found['relative'] = (days_back,)
+    return found
+
+
+def parse_payment_time(text_lower: str, now: Optional[datetime] = None) -> Optional[Dict[str, str]]:
+    """Находит, когда была оплата: {'minutes': сколько минут назад, 'description': для ответа}.
+
+    Часы (14:30), длительности (20 минут, 2 часа, 3 дня), относительные дни с опечатками
+    (вчера, позафчера, седня) и даты (25.12.2024) распознаются за один проход; текущее время
+    читается один раз на сообщение.
+    """
+    found = _scan(text_lower)
+    if not found:
+        return None
+    if now is None:
+        now = datetime.now()
+
+    for kind in PRIORITY:
+        if kind not in found:
+            continue
+
+        if kind == 'clock':
+            hour, minute = found['clock']
+            days_back = found['relative'][0] if 'relative' in found else 0
+            payment_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0) - timedelta(days=days_back)
+            if payment_time > now:
+                # Если время в будущем, значит вчера
+                payment_time -= timedelta(days=1)
+            minutes = int((now - payment_time).total_seconds() / 60)
+            day = 'сегодня' if payment_time.date() == now.date() else payment_time.strftime('%d.%m.%Y')
+            return {'minutes': str(minutes), 'description': f"{day} в {hour:02d}:{minute:02d}"}
+
+        if kind == 'minutes':
+            minutes = found['minutes'][0]
+            return {'minutes': str(minutes), 'description': f"{minutes} минут"}
+
+        if kind == 'hours':
+            hours = found['hours'][0]
+            return {'minutes': str(hours * 60), 'description': f"{hours} {_plural(hours, 'час', 'часа', 'часов')}"}
+
+        if kind == 'days':
+            days = found['days'][0]
+            return {'minutes': str(days * 24 * 60), 'description': f"{days} {_plural(days, 'день', 'дня', 'дней')}"}
+
+        if kind == 'relative':
+            days_back = found['relative'][0]
+            target_date = now - timedelta(days=days_back)
+            return {'minutes': str(days_back * 24 * 60), 'description': target_date.strftime("%d.%m.%Y")}
+
+        if kind == 'date':
+            day, month, year = found['date']
+            try:
+                payment_date = datetime(year, month, day)
+            except ValueError:
+                continue
+            time_diff = now - payment_date
+            if time_diff.days >= 0:
+                return {'minutes': str(time_diff.days * 24 * 60), 'description': f"{day:02d}.{month:02d}.{year}"}
+
+    return None
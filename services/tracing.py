@@ -0,0 +1,198 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Этапы обработки сообщения: метки гистограммы регистрируются заранее
+STAGES = (
+    'flow', 'detectors', 'router', 'classifier', 'faq', 'deepseek',
+    'telegram.SendMessage', 'telegram.SendChatAction', 'telegram.EditMessageText',
+)
+
+STAGE_SECONDS = metrics.histogram(
+    'bot_stage_seconds', 'Длительность этапа обработки обновления', ('stage',),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+UPDATE_SECONDS = metrics.histogram('bot_update_seconds', 'Полное время обработки обновления')
+STAGE_HISTOGRAMS = {stage: STAGE_SECONDS.labels(stage) for stage in STAGES}
+
+
+class Trace:
+    """Трасса одного обновления: идентификатор и суммарное время по этапам"""
+
+    __slots__ = ('trace_id', 'started', 'stages', 'profiled')
+
+    def __init__(self, trace_id: str, profiled: bool = False):
+        self.trace_id = trace_id
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.profiled = profiled
+
+    def add(self, stage: str, duration: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + duration
+
+    def summary(self) -> str:
+        return ', '.join(f"{stage} {duration * 1000:.1f} мс" for stage, duration in self.stages.items())
+
+
+# Трасса обновления, которое обрабатывается в текущей задаче
+current_trace: ContextVar[Optional[Trace]] = ContextVar('current_trace', default=None)
+
+
+def new_trace_id() -> str:
+    return os.urandom(6).hex()
+
+
+def current_trace_id() -> str:
+    trace = current_trace.get()
+    return trace.trace_id if trace is not None else '-'
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Замер этапа: время попадает в трассу текущего обновления и в гистограмму bot_stage_seconds.
+
+    Этапы могут вкладываться (потоковый ответ DeepSeek включает правки сообщения) -
+    в трассе время каждого этапа считается отдельно.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def record_stage(stage: str, duration: float):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(stage, duration)
+    histogram = STAGE_HISTOGRAMS.get(stage)
+    if histogram is None:
+        histogram = STAGE_HISTOGRAMS[stage] = STAGE_SECONDS.labels(stage)
+    histogram.observe(duration)
+
+
+class TraceIdFilter(logging.Filter):
+    """Добавляет в запись лога trace_id обновления, в котором она создана"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id()
+        return True
+
+
+class StackSampler:
+    """Выборочный профилировщик: фоновый поток снимает стек потока цикла событий.
+
+    Стеки снимаются каждые interval секунд, пока обрабатывается хотя бы одно отобранное
+    обновление (каждое every-е). Цикл событий выполняет задачи по очереди, поэтому в
+    выборку попадает и работа соседних обновлений - это профиль процесса под нагрузкой,
+    а не одного сообщения. Стеки агрегируются в формате collapsed ("a;b;c N") для
+    flamegraph.pl, speedscope и подобных инструментов.
+    """
+
+    def __init__(self, every: int, interval: float = 0.005, max_depth: int = 64):
+        self.every = every
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: StackCounter = StackCounter()
+        # Стеки пишет фоновый поток, читает обработчик команды
+        self._lock = threading.Lock()
+        self.samples = 0
+        self.profiled_updates = 0
+        self._seen = 0
+        self._active = 0
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._target_thread_id: Optional[int] = None
+        self._stopped = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.every > 0
+
+    def should_profile(self) -> bool:
+        """Отбирает каждое every-е обновление"""
+        if not self.enabled:
+            return False
+        self._seen += 1
+        return self._seen % self.every == 0
+
+    def begin(self):
+        """Начало отобранного обновления (вызывается из потока цикла событий)"""
+        self._target_thread_id = threading.get_ident()
+        self.profiled_updates += 1
+        self._active += 1
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+            self._thread.start()
+        self._wakeup.set()
+
+    def end(self):
+        self._active -= 1
+        if self._active <= 0:
+            self._active = 0
+            self._wakeup.clear()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait()
+            if self._stopped:
+                return
+            frame = sys._current_frames().get(self._target_thread_id)
+            if frame is not None:
+                stack = self._collapse(frame)
+                with self._lock:
+                    self.stacks[stack] += 1
+                    self.samples += 1
+            time.sleep(self.interval)
+
+    def _collapse(self, frame) -> str:
+        names: List[str] = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+        self.profiled_updates = 0
+
+    def collapsed(self) -> str:
+        """Агрегированные стеки: одна строка "кадр;кадр;кадр количество" на стек"""
+        with self._lock:
+            stacks = self.stacks.most_common()
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def top(self, limit: int = 10) -> List[Tuple[str, int]]:
+        """Функции, в которых чаще всего находился цикл событий (собственное время)"""
+        leaves: StackCounter = StackCounter()
+        with self._lock:
+            for stack, count in self.stacks.items():
+                leaves[stack.rpartition(';')[2]] += count
+        return leaves.most_common(limit)
+
+
+def stage_summary() -> List[Tuple[str, int, float]]:
+    """Этапы по суммарному времени: (этап, число замеров, среднее в мс)"""
+    rows = [
+        (stage, child.count, child.sum / child.count * 1000, child.sum)
+        for stage, child in STAGE_HISTOGRAMS.items() if child.count
+    ]
+    rows.sort(key=lambda row: row[3], reverse=True)
+    return [row[:3] for row in rows]
@@ -0,0 +1,120 @@
+import logging
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'[а-яёa-z]+')
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Расстояние Дамерау-Левенштейна (перестановка соседних букв - одна правка); limit + 1, если больше limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_previous: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        char = a[i - 1]
+        current = [i]
+        row_min = i
+        for j in range(1, len(b) + 1):
+            value = previous[j - 1] + (char != b[j - 1])
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if i > 1 and j > 1 and char == b[j - 2] and a[i - 2] == b[j - 1] and previous_previous[j - 2] + 1 < value:
+                value = previous_previous[j - 2] + 1
+            current.append(value)
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def text_words(texts: Iterable[str]) -> Set[str]:
+    """Все слова текстов в нижнем регистре - список известных слов для TypoIndex"""
+    return {word for text in texts for word in WORD_RE.findall(text.lower())}
+
+
+class TypoIndex:
+    """Словарь с поиском опечаток по методу SymSpell.
+
+    Для каждого слова словаря заранее строятся все варианты с удалением до max_distance
+    букв. При поиске такие же удаления строятся для слова из сообщения, и кандидаты
+    находятся обращением к словарю удалений - стоимость не зависит от размера словаря.
+    Короткие слова допускают одну правку, длинные (от long_word букв) - две.
+    """
+
+    def __init__(self, words: Iterable[str], known_words: Iterable[str] = (),
+                 max_distance: int = 2, min_length: int = 4, long_word: int = 7, cache_size: int = 4096):
+        self.max_distance = max_distance
+        self.min_length = min_length
+        self.long_word = long_word
+        self._words: Set[str] = set()
+        self._deletes: Dict[str, Set[str]] = {}
+        # Правильные слова, похожие на слова словаря (вечера - вчера): их не исправляем
+        self._known = frozenset(word.lower() for word in known_words)
+        # Повторяющиеся слова сообщений не пересчитываются
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+        for word in words:
+            word = word.lower()
+            if len(word) < min_length or word in self._words:
+                continue
+            self._words.add(word)
+            for variant in self._variants(word, self._allowed(word)):
+                self._deletes.setdefault(variant, set()).add(word)
+
+        logger.info(f"Индекс опечаток построен: {len(self._words)} слов, {len(self._deletes)} вариантов")
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def _allowed(self, word: str) -> int:
+        return self.max_distance if len(word) >= self.long_word else min(1, self.max_distance)
+
+    @staticmethod
+    def _variants(word: str, distance: int) -> Set[str]:
+        """Слово и все варианты с удалением до distance букв"""
+        variants = {word}
+        frontier = {word}
+        for _ in range(distance):
+            frontier = {
+                candidate[:i] + candidate[i + 1:]
+                for candidate in frontier if len(candidate) > 1
+                for i in range(len(candidate))
+            }
+            variants |= frontier
+        return variants
+
+    def _lookup(self, token: str) -> Optional[str]:
+        """Ближайшее слово словаря или None; слово из словаря возвращается как есть"""
+        if token in self._words:
+            return token
+        if len(token) < self.min_length or token in self._known:
+            return None
+
+        candidates = set()
+        for variant in self._variants(token, self.max_distance):
+            candidates.update(self._deletes.get(variant, ()))
+
+        best, best_distance = None, self.max_distance + 1
+        for word in candidates:
+            allowed = self._allowed(word)
+            distance = edit_distance(token, word, allowed)
+            if distance > allowed:
+                continue
+            if distance < best_distance or (distance == best_distance and word < best):
+                best, best_distance = word, distance
+        return best
+
+    def correct(self, text: str) -> str:
+        """Заменяет в тексте слова с опечатками на слова словаря"""
+        def replace(match: re.Match) -> str:
+            word = match.group(0)
+            return self.lookup(word) or word
+        return WORD_RE.sub(replace, text)
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# config.validate() выполняется при импорте - тестам хватает фиктивных значений
+os.environ.setdefault('BOT_TOKEN', '123456:test-token')
+os.environ.setdefault('DEEPSEEK_API_KEY', 'test-key')
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,83 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.methods import EditMessageText, SendMessage
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from middlewares import OutgoingLogMiddleware
+from models import Base, Message
+from services.chat_recorder import ChatRecorder
+
+USER_ID = 1001
+
+
+async def make_recorder():
+    engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    recorder = ChatRecorder(session_factory, flush_interval=0.01)
+    recorder.start()
+    return engine, session_factory, recorder
+
+
+async def bot_texts(session_factory):
+    async with session_factory() as session:
+        result = await session.execute(select(Message.text).where(Message.is_from_user.is_(False)).order_by(Message.id))
+        return list(result.scalars())
+
+
+def test_edit_in_same_batch_replaces_text():
+    async def scenario():
+        engine, session_factory, recorder = await make_recorder()
+        recorder.record_outgoing(USER_ID, 'Первое предложение.', message_id=10)
+        recorder.record_edit(USER_ID, 10, 'Первое предложение. Полный ответ.')
+        await recorder.stop()
+        texts = await bot_texts(session_factory)
+        await engine.dispose()
+        return texts
+
+    assert asyncio.run(scenario()) == ['Первое предложение. Полный ответ.']
+
+
+def test_edit_after_flush_updates_row():
+    async def scenario():
+        engine, session_factory, recorder = await make_recorder()
+        recorder.record_outgoing(USER_ID, 'Другой ответ', message_id=9)
+        recorder.record_outgoing(USER_ID, 'Первое предложение.', message_id=10)
+        await asyncio.sleep(0.1)
+        recorder.record_edit(USER_ID, 10, 'Первое предложение. Середина.')
+        await asyncio.sleep(0.1)
+        recorder.record_edit(USER_ID, 10, 'Первое предложение. Середина. Конец.')
+        # Правка неизвестного сообщения (например, отправленного до перезапуска) не пишется
+        recorder.record_edit(USER_ID, 77, 'Чужая правка')
+        await recorder.stop()
+        texts = await bot_texts(session_factory)
+        await engine.dispose()
+        return texts
+
+    assert asyncio.run(scenario()) == ['Другой ответ', 'Первое предложение. Середина. Конец.']
+
+
+def test_middleware_records_send_and_edit():
+    calls = []
+    recorder = SimpleNamespace(
+        record_outgoing=lambda *args: calls.append(('send', *args)),
+        record_edit=lambda *args: calls.append(('edit', *args)),
+    )
+    middleware = OutgoingLogMiddleware(recorder, exclude_chat_ids=[-500])
+
+    async def make_request(bot, method):
+        return SimpleNamespace(message_id=42) if isinstance(method, SendMessage) else True
+
+    async def scenario():
+        await middleware(make_request, None, SendMessage(chat_id=USER_ID, text='Начало.'))
+        await middleware(make_request, None, EditMessageText(chat_id=USER_ID, message_id=42, text='Начало. Конец.'))
+        await middleware(make_request, None, SendMessage(chat_id=-500, text='Операторам'))
+
+    asyncio.run(scenario())
+    assert calls == [
+        ('send', USER_ID, 'Начало.', 42),
+        ('edit', USER_ID, 42, 'Начало. Конец.'),
+    ]
@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import pytest
+
+from services.circuit_breaker import CircuitBreaker
+from services.deepseek_service import DeepSeekService
+from services.rate_limiter import RequestLimiter
+
+RESET_TIMEOUT = 0.05
+
+
+@pytest.fixture
+def service():
+    # _upstream_slot использует только ограничитель и предохранитель; конструктор не вызываем,
+    # чтобы не регистрировать хранилища сессий сервиса второй раз рядом с main
+    service = DeepSeekService.__new__(DeepSeekService)
+    service.limiter = RequestLimiter('deepseek', max_concurrency=4, rps=0)
+    service.breaker = CircuitBreaker('deepseek', failure_threshold=2, reset_timeout=RESET_TIMEOUT)
+    return service
+
+
+@pytest.fixture
+def breaker(service):
+    return service.breaker
+
+
+def open_and_wait(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(RESET_TIMEOUT * 1.5)
+
+
+def deadline() -> float:
+    return asyncio.get_running_loop().time() + 5
+
+
+def test_half_open_allows_single_probe(breaker):
+    open_and_wait(breaker)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.release_probe()
+    assert breaker.allow()
+
+
+def test_release_probe_ignored_outside_half_open(breaker):
+    breaker.release_probe()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_cancelled_probe_is_released(service, breaker):
+    open_and_wait(breaker)
+
+    async def scenario():
+        entered = asyncio.Event()
+
+        async def probe():
+            async with service._upstream_slot(None, deadline()) as allowed:
+                assert allowed
+                entered.set()
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(probe())
+        await entered.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+
+def test_closed_stream_probe_is_released(service, breaker):
+    open_and_wait(breaker)
+
+    async def scenario():
+        async def stream():
+            async with service._upstream_slot(None, deadline()) as allowed:
+                yield allowed
+                yield allowed
+
+        chunks = stream()
+        assert await chunks.__anext__()
+        # Потребитель прервал чтение: GeneratorExit приходит в yield внутри слота
+        await chunks.aclose()
+
+    asyncio.run(scenario())
+    assert breaker.allow()
+
+
+def test_probe_outcome_is_kept(service, breaker):
+    open_and_wait(breaker)
+
+    async def scenario():
+        async with service._upstream_slot(None, deadline()) as allowed:
+            assert allowed
+            breaker.record_failure()
+
+    asyncio.run(scenario())
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
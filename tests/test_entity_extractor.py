@@ -0,0 +1,119 @@
+import itertools
+import re
+
+from services.entity_extractor import clean_phone, extract_entities
+from services.lexicons import detect_payment_method
+
+# Эталон 1: извлечение до объединения шаблонов - отдельный поиск по каждому шаблону
+SCAN_ORDER_RE = re.compile(r'\b(\d{6})\b')
+SCAN_EMAIL_RE = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b')
+SCAN_PHONE_RE = re.compile(
+    r'(?<![\d+])\+?[78](?:[\s\-]?\(?\d{3}\)?[\s\-]?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}|\d{9})(?!\d)'
+)
+SCAN_TIME_RE = re.compile(
+    r'\d{1,2}[.\-/]\d{1,2}[.\-/]\d{4}|\d{1,2}:\d{2}|\d+\s*(?:мин|час|дн|день|дня|дней)',
+    re.IGNORECASE
+)
+
+
+def separate_scans(text: str) -> tuple:
+    order = SCAN_ORDER_RE.search(text)
+    email = SCAN_EMAIL_RE.search(text)
+    phone = SCAN_PHONE_RE.search(text)
+    time_expression = SCAN_TIME_RE.search(text)
+    return (
+        order.group(1) if order else None,
+        phone.group(0) if phone else None,
+        email.group(0) if email else None,
+        time_expression.group(0) if time_expression else None,
+        detect_payment_method(text),
+    )
+
+
+# Эталон 2: копия _extract_contact_info из сценариев до выноса в entity_extractor
+def handler_validate_phone(phone: str) -> bool:
+    digits = re.sub(r'[\s\(\)\-+]', '', phone)
+    return digits.startswith(('7', '8')) and len(digits) in (10, 11) and digits.isdigit()
+
+
+def handler_contacts(text: str) -> dict:
+    contacts = {}
+    email = re.search(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', text)
+    if email:
+        contacts['email'] = email.group(0)
+    phone_patterns = [
+        r'\b\+?7\s?\(?\d{3}\)?\s?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}\b',
+        r'\b8\s?\(?\d{3}\)?\s?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}\b',
+        r'\b7\s?\(?\d{3}\)?\s?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}\b',
+        r'\b7\d{9,10}\b',
+        r'\b8\d{9,10}\b',
+    ]
+    phones = [match.group(0) for pattern in phone_patterns for match in re.finditer(pattern, text)
+              if handler_validate_phone(match.group(0))]
+    if phones:
+        contacts['phone'] = phones[0]
+    order = re.search(r'\b(\d{6})\b', text)
+    if order:
+        contacts['order_number'] = order.group(1)
+    return contacts
+
+
+ORDERS = ['', 'заказ 123456', 'номер заказа: 654321,', 'заказ №100200 и 300400', 'заказ 1234567']
+PHONES = ['', '+7 (999) 123-45-67', '8 999 123 45 67', '89991234567', '7999123456', '8(999)123-45-67',
+          'телефон 8-999-123-45-67', '+79991234567', 'тел. 12345']
+EMAILS = ['', 'ivan.petrov@mail.ru', 'почта: test_user+1@yandex.ru', '123456@mail.ru', 'user@localhost']
+TIMES = ['', 'в 14:30', '01.02.2025', 'минут 20 назад', 'через 2 часа', '3 дня назад', '20 МИН']
+METHODS = ['', 'оплатил картой', 'через приложение', 'по qr', 'наличными']
+TEXTS = [
+    'Здравствуйте, деньги списали, а билета нет',
+    'Как вернуть билет?',
+    '123456',
+    '8 (999) 123-45-67',
+    'мой email: a@b.co, заказ 987654',
+    'заказ 123456@mail.ru',
+    'оплата 12.03.2025 в 9:05, прошло 40 минут',
+    'звоните +7 999 123 45 67 или пишите на support@example.com',
+]
+
+
+def corpus():
+    for parts in itertools.product(ORDERS, PHONES, EMAILS, TIMES, METHODS):
+        yield ', '.join(part for part in parts if part)
+        yield ' '.join(reversed([part for part in parts if part]))
+    yield from TEXTS
+
+
+def test_matches_separate_scans():
+    mismatches = [(text, tuple(extract_entities(text)), separate_scans(text))
+                  for text in corpus() if tuple(extract_entities(text)) != separate_scans(text)]
+    assert mismatches == []
+
+
+def test_contacts_match_handler_copy():
+    """Совпадает с прежними копиями, кроме номеров через дефис - их копии не находили"""
+    for text in corpus():
+        new = extract_entities(text).contacts(with_order=True)
+        old = handler_contacts(text)
+        # Копии теряли '+' перед 7 (граница слова), поэтому телефоны сравниваются по цифрам
+        if 'phone' in new:
+            new['phone'] = clean_phone(new['phone'])
+        if 'phone' in old:
+            old['phone'] = clean_phone(old['phone'])
+        if '8-999-123-45-67' in text and 'phone' not in old:
+            assert new.pop('phone') == '89991234567'
+        assert new == old, text
+
+
+def test_first_entity_of_each_kind():
+    entities = extract_entities('заказ 111111, потом 222222; 14:30 и 15:45; a@b.ru, c@d.ru')
+    assert entities.order_number == '111111'
+    assert entities.time_expression == '14:30'
+    assert entities.email == 'a@b.ru'
+
+
+def test_digit_run_is_one_entity():
+    # Отдельные поиски находили одну и ту же цифровую группу дважды (и заказ, и длительность)
+    entities = extract_entities('прошло 123456 минут')
+    assert entities.order_number == '123456'
+    assert entities.time_expression is None
+    assert extract_entities('89991234567 мин').time_expression is None
@@ -0,0 +1,72 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+from services.intent_classifier import OTHER, OTHER_SAMPLES, IntentClassifier, keyword_samples  # noqa: E402
+
+ROUTED = [
+    ('купил по ошибке не то мероприятие, заказ 123456', 'wrong_event'),
+    ('нужно изменить email, указал неправильный email', 'email_change'),
+    ('частичный возврат возможен? не все билеты нужны', 'partial_refund'),
+    ('билеты не пришли на почту', 'ticket_problem'),
+    ('оплатил через приложение по qr коду', 'payment'),
+]
+
+NOT_ROUTED = [
+    'подскажите, во сколько начинается концерт?',
+    'а парковка у театра есть?',
+    'добрый вечер, у меня вопрос по программе фестиваля, будет ли второй день?',
+    'где посмотреть расписание?',
+]
+
+
+@pytest.fixture(scope='module')
+def samples():
+    return keyword_samples()
+
+
+@pytest.fixture(scope='module')
+def model(samples):
+    return IntentClassifier.train(samples)
+
+
+def test_keyword_samples_cover_scenarios_and_other(samples):
+    labels = {label for _, label in samples}
+    assert OTHER in labels
+    assert 'payment_problem' not in labels
+    assert all(not any(char.isdigit() for char in text) for text, _ in samples)
+    assert ('не пришли', 'ticket_problem') in samples
+    assert [text for text, label in samples if label == OTHER] == OTHER_SAMPLES
+
+
+def test_checked_texts_are_not_training_samples(samples):
+    training_texts = {text for text, _ in samples}
+    assert not training_texts & ({text for text, _ in ROUTED} | set(NOT_ROUTED))
+
+
+@pytest.mark.parametrize('text, intent', ROUTED)
+def test_scenario_messages_are_routed(model, text, intent):
+    prediction = model.predict(text)
+    assert prediction is not None
+    assert prediction[0] == intent
+    assert prediction[1] >= model.threshold
+
+
+@pytest.mark.parametrize('text', NOT_ROUTED)
+def test_other_questions_stay_with_deepseek(model, text):
+    assert model.predict(text) is None
+
+
+def test_stats_and_save_load(model, tmp_path):
+    path = str(tmp_path / 'intent_model.npz')
+    model.save(path)
+    loaded = IntentClassifier.load(path, threshold=model.threshold)
+    for text, _ in ROUTED:
+        assert loaded.predict(text) == pytest.approx(model.predict(text))
+    for text in NOT_ROUTED:
+        assert loaded.predict(text) is None
+
+    stats = loaded.stats()
+    assert stats['predictions'] == len(ROUTED) + len(NOT_ROUTED)
+    assert stats['routed'] == len(ROUTED)
+    assert stats['llm_avoided_share'] == round(len(ROUTED) / stats['predictions'], 3)
@@ -0,0 +1,68 @@
+import pytest
+
+from services.faq_index import FAQ_ENTRIES
+from services.intent_router import IntentRouter, keyword_words
+from services.lexicons import LEXICONS
+from services.typo_index import text_words
+
+
+@pytest.fixture(scope='module')
+def router():
+    # Как в main.py: слова словарей и FAQ - известные правильные слова
+    return IntentRouter(known_words=text_words(
+        [phrase for phrases in LEXICONS.values() for phrase in phrases]
+        + [text for entry in FAQ_ENTRIES for text in (*entry['questions'], entry['answer'])]
+    ))
+
+
+def test_vocabulary_takes_whole_words_only():
+    assert keyword_words('phrase', 'карт') == []
+    assert keyword_words('phrase', 'как купить') == ['как', 'купить']
+    assert keyword_words('exact', 'пока') == ['пока']
+    assert keyword_words('regex', r'не\s*пришли') == ['не', 'пришли']
+    assert keyword_words('regex', r'нет билетов') == ['нет', 'билетов']
+    assert keyword_words('regex', r'(?:плат[её]ж|оплат).*\b\d{6}\b') == []
+    assert keyword_words('regex', r'двойн.*списан') == []
+
+
+@pytest.mark.parametrize('text, intent, corrected', [
+    ('вазврат', 'refund', 'возврат'),
+    ('верноть', 'refund', 'вернуть'),
+    ('не пришлт билеты', 'ticket_problem', 'не пришли билеты'),
+    ('как купть билет', 'purchase', 'как купить билет'),
+    ('изминить email', 'email_change', 'изменить email'),
+    ('нет спосибо', 'farewell', 'нет спасибо'),
+])
+def test_typos_are_routed(router, text, intent, corrected):
+    assert router.match(text) == []
+    assert router.match_corrected(text) == ([intent], corrected)
+
+
+@pytest.mark.parametrize('text', [
+    # Основа 'карт' не в словаре: март не становится картой и не открывает оплату
+    'билет на 8 март',
+    # Короткие слова не исправляются: поко - не прощание
+    'поко',
+    # Известные слова остаются как есть: сдать - не сделать
+    'сдать',
+    'хочу сдать билет',
+    'как сказать',
+    'не прошли билеты',
+    'билеты на балет',
+])
+def test_correct_words_are_not_routed(router, text):
+    assert router.match(text) == []
+    assert router.match_corrected(text)[0] == []
+
+
+def test_correction_must_create_the_match(router):
+    # Исправление 'возврт' дает refund; purchase совпал бы и без исправления - его нет в ответе
+    intents, corrected = router.match_corrected('как купить билет, возврт')
+    assert corrected == 'как купить билет, возврат'
+    assert intents == ['refund']
+
+
+def test_correction_without_new_match_is_ignored(router):
+    intents, corrected = router.match_corrected('спасиба')
+    assert corrected == 'спасибо'
+    assert intents == []
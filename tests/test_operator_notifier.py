@@ -0,0 +1,57 @@
+import asyncio
+
+from services.operator_notifier import OperatorNotifier
+
+
+class FakeBot:
+    """Во время отправки сводки пользователь присылает повторное обращение"""
+
+    def __init__(self):
+        self.sent = []
+        self.on_send = None
+
+    async def send_message(self, chat_id, text):
+        await asyncio.sleep(0)
+        if self.on_send is not None:
+            self.on_send()
+            self.on_send = None
+        self.sent.append(text)
+
+
+def test_repeat_merged_during_send_is_requeued():
+    async def scenario():
+        bot = FakeBot()
+        notifier = OperatorNotifier(bot, chat_id=-100)
+        notifier.submit(1, 'Иван', 'Не пришел билет')
+        bot.on_send = lambda: notifier.submit(1, 'Иван', 'Билета до сих пор нет')
+
+        assert not await notifier._send_digest()
+        assert notifier.stats()['pending'] == 1
+        assert notifier.sent_count == 0
+
+        assert await notifier._send_digest()
+        assert 'Билета до сих пор нет' in bot.sent[-1]
+        assert 'Повторных обращений: 1' in bot.sent[-1]
+        assert notifier.sent_count == 1
+
+    asyncio.run(scenario())
+
+
+def test_unchanged_entries_are_sent_once():
+    async def scenario():
+        bot = FakeBot()
+        notifier = OperatorNotifier(bot, chat_id=-100)
+        notifier.submit(1, 'Иван', 'Не пришел билет')
+        notifier.submit(2, 'Мария', 'Двойное списание')
+        bot.on_send = lambda: notifier.submit(3, 'Петр', 'Не работает оплата')
+
+        assert not await notifier._send_digest()
+        assert len(bot.sent) == 1
+        assert notifier.stats()['pending'] == 1
+        assert notifier.sent_count == 2
+
+        # Повтор после отправки подавляется
+        notifier.submit(1, 'Иван', 'Не пришел билет')
+        assert notifier.suppressed_count == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,128 @@
+import sqlite3
+
+import pytest
+
+from services.order_lookup import OrderIndex, OrderLookup
+
+
+def write_csv(path, text):
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_index_sorts_and_drops_duplicates():
+    index = OrderIndex.build([500, 100, 300, 100, 500])
+    assert len(index) == 3
+    assert index.nbytes == 24
+    assert 300 in index
+    assert 200 not in index
+    assert 600 not in index
+
+
+def test_index_keeps_sorted_stream_and_drops_repeats():
+    index = OrderIndex.build([100, 100, 200, 300, 300])
+    assert len(index) == 3
+    assert [number in index for number in (100, 200, 300, 250)] == [True, True, True, False]
+
+
+def test_csv_with_header_uses_named_column(tmp_path):
+    path = write_csv(tmp_path / 'orders.csv', 'created_at,order_number\n2026-10-17,123456\n2026-10-17,654321\n')
+    lookup = OrderLookup(path)
+    lookup.reload()
+    assert lookup.exists('123456')
+    assert lookup.exists('654321')
+    assert not lookup.exists('111111')
+    assert lookup.stats()['orders'] == 2
+
+
+def test_csv_without_header_uses_first_column(tmp_path):
+    path = write_csv(tmp_path / 'orders.csv', '123456,paid\n654321,refunded\nномер,\n')
+    lookup = OrderLookup(path)
+    lookup.reload()
+    # Первая строка - данные, а не заголовок; строка с нечисловым номером пропускается
+    assert lookup.exists('123456')
+    assert lookup.exists('654321')
+    assert lookup.stats()['orders'] == 2
+
+
+def test_invalid_numbers_are_not_found(tmp_path):
+    lookup = OrderLookup(write_csv(tmp_path / 'orders.csv', '123456\n'))
+    lookup.reload()
+    assert not lookup.exists('abc')
+    assert not lookup.exists(None)
+
+
+def test_sqlite_snapshot_is_opened_read_only(tmp_path, monkeypatch):
+    path = str(tmp_path / 'orders.db')
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE sales (number INTEGER, status TEXT)')
+    connection.executemany('INSERT INTO sales VALUES (?, ?)', [(654321, 'paid'), (123456, 'paid'), (None, 'draft')])
+    connection.commit()
+    connection.close()
+
+    opened, connections = [], []
+
+    def connect(database, **kwargs):
+        opened.append(((database,), kwargs))
+        connections.append(sqlite3_connect(database, **kwargs))
+        return connections[-1]
+
+    sqlite3_connect = sqlite3.connect
+    monkeypatch.setattr(sqlite3, 'connect', connect)
+
+    lookup = OrderLookup(path, table='sales', column='number')
+    lookup.reload()
+    assert lookup.exists('123456')
+    assert lookup.exists('654321')
+    assert lookup.stats()['orders'] == 2
+
+    # Подключение открыто только на чтение и закрыто после загрузки
+    [connection] = connections
+    with pytest.raises(sqlite3.ProgrammingError):
+        connection.execute('SELECT 1')
+    with pytest.raises(sqlite3.OperationalError, match='readonly'):
+        connect(*opened[0][0], **opened[0][1]).execute('DELETE FROM sales')
+
+
+def test_missing_snapshot_keeps_current_index(tmp_path):
+    path = tmp_path / 'orders.csv'
+    lookup = OrderLookup(write_csv(path, '123456\n'))
+    lookup.reload()
+    path.unlink()
+    with pytest.raises(FileNotFoundError):
+        lookup.reload()
+    assert lookup.exists('123456')
+
+
+def test_reload_swaps_index_and_clears_cache(tmp_path):
+    path = tmp_path / 'orders.csv'
+    lookup = OrderLookup(write_csv(path, '123456\n'))
+    lookup.reload()
+    old_index = lookup._index
+    assert lookup.exists('123456')
+    assert not lookup.exists('654321')
+
+    write_csv(path, '654321\n')
+    lookup.reload()
+    # Новый индекс подменяет старый целиком, кэш прошлых ответов сброшен
+    assert lookup._index is not old_index
+    assert lookup.stats()['cache_size'] == 0
+    assert not lookup.exists('123456')
+    assert lookup.exists('654321')
+
+
+def test_lru_keeps_recent_answers_and_evicts_oldest(tmp_path):
+    lookup = OrderLookup(str(tmp_path / 'unused.csv'), cache_size=2)
+    lookup.load([100, 200, 300])
+
+    assert lookup.exists('100')
+    assert not lookup.exists('400')
+    assert lookup.exists('100')
+    assert (lookup.hits, lookup.misses) == (1, 2)
+
+    # 400 - самый давний, он вытесняется новым запросом
+    assert lookup.exists('200')
+    assert lookup.stats()['cache_size'] == 2
+    assert list(lookup._recent) == [100, 200]
+    assert not lookup.exists('400')
+    assert (lookup.hits, lookup.misses) == (1, 4)
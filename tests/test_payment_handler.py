@@ -0,0 +1,21 @@
+from main import payment_handler
+
+USER_ID = 2002
+
+
+def solve(*messages: str) -> str:
+    payment_handler.start_payment_session(USER_ID)
+    response = None
+    for text in messages:
+        response = payment_handler.process_payment_message(USER_ID, text)
+    return response
+
+
+def test_follow_up_message_names_the_problem():
+    response = solve('проблема с оплатой', 'деньги списали, билета нет, заказ 123456, оплатил картой')
+    assert 'Деньги списались, но статус не обновился' in response
+
+
+def test_each_problem_type_gets_its_solution():
+    assert 'двойное списание' in solve('заказ 123456, картой, списалась дважды')
+    assert 'чек' in solve('заказ 123456, картой, кассовый чек не пришел').lower()
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from services.rate_limiter import RequestLimiter
+
+
+def test_cancelled_waiter_does_not_take_the_permit():
+    async def scenario():
+        limiter = RequestLimiter('test', max_concurrency=1, rps=0)
+        await limiter.acquire('holder')
+        waiter = asyncio.create_task(limiter.acquire('user'))
+        await asyncio.sleep(0)
+        assert limiter.queue_depth == 1
+
+        # Отмена (таймаут wait_for) и освобождение в одном шаге цикла: задача ожидающего
+        # еще не успела убрать себя из очереди
+        waiter.cancel()
+        limiter.release()
+
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert limiter.stats()['in_flight'] == 0
+        assert limiter.queue_depth == 0
+
+        # Место не потеряно: следующий запрос получает разрешение сразу
+        await asyncio.wait_for(limiter.acquire('next'), 1)
+        assert limiter.stats()['in_flight'] == 1
+
+    asyncio.run(scenario())
+
+
+def test_wait_for_timeout_keeps_slot_available():
+    async def scenario():
+        limiter = RequestLimiter('test', max_concurrency=1, rps=0)
+        for _ in range(20):
+            async with limiter.slot('holder'):
+                timed_out = asyncio.create_task(asyncio.wait_for(limiter.acquire('user'), 0.001))
+                await asyncio.sleep(0.002)
+            with pytest.raises(asyncio.TimeoutError):
+                await timed_out
+            assert limiter.stats()['in_flight'] == 0
+        await asyncio.wait_for(limiter.acquire('user'), 1)
+
+    asyncio.run(scenario())
+
+
+def test_permits_rotate_between_keys():
+    async def scenario():
+        limiter = RequestLimiter('test', max_concurrency=1, rps=0)
+        order = []
+
+        async def request(key, number):
+            async with limiter.slot(key):
+                order.append((key, number))
+                await asyncio.sleep(0)
+
+        await limiter.acquire('holder')
+        tasks = [asyncio.create_task(request('a', number)) for number in range(3)]
+        tasks.append(asyncio.create_task(request('b', 0)))
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*tasks)
+
+        # Всплеск пользователя a не задерживает пользователя b
+        assert order == [('a', 0), ('b', 0), ('a', 1), ('a', 2)]
+
+    asyncio.run(scenario())
@@ -0,0 +1,37 @@
+import pytest
+
+from services.deepseek_service import DeepSeekService
+from services.response_cache import ResponseCache
+
+
+@pytest.fixture
+def service():
+    # Без __init__: ключ кэша не требует HTTP-сессии и хранилищ сессий
+    service = DeepSeekService.__new__(DeepSeekService)
+    service.response_cache = ResponseCache(ttl_seconds=60, max_entries=10)
+    return service
+
+
+HISTORY = [
+    {"role": "user", "content": "Как вернуть билет?"},
+    {"role": "assistant", "content": "Возврат оформляется в личном кабинете."},
+]
+
+
+def test_first_turn_question_is_cached(service):
+    assert service._cache_key("Как вернуть билет?", None) is not None
+    assert service._cache_key("как вернуть  БИЛЕТ", []) == service._cache_key("Как вернуть билет?", None)
+
+
+def test_follow_up_with_history_bypasses_cache(service):
+    # Кэш общий для всех пользователей: ответ с учетом истории одного диалога не отдается другому
+    assert service._cache_key("А сколько это займет?", HISTORY) is None
+
+
+def test_order_number_bypasses_cache(service):
+    assert service._cache_key("Где билеты по заказу 12345678?", None) is None
+
+
+def test_reference_is_part_of_key(service):
+    assert (service._cache_key("Как вернуть билет?", None, ["Справка 1"])
+            != service._cache_key("Как вернуть билет?", None, ["Справка 2"]))
@@ -0,0 +1,36 @@
+import pytest
+
+from config import Config
+from services.send_scheduler import SendScheduler, TokenBucket
+
+
+@pytest.mark.parametrize('limits', [
+    {'global_rate': 0},
+    {'chat_rate': 0},
+    {'chat_burst': 0},
+    {'group_per_minute': 0},
+    {'chat_rate': -1},
+    {'max_retries': -1},
+])
+def test_scheduler_rejects_non_positive_limits(limits):
+    with pytest.raises(ValueError):
+        SendScheduler(**limits)
+
+
+def test_token_bucket_rejects_zero_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(0, capacity=1)
+
+
+def test_group_bucket_waits_instead_of_dividing_by_zero():
+    scheduler = SendScheduler(group_per_minute=1, chat_burst=1)
+    bucket = scheduler._chat_bucket(-100)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(60, abs=1)
+
+
+@pytest.mark.parametrize('name', ['SEND_GLOBAL_RATE', 'SEND_CHAT_RATE', 'SEND_CHAT_BURST', 'SEND_GROUP_PER_MINUTE'])
+def test_config_rejects_zero_send_limits(monkeypatch, name):
+    monkeypatch.setattr(Config, name, 0)
+    with pytest.raises(ValueError, match=name):
+        Config.validate()
@@ -0,0 +1,125 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.session_backend import RedisSessionBackend, decode_session, encode_session
+from services.session_store import SessionRegistry
+
+SESSION = {
+    'step': 'waiting_contact_info',
+    'data': {'order_number': '123456', 'email': 'ivan@mail.ru', 'имя': 'Иван'},
+    'created_at': datetime(2026, 10, 17, 14, 30, 5, 123456),
+    'history': [{'at': datetime(2026, 10, 17, 14, 31)}],
+}
+
+
+class FakeRedis:
+    """Минимальная замена redis.asyncio: MGET и конвейер SET/DELETE, учет запросов к серверу"""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.round_trips = 0
+        self.closed = False
+
+    async def mget(self, keys):
+        self.round_trips += 1
+        return [self.data.get(key) for key in keys]
+
+    def pipeline(self, transaction: bool = True):
+        return FakePipeline(self)
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def set(self, key, value, ex=None):
+        assert isinstance(value, bytes)
+        self.commands.append(('set', key, value, ex))
+
+    def delete(self, key):
+        self.commands.append(('delete', key, None, None))
+
+    async def execute(self):
+        self.redis.round_trips += 1
+        for command, key, value, ex in self.commands:
+            if command == 'set':
+                self.redis.data[key] = value
+                self.redis.ttls[key] = ex
+            else:
+                self.redis.data.pop(key, None)
+                self.redis.ttls.pop(key, None)
+
+
+def test_encode_decode_round_trip():
+    assert decode_session(encode_session(SESSION)) == SESSION
+
+
+def test_load_and_save_use_one_round_trip_each():
+    async def scenario():
+        redis = FakeRedis()
+        backend = RedisSessionBackend('redis://unused', prefix='test', client=redis)
+
+        await backend.save(7, {'payment': SESSION, 'refund': {'step': 1}}, {'payment': 3600, 'refund': 60})
+        assert redis.round_trips == 1
+        assert redis.ttls == {'test:payment:7': 3600, 'test:refund:7': 60}
+
+        loaded = await backend.load(7, ['payment', 'refund', 'tickets'])
+        assert redis.round_trips == 2
+        assert loaded == {'payment': SESSION, 'refund': {'step': 1}}
+
+        await backend.save(7, {'refund': None}, {})
+        assert await backend.load(7, ['payment', 'refund']) == {'payment': SESSION}
+
+        await backend.close()
+        assert redis.closed
+
+    asyncio.run(scenario())
+
+
+def test_registry_flushes_and_reloads_through_backend():
+    async def scenario():
+        redis = FakeRedis()
+        registry = SessionRegistry()
+        registry.set_backend(RedisSessionBackend('redis://unused', client=redis))
+        store = registry.create_store('payment', timedelta(minutes=30), max_entries=10, exclusive=True)
+
+        await registry.load_user(7)
+        store[7] = SESSION
+        await registry.flush_user(7)
+        assert 7 not in store
+
+        await registry.load_user(7)
+        assert store[7] == SESSION
+        store.pop(7)
+        await registry.flush_user(7)
+        assert redis.data == {}
+
+    asyncio.run(scenario())
+
+
+def test_fakeredis_round_trip():
+    fakeredis = pytest.importorskip('fakeredis')
+
+    async def scenario():
+        backend = RedisSessionBackend('redis://unused', prefix='test', client=fakeredis.FakeAsyncRedis())
+        await backend.save(7, {'payment': SESSION}, {'payment': 60})
+        assert await backend.load(7, ['payment', 'refund']) == {'payment': SESSION}
+        assert 0 < await backend._redis.ttl('test:payment:7') <= 60
+        await backend.save(7, {'payment': None}, {})
+        assert await backend.load(7, ['payment']) == {}
+        await backend.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import pytest
+
+from services.time_parser import parse_payment_time
+
+NOW = datetime(2026, 10, 17, 12, 0)
+
+
+def parse(text):
+    return parse_payment_time(text, now=NOW)
+
+
+@pytest.mark.parametrize('text, minutes, description', [
+    ('оплатил в 11:30', '30', 'сегодня в 11:30'),
+    ('в 13:00', '1380', '16.10.2026 в 13:00'),
+    ('20 минут назад', '20', '20 минут'),
+    ('2 часа назад', '120', '2 часа'),
+    ('5 часов назад', '300', '5 часов'),
+    ('3 дня назад', '4320', '3 дня'),
+    ('сегодня', '0', '17.10.2026'),
+    ('вчера', '1440', '16.10.2026'),
+    ('позавчера', '2880', '15.10.2026'),
+    ('неделю назад', '10080', '10.10.2026'),
+    ('на прошлой неделе', '10080', '10.10.2026'),
+    ('платил прошлой неделе', '10080', '10.10.2026'),
+    ('25.12.2025', '426240', '25.12.2025'),
+])
+def test_expressions(text, minutes, description):
+    assert parse(text) == {'minutes': minutes, 'description': description}
+
+
+@pytest.mark.parametrize('text, days_back', [
+    ('седня', 0), ('севоня', 0),
+    ('вчеоа', 1), ('фчера', 1),
+    ('позафчера', 2), ('позачвера', 2), ('позачвеа', 2),
+])
+def test_typos(text, days_back):
+    assert parse(text)['minutes'] == str(days_back * 24 * 60)
+
+
+def test_day_before_yesterday_is_not_yesterday():
+    assert parse('позавчера')['description'] == '15.10.2026'
+
+
+@pytest.mark.parametrize('text', [
+    'вера оплатила билет',
+    'оплатил вечером',
+    'здравствуйте, хочу вернуть билет',
+])
+def test_ordinary_words_are_not_corrected_into_days(text):
+    assert parse(text) is None
+
+
+def test_priority_clock_before_duration_and_day():
+    assert parse('вчера в 10:00, 20 минут назад') == {'minutes': '1560', 'description': '16.10.2026 в 10:00'}
+    assert parse('2 часа назад, 20 минут назад') == {'minutes': '20', 'description': '20 минут'}
+    assert parse('3 дня назад, вчера') == {'minutes': '4320', 'description': '3 дня'}
+    assert parse('вчера, 25.12.2025') == {'minutes': '1440', 'description': '16.10.2026'}
+
+
+def test_clock_with_relative_day_is_dated_back():
+    assert parse('вчера в 14:30') == {'minutes': '1290', 'description': '16.10.2026 в 14:30'}
+    assert parse('позавчера в 09:00') == {'minutes': '3060', 'description': '15.10.2026 в 09:00'}
+
+
+def test_invalid_clock_is_skipped():
+    assert parse('в 25:99') is None
+    assert parse('вчера в 25:99') == {'minutes': '1440', 'description': '16.10.2026'}
+
+
+def test_invalid_or_future_date_is_skipped():
+    assert parse('31.02.2025') is None
+    assert parse('01.01.2027') is None
@@ -0,0 +1,146 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+from middlewares import UserOrderMiddleware
+
+USERS = 40
+UPDATES_PER_USER = 25
+MAX_CONCURRENCY = 8
+
+
+class Recorder:
+    """Обработчик: запоминает порядок обновлений и проверяет, что у пользователя одно в работе"""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.processed = {}
+        self.active = set()
+        self.running = 0
+        self.max_running = 0
+        self.overlaps = 0
+
+    async def __call__(self, event, data):
+        user_id, number = event
+        if user_id in self.active:
+            self.overlaps += 1
+        self.active.add(user_id)
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            for _ in range(self.rng.randint(0, 3)):
+                await asyncio.sleep(0)
+            if self.rng.random() < 0.1:
+                await asyncio.sleep(0.001)
+        finally:
+            self.running -= 1
+            self.active.discard(user_id)
+        self.processed.setdefault(user_id, []).append(number)
+        return number
+
+
+def interleaved_updates(rng: random.Random):
+    """Обновления всех пользователей вперемешку, у каждого пользователя - по возрастанию номера"""
+    remaining = {user_id: list(range(UPDATES_PER_USER)) for user_id in range(1, USERS + 1)}
+    updates = []
+    while remaining:
+        user_id = rng.choice(list(remaining))
+        updates.append((user_id, remaining[user_id].pop(0)))
+        if not remaining[user_id]:
+            del remaining[user_id]
+    return updates
+
+
+def dispatch(middleware: UserOrderMiddleware, handler, update):
+    # Как aiogram: каждое обновление - отдельная задача
+    data = {'event_from_user': SimpleNamespace(id=update[0])}
+    return asyncio.create_task(middleware(handler, update, data))
+
+
+def assert_idle(middleware: UserOrderMiddleware):
+    assert middleware._mailboxes == {}
+    assert middleware.in_flight == 0
+    assert middleware.waiting == 0
+
+
+def test_interleaved_updates_complete_in_user_order():
+    async def scenario():
+        rng = random.Random(7)
+        handler = Recorder(rng)
+        middleware = UserOrderMiddleware(MAX_CONCURRENCY)
+        updates = interleaved_updates(rng)
+
+        tasks = [dispatch(middleware, handler, update) for update in updates]
+        results = await asyncio.wait_for(asyncio.gather(*tasks), 10)
+
+        assert results == [number for _, number in updates]
+        assert handler.processed == {user_id: list(range(UPDATES_PER_USER)) for user_id in range(1, USERS + 1)}
+        assert handler.overlaps == 0
+        assert 1 < handler.max_running <= MAX_CONCURRENCY
+        assert middleware.processed_count == len(updates)
+        assert middleware.queued_count > 0
+        assert_idle(middleware)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_updates_do_not_stall_the_queue():
+    async def scenario():
+        rng = random.Random(11)
+        handler = Recorder(rng)
+        middleware = UserOrderMiddleware(MAX_CONCURRENCY)
+        updates = interleaved_updates(rng)
+
+        tasks = [dispatch(middleware, handler, update) for update in updates]
+        # Отмена и ожидающих своей очереди, и уже выполняющихся обновлений
+        cancelled = set()
+        for _ in range(20):
+            await asyncio.sleep(0)
+            for index in rng.sample(range(len(tasks)), 15):
+                if not tasks[index].done():
+                    tasks[index].cancel()
+                    cancelled.add(index)
+
+        results = await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), 10)
+
+        lost = [index for index, result in enumerate(results)
+                if isinstance(result, asyncio.CancelledError) and index not in cancelled]
+        assert lost == []
+        completed = {}
+        for (user_id, number), result in zip(updates, results):
+            if not isinstance(result, BaseException):
+                completed.setdefault(user_id, []).append(number)
+        assert any(isinstance(result, asyncio.CancelledError) for result in results)
+        # Необработанными остались только отмененные, остальные - в исходном порядке пользователя
+        assert handler.processed == completed
+        assert handler.overlaps == 0
+        assert_idle(middleware)
+
+    asyncio.run(scenario())
+
+
+def test_cancel_after_turn_is_granted_passes_it_on():
+    async def scenario():
+        handler = Recorder(random.Random(0))
+        middleware = UserOrderMiddleware(MAX_CONCURRENCY)
+        data = {'event_from_user': SimpleNamespace(id=1)}
+
+        async def first_then_cancel_second():
+            result = await middleware(handler, (1, 0), data)
+            # Очередь уже передана второму обновлению, но оно еще не проснулось
+            second.cancel()
+            return result
+
+        first = asyncio.create_task(first_then_cancel_second())
+        second = dispatch(middleware, handler, (1, 1))
+        third = dispatch(middleware, handler, (1, 2))
+
+        results = await asyncio.wait_for(asyncio.gather(first, second, third, return_exceptions=True), 5)
+
+        assert results[0] == 0
+        assert isinstance(results[1], asyncio.CancelledError)
+        assert results[2] == 2
+        assert handler.processed == {1: [0, 2]}
+        assert_idle(middleware)
+
+    asyncio.run(scenario())